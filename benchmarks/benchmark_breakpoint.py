@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the search for the heating base temperature of a sensor: a
+LinearRegression2 per candidate breakpoint in a Python loop versus
+LinearRegressionBreakpoint, on a year of synthetic daily data for a
+number of sensors.
+
+Run with: python benchmarks/benchmark_breakpoint.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library.regression import LinearRegression2, LinearRegressionBreakpoint
+
+BREAKPOINTS = np.arange(0, 15, 0.25)
+
+
+def make_sensors(n_sensors=50, days=365):
+    """Daily heating degree days and gas consumption with a baseload"""
+    np.random.seed(0)
+    index = pd.date_range('20160101', periods=days, freq='D')
+    x = pd.Series(np.maximum(18 - 10 * np.random.rand(days) - 10 * np.cos(np.arange(days) * 2 * np.pi / 365), 0),
+                  index=index)
+    sensors = []
+    for i in range(n_sensors):
+        base = np.random.rand() * 8
+        y = 5 + np.random.rand() * 3 * np.maximum(x - base, 0) + np.random.randn(days)
+        sensors.append(y)
+    return x, sensors
+
+
+def search_loop(x, y):
+    """The breakpoint with the smallest sum of squared errors, one LinearRegression2 per candidate"""
+    best = (np.inf, None)
+    for breakpoint in BREAKPOINTS:
+        try:
+            lr = LinearRegression2(x, y, breakpoint=breakpoint)
+        except ValueError:
+            continue
+        below = lr.df.independent <= breakpoint
+        if not below.any() or (~below).sum() < 3:
+            continue
+        above = lr.df[~below]
+        sse = (np.sum((lr.df.dependent[below] - lr.base_load) ** 2) +
+               np.sum((above.dependent - lr.slope * above.independent - lr.intercept) ** 2))
+        if sse < best[0]:
+            best = (sse, breakpoint)
+    return best[1]
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter('ignore')
+
+    x, sensors = make_sensors()
+    expected = [search_loop(x, y) for y in sensors]
+    result = [LinearRegressionBreakpoint(x, y, breakpoints=BREAKPOINTS).breakpoint for y in sensors]
+    assert expected == result
+
+    print("{} sensors, {} candidate breakpoints".format(len(sensors), len(BREAKPOINTS)))
+    t_loop = min(timeit.repeat(lambda: [search_loop(x, y) for y in sensors], number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: [LinearRegressionBreakpoint(x, y, breakpoints=BREAKPOINTS) for y in sensors],
+                              number=1, repeat=3))
+    print("{:30} {:8.3f} s".format('LinearRegression2 loop', t_loop))
+    print("{:30} {:8.3f} s".format('LinearRegressionBreakpoint', t_new))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the daily aggregation in analysis.DailyAgg: the original
+implementation (filter on index.time, then resample per day) versus
+analysis.daily_agg, on a year of minute data for 100 sensors.
+
+Run with: python benchmarks/benchmark_daily_agg.py
+"""
+
+import datetime as dt
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library import analysis
+
+WINDOWS = [(dt.time(0), dt.time(5)), (dt.time(8), dt.time(18)), (dt.time.min, dt.time.max)]
+AGGS = ['min', 'max', 'mean', 0.1, 0.9]
+
+
+def daily_agg_original(df, agg, starttime=dt.time.min, endtime=dt.time.max):
+    """The original implementation of DailyAgg.do_analysis"""
+    df = df[(df.index.time >= starttime) & (df.index.time < endtime)]
+    if isinstance(agg, float):
+        return df.resample('D').quantile(agg)
+    return df.resample('D').agg(agg)
+
+
+def year_of_minute_data(n_sensors=100):
+    np.random.seed(0)
+    index = pd.date_range(start='20160101', end='20170101', freq='min', closed='left', tz='Europe/Brussels')
+    data = np.random.rand(len(index), n_sensors).astype(np.float32)
+    return pd.DataFrame(index=index, data=data, columns=['sensor{}'.format(i) for i in range(n_sensors)])
+
+
+if __name__ == '__main__':
+    df = year_of_minute_data()
+    print("{} rows x {} sensors".format(*df.shape))
+
+    starttime, endtime = WINDOWS[0]
+    expected = daily_agg_original(df, 'min', starttime, endtime)
+    result = analysis.daily_agg(df, 'min', windows=[(starttime, endtime)])
+    np.testing.assert_allclose(result.values, expected.values, rtol=1e-6)
+
+    t_original = min(timeit.repeat(lambda: daily_agg_original(df, 'min', starttime, endtime), number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: analysis.DailyAgg(df, 'min', starttime, endtime), number=1, repeat=3))
+    print("\nmin between 00:00 and 05:00")
+    print("{:30} {:8.3f} s".format('original', t_original))
+    print("{:30} {:8.3f} s".format('DailyAgg (daily_agg)', t_new))
+
+    def all_original():
+        return [daily_agg_original(df, agg, *window) for window in WINDOWS for agg in AGGS]
+
+    t_original = min(timeit.repeat(all_original, number=1, repeat=1))
+    t_new = min(timeit.repeat(lambda: analysis.daily_agg(df, AGGS, windows=WINDOWS), number=1, repeat=1))
+    print("\n{} windows x {} aggregations".format(len(WINDOWS), len(AGGS)))
+    print("{:30} {:8.3f} s".format('original', t_original))
+    print("{:30} {:8.3f} s".format('daily_agg', t_new))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of flattening the hourly data of forecasts to a dataframe, as in
+Weather.hours(): the original implementation (one pd.Series per hour and a
+frame per forecast) versus Weather._forecasts_to_hour_frame, on three years
+of synthetic Dark Sky forecasts.
+
+Run with: python benchmarks/benchmark_forecast_flatten.py
+"""
+
+import copy
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+from forecastio.models import Forecast
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library.forecastwrapper import Weather, SOLAR_NAMES
+
+
+def make_forecasts(start='20140101', days=3 * 365):
+    """Forecasts with 24 hourly datapoints, like the Dark Sky time machine returns them"""
+    np.random.seed(0)
+    forecasts = []
+    for day in pd.date_range(start, periods=days, freq='D', tz='Europe/Brussels'):
+        epoch = int(day.timestamp())
+        hours = []
+        for h in range(24):
+            hour = {'time': epoch + 3600 * h, 'summary': 'Clear', 'icon': 'clear-day',
+                    'precipIntensity': 0, 'precipProbability': 0}
+            for key in ['temperature', 'apparentTemperature', 'dewPoint', 'humidity', 'pressure',
+                        'windSpeed', 'windBearing', 'cloudCover', 'uvIndex', 'visibility']:
+                hour[key] = np.random.rand() * 20
+            hour['solar'] = {key: np.random.rand() * 100 for key in SOLAR_NAMES}
+            hours.append(hour)
+        json = {'timezone': 'Europe/Brussels', 'hourly': {'data': hours},
+                'daily': {'data': [{'time': epoch, 'temperatureMax': 20.}]}}
+        forecasts.append(Forecast(json, None, {}))
+    return forecasts
+
+
+def flatten_solar_original(j):
+    try:
+        solar = j.pop('solar')
+    except KeyError:
+        return j
+    solar = {SOLAR_NAMES[key]: val for key, val in solar.items()}
+    j.update(solar)
+    j.update({'SolarAzimuth': (j.get('SolarAzimuth') + 90) % 360})
+    return j
+
+
+def hours_original(forecasts):
+    """The original implementation of _forecast_to_hour_series and the concat in hours()"""
+    day_list = []
+    for forecast in forecasts:
+        hour_list = [pd.Series(flatten_solar_original(hour.d)) for hour in forecast.hourly().data]
+        frame = pd.concat(hour_list, axis=1).T
+        frame.temperature = frame.temperature.astype(float)
+        day_list.append(frame)
+    return pd.concat(day_list)
+
+
+if __name__ == '__main__':
+    forecasts = make_forecasts()
+    print("{} forecasts, {} hours".format(len(forecasts), 24 * len(forecasts)))
+
+    # the original implementation pops 'solar' from the forecasts, so it gets a copy every time
+    expected = hours_original(copy.deepcopy(forecasts))
+    result = Weather._forecasts_to_hour_frame(forecasts)
+    np.testing.assert_allclose(result[expected.columns].drop(['summary', 'icon'], axis=1).values.astype(float),
+                               expected.drop(['summary', 'icon'], axis=1).values.astype(float))
+
+    t_copy = min(timeit.repeat(lambda: copy.deepcopy(forecasts), number=1, repeat=3))
+    t_original = min(timeit.repeat(lambda: hours_original(copy.deepcopy(forecasts)), number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: Weather._forecasts_to_hour_frame(forecasts), number=1, repeat=3))
+    print("{:30} {:8.3f} s".format('original', t_original - t_copy))
+    print("{:30} {:8.3f} s".format('_forecasts_to_hour_frame', t_new))
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of loading a houseprint with load_houseprint_from_file in the
+jsonpickle, pickle and table formats, for a growing number of sensors.
+For the table format, the load is timed both with and without creating
+the sites, devices and sensors (which is postponed until first use).
+
+Run with: python benchmarks/benchmark_houseprint_load.py
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library.houseprint import houseprint, Site, Fluksometer, Fluksosensor
+
+
+def make_houseprint(n_sites, n_devices=2, n_sensors=4):
+    """Houseprint with n_sites, each with n_devices with n_sensors"""
+    hp = houseprint.Houseprint(empty_init=True)
+    types = ['electricity', 'gas', 'water', 'temperature']
+    for i in range(n_sites):
+        site = Site(key=i + 1, size=120, inhabitants=4, postcode=9000, construction_year=1975,
+                    k_level='', e_level=80, epc_cert=102.27)
+        hp.add_site(site)
+        for j in range(n_devices):
+            device = Fluksometer(key='FL{:05d}{:02d}'.format(i, j), mastertoken='0' * 32)
+            site.add_device(device)
+            for k in range(n_sensors):
+                device.add_sensor(Fluksosensor(key='{:032x}'.format(i * 1000 + j * 100 + k), token='1' * 32,
+                                               device=device, type=types[k], description='sensor'))
+    return hp
+
+
+def load(filename, pickle_format, materialize):
+    hp = houseprint.load_houseprint_from_file(filename, pickle_format=pickle_format)
+    if materialize:
+        hp.get_sensors()
+    return hp
+
+
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp()
+    try:
+        for n_sites in [100, 1000, 5000]:
+            hp = make_houseprint(n_sites)
+            print("\n{} sites, {} sensors".format(n_sites, len(hp.get_sensors())))
+            for pickle_format, materialize in [('jsonpickle', True), ('pickle', True),
+                                               ('table', False), ('table', True)]:
+                filename = os.path.join(folder, 'hp.' + pickle_format)
+                if not os.path.exists(filename):
+                    hp.save(filename, pickle_format=pickle_format)
+                number = 3
+                seconds = min(timeit.repeat(lambda: load(filename, pickle_format, materialize),
+                                            number=number, repeat=3)) / number
+                label = pickle_format + (' (objects created)' if pickle_format == 'table' and materialize else '')
+                print("{:30} {:10.1f} ms {:10.0f} kB".format(label, seconds * 1e3,
+                                                             os.path.getsize(filename) / 1024.))
+            for f in os.listdir(folder):
+                os.remove(os.path.join(folder, f))
+    finally:
+        shutil.rmtree(folder)
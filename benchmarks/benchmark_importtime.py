@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the import time of the recipes: the top-level imports of each
+recipe are run in a fresh interpreter with python -X importtime, and the
+total import time is reported together with the heaviest modules.
+
+Imports that fail (eg. charts is not installed) are skipped and listed.
+
+Run with: python benchmarks/benchmark_importtime.py
+"""
+
+import ast
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+RECIPES = os.path.join(ROOT, 'opengrid_dev', 'recipes')
+
+
+def top_level_imports(filename):
+    """Return the import statements of a module, outside functions and classes, as source code"""
+    with open(filename) as f:
+        source = f.read()
+
+    imports = []
+
+    def visit(nodes):
+        for node in nodes:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                imports.append(ast.get_source_segment(source, node))
+            elif isinstance(node, (ast.If, ast.Try, ast.With)):
+                for field in ['body', 'orelse', 'finalbody']:
+                    visit(getattr(node, field, []))
+                for handler in getattr(node, 'handlers', []):
+                    visit(handler.body)
+
+    visit(ast.parse(source).body)
+    return imports
+
+
+def importtime(imports, exclude=()):
+    """
+    Run the imports in a new interpreter with -X importtime
+
+    Parameters
+    ----------
+    imports : list of str
+    exclude : list of str
+        modules to leave out, eg. those imported at interpreter startup
+
+    Returns
+    -------
+    total : float
+        seconds
+    modules : list of (seconds, module)
+        cumulative import time of the modules imported by the statements
+    failed : list of str
+    """
+    code = ["failed = []"]
+    for statement in imports:
+        code.append("try:\n    {}\nexcept ImportError:\n    failed.append({!r})".format(statement, statement))
+    code.append("print('\\n'.join(failed))")
+
+    env = dict(os.environ, MPLBACKEND='Agg')
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', '\n'.join(code)],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT,
+                             universal_newlines=True, check=True)
+
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[len('import time:'):].split('|')
+        # only the modules imported directly, not their dependencies
+        if not name[1:].startswith(' ') and name.strip() not in exclude:
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    total = sum(seconds for seconds, name in modules)
+    failed = [line for line in process.stdout.splitlines() if line]
+    return total, sorted(modules, reverse=True), failed
+
+
+if __name__ == '__main__':
+    # modules imported at interpreter startup (site, encodings, ...)
+    startup = [name for seconds, name in importtime([])[1]]
+
+    for filename in sorted(os.listdir(RECIPES)):
+        if not filename.endswith('.py') or filename.startswith('_'):
+            continue
+        total, modules, failed = importtime(top_level_imports(os.path.join(RECIPES, filename)), startup)
+        print("\n{:50} {:8.3f} s".format(filename, total))
+        for seconds, name in modules[:5]:
+            print("    {:46} {:8.3f} s".format(name, seconds))
+        for statement in failed:
+            print("    failed: {}".format(statement))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of LinearRegression3._calculate_regression_data: the original
+implementation (iterrows over the points above the breakpoint) versus the
+vectorized one, on daily data with many points close to the base load.
+The regression data and the results of the analysis are checked to be
+identical.
+
+Run with: python benchmarks/benchmark_linreg3.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library.regression import LinearRegression3
+
+
+class LinearRegression3Original(LinearRegression3):
+
+    def _calculate_regression_data(self):
+        """The original implementation"""
+        to_drop = self.df[self.df.independent <= self.breakpoint].sort_values(by='independent').index.tolist()
+        res = super(LinearRegression3, self)._calculate_regression_data()
+
+        if self.base_load is not None:
+            for entry in res.sort_values(by='independent').iterrows():
+                if entry[1].dependent < self.base_load * (1 + self.percentage):
+                    to_drop.append(entry[0])
+                else:
+                    break
+
+            if self.include_end_of_base_load and len(to_drop) > 0:
+                to_drop.pop()
+
+        res = self.df.drop(to_drop)
+        return res
+
+
+def make_data(days=20 * 365):
+    """Daily heating degree days and gas consumption, flat up to well above the breakpoint"""
+    np.random.seed(0)
+    index = pd.date_range('19970101', periods=days, freq='D')
+    x = pd.Series(np.round(np.random.rand(days) * 20, 1), index=index)
+    y = pd.Series(50 + 10 * np.maximum(x - 10, 0) + np.random.rand(days), index=index)
+    return x, y
+
+
+if __name__ == '__main__':
+    x, y = make_data()
+    kwargs = dict(breakpoint=5, percentage=0.05)
+
+    for include_end_of_base_load in [True, False]:
+        original = LinearRegression3Original(x, y, include_end_of_base_load=include_end_of_base_load, **kwargs)
+        new = LinearRegression3(x, y, include_end_of_base_load=include_end_of_base_load, **kwargs)
+        pd.testing.assert_frame_equal(new._calculate_regression_data(), original._calculate_regression_data())
+        for attribute in ['slope', 'intercept', 'base_load', 'intersect', 'rsquared']:
+            assert getattr(new, attribute) == getattr(original, attribute), attribute
+
+    original = LinearRegression3Original(x, y, **kwargs)
+    new = LinearRegression3(x, y, **kwargs)
+    print("{} days, {} in the regression".format(len(x), len(new._calculate_regression_data())))
+
+    t_original = min(timeit.repeat(original._calculate_regression_data, number=1, repeat=3))
+    t_new = min(timeit.repeat(new._calculate_regression_data, number=1, repeat=3))
+    print("{:30} {:8.3f} s".format('iterrows', t_original))
+    print("{:30} {:8.3f} s".format('vectorized', t_new))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the forward selection in regression.MVLinReg: the original
+implementation (a statsmodels formula fit for every candidate in every round)
+versus the matrix-based _ForwardSelection, for 24 candidate variables.
+
+Run with: python benchmarks/benchmark_mvlinreg.py
+"""
+
+import os
+import sys
+import timeit
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as fm
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library import regression
+
+
+def mvlinreg_original(df, endog, p_max=0.05):
+    """The original implementation of MVLinReg._do_analysis_no_cross_validation"""
+    list_of_exog = [c for c in df.columns if c != endog]
+    fits = [fm.ols(formula='{} ~ 1'.format(endog), data=df).fit()]
+    all_exog = list_of_exog[:]
+    while all_exog:
+        best_fit = deepcopy(fits[-1])
+        for x in all_exog:
+            fit = fm.ols(formula=fits[-1].model.formula + '+{}'.format(x), data=df).fit()
+            best_fit = sorted([best_fit, fit], key=lambda f: f.bic)[0]
+        for par in best_fit.pvalues.where(best_fit.pvalues > p_max).dropna().index:
+            best_fit = fm.ols(formula=best_fit.model.formula.replace('+{}'.format(par), ''), data=df).fit()
+        if best_fit.model.formula in fits[-1].model.formula:
+            break
+        fits.append(best_fit)
+        all_exog.remove(x)
+    return fits
+
+
+def weekly_data(n=150, n_exog=24):
+    np.random.seed(0)
+    df = pd.DataFrame(np.random.rand(n, n_exog) * 10, columns=['x{}'.format(i) for i in range(n_exog)],
+                      index=pd.date_range('20150101', periods=n, freq='W'))
+    df['gas'] = 5 + df[['x0', 'x1', 'x2', 'x3', 'x4']].dot([3, 2, 1, 0.5, 0.3]) + np.random.randn(n)
+    return df
+
+
+if __name__ == '__main__':
+    df = weekly_data()
+    expected = [fit.model.formula for fit in mvlinreg_original(df, 'gas')]
+    result = [fit.model.formula for fit in regression.MVLinReg(df, 'gas').list_of_fits]
+    assert result == expected, (result, expected)
+    print("{} rows, {} candidates, selected: {}".format(len(df), len(df.columns) - 1, expected[-1]))
+
+    t_original = min(timeit.repeat(lambda: mvlinreg_original(df, 'gas'), number=1, repeat=3))
+    t_new = min(timeit.repeat(lambda: regression.MVLinReg(df, 'gas'), number=1, repeat=3))
+    print("{:30} {:8.3f} s".format('original', t_original))
+    print("{:30} {:8.3f} s".format('MVLinReg', t_new))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the resampling in Fluksosensor.get_data: the original pandas
+path (reindex to the union of both indexes + interpolate + reindex) versus
+misc.resample_interpolate, on a month of raw minute data.
+
+Run with: python benchmarks/benchmark_resample.py
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from opengrid_dev.library import misc
+
+
+def resample_pandas(ts, rule, diff=True):
+    """The original implementation in Fluksosensor.get_data"""
+    newindex = ts.resample(rule).first().index
+    ts = ts.reindex(ts.index.union(newindex))
+    ts = ts.interpolate(method='time')
+    ts = ts.reindex(newindex)
+    if diff:
+        ts = ts.diff()
+    return ts
+
+
+def resample_numpy(ts, rule, diff=True):
+    return misc.resample_interpolate(ts, rule, diff=diff)
+
+
+def month_of_raw_data():
+    """Cumulative counter with a sample every 50-70 seconds during 31 days"""
+    np.random.seed(0)
+    n = 31 * 24 * 60
+    seconds = np.cumsum(np.random.randint(50, 70, size=n))
+    index = pd.to_datetime(1483225200 + seconds, unit='s').tz_localize('UTC').tz_convert('Europe/Brussels')
+    return pd.Series(index=index, data=np.cumsum(np.random.rand(n)), name='sensor')
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == '__main__':
+    ts = month_of_raw_data()
+    print("{} raw values from {} to {}".format(len(ts), ts.index[0], ts.index[-1]))
+
+    np.testing.assert_allclose(resample_numpy(ts, 'min').values, resample_pandas(ts, 'min').values, rtol=1e-10)
+
+    for rule in ['min', 'H', 'D']:
+        for func in [resample_pandas, resample_numpy]:
+            t = min(timeit.repeat(lambda: func(ts, rule), number=5, repeat=3)) / 5
+            mem = peak_memory(func, ts, rule)
+            print("{:>4} {:16}: {:8.2f} ms, peak memory {:6.1f} MB".format(rule, func.__name__, t * 1e3, mem / 1e6))
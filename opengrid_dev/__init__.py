@@ -1,6 +1,45 @@
 from opengrid_dev.config import *
-from opengrid_dev.library import *
-from opengrid_dev.recipes import *
-from pint import UnitRegistry
-ureg = UnitRegistry()
-Q_ = ureg.Quantity
\ No newline at end of file
+
+# the subpackages do not import their modules: scripts only pay for the modules they import
+# (datasets imports pandas, import it with from opengrid_dev import datasets)
+from opengrid_dev import library, recipes
+
+
+_ureg = None
+
+
+def get_ureg():
+    """
+    Return the pint UnitRegistry of opengrid_dev
+
+    The registry is created when it is first used: creating it takes a
+    noticeable time, and most scripts never need it.
+    """
+    global _ureg
+    if _ureg is None:
+        from pint import UnitRegistry
+        _ureg = UnitRegistry()
+    return _ureg
+
+
+class _Lazy(object):
+    """
+    Stand-in for the object returned by factory, which is only called when
+    the stand-in is first used (called or an attribute is looked up)
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __call__(self, *args, **kwargs):
+        return self._factory()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+    def __repr__(self):
+        return repr(self._factory())
+
+
+ureg = _Lazy(get_ureg)
+Q_ = _Lazy(lambda: get_ureg().Quantity)
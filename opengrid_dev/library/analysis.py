@@ -7,8 +7,12 @@ and return a dataframe or list of dataframes.
 """
 
 import datetime as dt
+import numpy as np
 import pandas as pd
 from opengrid_dev.library.exceptions import EmptyDataFrameError
+from opengrid_dev.library import misc
+
+NS_PER_DAY = 86400 * 10 ** 9
 
 class Analysis(object):
     """
@@ -57,13 +61,187 @@ class DailyAgg(Analysis):
 
     def do_analysis(self, agg, starttime=dt.time.min, endtime=dt.time.max):
         if not self.df.empty:
-            df = self.df[(self.df.index.time >= starttime) & (self.df.index.time < endtime)]
-            df = df.resample('D', how=agg)
-            self.result = df
+            self.result = daily_agg(self.df, agg=agg, windows=[(starttime, endtime)])
         else:
             self.result = pd.DataFrame()
 
 
+def _quantile(agg):
+    """
+    Return the quantile (0-1) for an aggregation, or None if it is not a quantile
+    """
+    if agg == 'median':
+        return 0.5
+    if isinstance(agg, float):
+        return agg
+    return None
+
+
+def _is_reducible(agg):
+    """
+    Return True if _reduce_days implements the aggregation
+    """
+    return (isinstance(agg, str) and agg in ['min', 'max', 'mean', 'sum', 'count', 'std']) or \
+        _quantile(agg) is not None
+
+
+def _reduce_days(values, starts, agg):
+    """
+    Aggregate the rows of values per day
+
+    Parameters
+    ----------
+    values : 2-D numpy array
+        The rows of a day are contiguous
+    starts : 1-D numpy array
+        Index of the first row of each day
+    agg : str or float
+        'min', 'max', 'mean', 'sum', 'count', 'std', 'median' or a quantile
+
+    Returns
+    -------
+    2-D numpy array with a row per day
+    """
+    valid = ~np.isnan(values)
+    if agg == 'min':
+        return np.fmin.reduceat(values, starts, axis=0)
+    if agg == 'max':
+        return np.fmax.reduceat(values, starts, axis=0)
+
+    count = np.add.reduceat(valid, starts, axis=0)
+    if agg == 'count':
+        return count.astype(float)
+    total = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0)
+    if agg == 'sum':
+        return total
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        if agg == 'mean':
+            return mean
+        if agg == 'std':
+            sizes = np.diff(np.append(starts, len(values)))
+            deviation = np.where(valid, values - np.repeat(mean, sizes, axis=0), 0.)
+            variance = np.add.reduceat(deviation ** 2, starts, axis=0) / (count - 1)
+            return np.where(count > 1, np.sqrt(variance), np.nan)
+
+    q = _quantile(agg)
+    if q is None:
+        raise NotImplementedError("Aggregation '{}' is not supported".format(agg))
+    # put the values in a (days, rows of the day, columns) array padded with NaN,
+    # and sort each day: the valid values of a day come first
+    sizes = np.diff(np.append(starts, len(values)))
+    day = np.repeat(np.arange(len(starts)), sizes)
+    padded = np.full((len(starts), sizes.max(), values.shape[1]), np.nan)
+    padded[day, np.arange(len(values)) - starts[day]] = values
+    padded.sort(axis=1)
+
+    # linear interpolation between the closest ranks, like numpy.quantile
+    position = (count - 1) * q
+    lower = np.floor(position).astype(int).clip(min=0)
+    upper = np.ceil(position).astype(int).clip(min=0)
+    fraction = position - lower
+    low = np.take_along_axis(padded, lower[:, None, :], axis=1)[:, 0, :]
+    high = np.take_along_axis(padded, upper[:, None, :], axis=1)[:, 0, :]
+    return np.where(count > 0, low + (high - low) * fraction, np.nan)
+
+
+def daily_agg(df, agg='min', windows=None):
+    """
+    Aggregate the data of each day, optionally only within time-of-day windows.
+
+    All windows and aggregations are computed from a single pass over the
+    index: the time of day and the day of each row are derived from the int64
+    nanoseconds of the index, so no Python time objects are created.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        With pandas.DatetimeIndex and one or more columns.  For a tz-aware
+        index, days and times of day are in the local time of that timezone.
+    agg : str, float, function or list
+        'min', 'max', 'mean', 'sum', 'count', 'std', 'median' or a float
+        between 0 and 1 for a quantile, or a list of these.  Other
+        aggregations (eg. 'first' or a function) are computed with
+        pandas resample.
+    windows : list of tuples (starttime, endtime) or dict, optional
+        For each day, only consider the time between starttime (inclusive)
+        and endtime (exclusive), given as datetime.time objects.
+        A dict maps a label to each window.
+        If None, use the entire day.
+
+    Returns
+    -------
+    pandas.DataFrame with a row per day.
+    As with resample, 'sum' and 'count' are 0 for the days without data
+    between the first and last day of a window.
+    For a single window and aggregation, the columns are those of df.
+    Otherwise, the columns are a MultiIndex (window, agg, column) where
+    window is the label of the window, eg. '00:00-05:00'.
+    """
+    single = not isinstance(agg, (list, tuple)) and (windows is None or len(windows) == 1)
+    aggs = list(agg) if isinstance(agg, (list, tuple)) else [agg]
+    if windows is None:
+        windows = [(dt.time.min, dt.time.max)]
+    if not isinstance(windows, dict):
+        windows = {'{:%H:%M}-{:%H:%M}'.format(*window): window for window in windows}
+
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    index = df.index
+    if index.tz is not None:
+        # local wall time
+        index = index.tz_localize(None)
+    ns = index.asi8
+    day = ns // NS_PER_DAY
+    time_of_day = ns - day * NS_PER_DAY
+    values = df.values.astype(float)
+
+    results = {}
+    first, last = None, None
+    for label, (starttime, endtime) in windows.items():
+        mask = ((time_of_day >= misc.time_to_timedelta(starttime).value) &
+                (time_of_day < misc.time_to_timedelta(endtime).value))
+        days = day[mask]
+        if len(days) == 0:
+            continue
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        window_values = values[mask]
+        first = days[0] if first is None else min(first, days[0])
+        last = days[-1] if last is None else max(last, days[-1])
+        for a in aggs:
+            if _is_reducible(a):
+                results[(label, a)] = (days[starts], _reduce_days(window_values, starts, a), days[-1])
+            else:
+                results[(label, a)] = df[mask].resample('D').agg(a)
+
+    if first is None:
+        return pd.DataFrame()
+
+    # all days between the first and last day with data in any window
+    result_index = pd.date_range(start=pd.Timestamp(first * NS_PER_DAY), periods=last - first + 1, freq='D',
+                                 tz=df.index.tz)
+
+    blocks = []
+    for label in windows:
+        for a in aggs:
+            block = np.full((last - first + 1, len(df.columns)), np.nan)
+            result = results.get((label, a))
+            if isinstance(result, pd.DataFrame):
+                block = result.reindex(result_index).values
+            elif result is not None:
+                days, reduced, last_day = result
+                if a in ['sum', 'count']:
+                    block[days[0] - first:last_day - first + 1] = 0.
+                block[days - first] = reduced
+            blocks.append(block)
+    if single:
+        columns = df.columns
+    else:
+        columns = pd.MultiIndex.from_tuples([(label, a, column) for label in windows for a in aggs
+                                             for column in df.columns], names=['window', 'agg', None])
+    return pd.DataFrame(index=result_index, data=np.hstack(blocks), columns=columns)
+
+
 def standby(df, resolution='d'):
     """
     Parameters
@@ -1,4 +1,3 @@
-import bs4
 import requests
 import iso8601
 import datetime as dt
@@ -100,6 +99,8 @@ def parse_html(html):
     index = []
     data = []
 
+    import bs4
+
     # run the page through beautiful soup
     soup = bs4.BeautifulSoup(html, 'html.parser')
 
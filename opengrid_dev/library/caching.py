@@ -10,6 +10,7 @@ Created on Thu Jan  7 09:34:04 2016
 @author: roel
 """
 import os
+import json
 import numpy as np
 import pandas as pd
 import dateutil
@@ -20,14 +21,567 @@ from opengrid_dev.library import analysis
 from tqdm import tqdm
 import pickle
 
+class Storage(object):
+    """
+    Base class for the storage engines of the Cache.
+
+    A storage engine stores dataframes with a daily index in pickle files.
+    In incremental mode, an update does not rewrite the stored file but
+    appends the new data to a log file next to it (path + '.log').  The log
+    is merged into the file when it grows larger than the file itself, or
+    when compact() is called.  This way, an update costs time proportional
+    to the new data instead of to the full history.
+    """
+
+    # minimal size of the log (in bytes) before it is compacted
+    COMPACT_SIZE = 2 ** 16
+
+    def __init__(self, folder, variable, incremental=False):
+        self.folder = folder
+        self.variable = variable
+        self.incremental = incremental
+
+    def _read_file(self, path):
+        """
+        Return the dataframe stored in path, including the updates in its log
+        """
+        df = pd.DataFrame()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                df = pickle.load(f)
+            if isinstance(df, pd.Series):
+                df = pd.DataFrame(df)
+
+        log_path = path + '.log'
+        if os.path.exists(log_path):
+            with open(log_path, "rb") as f:
+                while True:
+                    try:
+                        df_new = pickle.load(f)
+                    except EOFError:
+                        break
+                    if df.empty:
+                        df = df_new
+                    else:
+                        df = df_new.combine_first(df)
+        return df
+
+    def _write_file(self, path, df):
+        """
+        Overwrite path with df and remove its log, if any
+        """
+        # write to a temporary file first, so readers never see a half-written file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, "wb") as f:
+            pickle.dump(df, f)
+        misc.replace_file(tmp_path, path)
+        if os.path.exists(path + '.log'):
+            os.remove(path + '.log')
+
+    def _update_file(self, path, df):
+        """
+        Update the dataframe stored in path with df.  New values overwrite
+        overlapping days.
+        """
+        if self.incremental:
+            log_path = path + '.log'
+            with open(log_path, "ab") as f:
+                pickle.dump(df, f)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if os.path.getsize(log_path) > max(size, self.COMPACT_SIZE):
+                self._compact_file(path)
+        else:
+            df_old = self._read_file(path)
+            if not df_old.empty:
+                df = df.combine_first(df_old)
+            self._write_file(path, df)
+
+    def _compact_file(self, path):
+        """
+        Merge the log of path into path
+        """
+        if os.path.exists(path + '.log'):
+            self._write_file(path, self._read_file(path))
+
+    def compact(self):
+        """
+        Merge all logs into the stored files
+        """
+        for f in os.listdir(self.folder):
+            if f.endswith('.pkl.log'):
+                self._compact_file(os.path.join(self.folder, f[:-len('.log')]))
+        return True
+
+
+class PickleStorage(Storage):
+    """
+    Storage engine with one pickled dataframe per sensor.
+
+    The file format for the data is folder/variable_sensor.pkl.  This is the
+    original format of the cache: simple, but every get() opens one file per
+    sensor and (if not incremental) every update() rewrites the full history
+    of a sensor.
+    """
+
+    def _path(self, sensorkey):
+        filename = self.variable + '_' + sensorkey + '.pkl'
+        return os.path.join(self.folder, filename)
+
+    def load(self, sensorkey):
+        """
+        Return a dataframe with cached data for this sensor or an empty dataframe.
+        """
+        return self._read_file(self._path(sensorkey))
+
+    def read(self, sensorkeys, start=None, end=None):
+        """
+        Return a list with a single-column dataframe for each sensor with cached data.
+
+        start and end are ignored: the full history has to be unpickled anyway.
+        """
+        dfs = []
+        for sensorkey in sensorkeys:
+            df = self.load(sensorkey)
+            if not df.empty:
+                dfs.append(df)
+        return dfs
+
+    def write(self, df):
+        """
+        Overwrite the cached data for each column (=sensor) of df.
+        """
+        for sensor in df.columns:
+            self._write_file(self._path(sensor), df[[sensor]].dropna())
+        return True
+
+    def update(self, df):
+        """
+        Update the cached data for each column (=sensor) of df.
+        New values overwrite overlapping days.
+        """
+        for sensor in df.columns:
+            df_sensor = df[[sensor]].dropna()
+            if not df_sensor.empty:
+                self._update_file(self._path(sensor), df_sensor)
+        return True
+
+    def compact(self):
+        """
+        Merge all logs of this variable into the stored files
+        """
+        prefix = self.variable + '_'
+        for f in os.listdir(self.folder):
+            if f.startswith(prefix) and f.endswith('.pkl.log'):
+                self._compact_file(os.path.join(self.folder, f[:-len('.log')]))
+        return True
+
+
+class PartitionedStorage(Storage):
+    """
+    Storage engine with a single wide dataframe per variable and per month.
+
+    The file format for the data is folder/variable/YYYY-MM.pkl, each file
+    containing a dataframe with a daily index in Europe/Brussels time and one
+    column per sensor.  get() only opens the partitions that overlap with the
+    requested period, and update() only rewrites the touched months.
+    """
+
+    def __init__(self, folder, variable, incremental=False):
+        super(PartitionedStorage, self).__init__(os.path.join(folder, variable), variable,
+                                                 incremental=incremental)
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+
+    def _path(self, partition):
+        return os.path.join(self.folder, partition + '.pkl')
+
+    def partitions(self, start=None, end=None):
+        """
+        Return a sorted list with the names (YYYY-MM) of the stored partitions,
+        optionally limited to those overlapping with start and end.
+        """
+        partitions = set()
+        for f in os.listdir(self.folder):
+            if f.endswith('.pkl') or f.endswith('.pkl.log'):
+                partitions.add(f.split('.')[0])
+        partitions = sorted(partitions)
+        if start is not None:
+            first = _partition_name(misc.parse_date(start))
+            partitions = [p for p in partitions if p >= first]
+        if end is not None:
+            last = _partition_name(misc.parse_date(end))
+            partitions = [p for p in partitions if p <= last]
+        return partitions
+
+    def _write_partition(self, partition, df):
+        df = df.dropna(how='all').dropna(axis=1, how='all')
+        path = self._path(partition)
+        if df.empty:
+            for p in [path, path + '.log']:
+                if os.path.exists(p):
+                    os.remove(p)
+            return
+        self._write_file(path, df.sort_index())
+
+    def load(self, sensorkey):
+        """
+        Return a dataframe with cached data for this sensor or an empty dataframe.
+        """
+        dfs = self.read([sensorkey])
+        if dfs:
+            return dfs[0]
+        return pd.DataFrame()
+
+    def read(self, sensorkeys, start=None, end=None):
+        """
+        Return a list with one dataframe containing the columns of the
+        requested sensors, read from the partitions between start and end.
+        If sensorkeys is None, all columns are returned.
+        """
+        dfs = []
+        for partition in self.partitions(start=start, end=end):
+            df = self._read_file(self._path(partition))
+            if sensorkeys is None:
+                columns = list(df.columns)
+            else:
+                columns = [key for key in sensorkeys if key in df.columns]
+            if columns:
+                dfs.append(df[columns])
+        if not dfs:
+            return []
+        df = pd.concat(dfs).sort_index().dropna(how='all')
+        if sensorkeys is not None:
+            # restore the order of the requested sensors
+            df = df[[key for key in sensorkeys if key in df.columns]]
+        return [df]
+
+    def write(self, df):
+        """
+        Overwrite the cached data for each column (=sensor) of df.
+        """
+        for partition in self.partitions():
+            df_old = self._read_file(self._path(partition))
+            columns = [c for c in df.columns if c in df_old.columns]
+            if columns:
+                self._write_partition(partition, df_old.drop(columns, axis=1))
+        return self.update(df)
+
+    def update(self, df):
+        """
+        Update the cached data for each column (=sensor) of df.
+        New values overwrite overlapping days, only touched partitions are rewritten.
+        """
+        df = df.dropna(how='all')
+        df.index = _to_local(df.index)
+        for partition, df_new in df.groupby(df.index.strftime('%Y-%m')):
+            self._update_file(self._path(partition), df_new)
+        return True
+
+
+class Cube(object):
+    """
+    Read-only view on the data of a CubeStorage, without copying it.
+
+    Attributes
+    ----------
+    data : numpy.memmap
+        2-D array with a row for each day and a column for each sensor
+    days : pandas.DatetimeIndex
+        The days of the rows, in Europe/Brussels time
+    index : pandas.DatetimeIndex
+        The stored timestamps of the rows, in Europe/Brussels time: midnight
+        of the day, unless the data had another time of day
+    sensors : list of str
+        The sensor keys of the columns
+    """
+
+    def __init__(self, data, start, sensors, seconds=None):
+        self.data = data
+        self.sensors = sensors
+        self.days = pd.date_range(start=start, periods=data.shape[0], freq='D', tz='Europe/Brussels')
+        if seconds is None:
+            self.index = self.days
+        else:
+            self.index = self.days + pd.to_timedelta(np.nan_to_num(seconds), unit='s')
+        self._columns = {key: i for i, key in enumerate(sensors)}
+
+    def __repr__(self):
+        return "Cube with {} days x {} sensors".format(*self.data.shape)
+
+    def column(self, sensorkey):
+        """
+        Return the column number of a sensor, or None if it is not in the cube
+        """
+        return self._columns.get(sensorkey)
+
+    def rows(self, start=None, end=None):
+        """
+        Return a slice with the rows with a timestamp between start and end (inclusive)
+        """
+        first = 0 if start is None else self.index.searchsorted(_to_local_timestamp(start), side='left')
+        last = len(self.index) if end is None else self.index.searchsorted(_to_local_timestamp(end), side='right')
+        return slice(first, last)
+
+    def to_frame(self, sensorkeys=None, start=None, end=None):
+        """
+        Return a dataframe with the data of the sensors between start and end.
+        Sensors that are not in the cube are skipped, days without data are dropped.
+        """
+        if sensorkeys is None:
+            sensorkeys = self.sensors
+        sensorkeys = [key for key in sensorkeys if key in self._columns]
+        rows = self.rows(start, end)
+        data = self.data[rows][:, [self._columns[key] for key in sensorkeys]]
+        df = pd.DataFrame(index=self.index[rows], data=data, columns=sensorkeys)
+        return df.dropna(how='all')
+
+
+class CubeStorage(Storage):
+    """
+    Storage engine with a memory-mapped days x sensors array per variable.
+
+    The data is stored in folder/variable/cube.npy, a 2-D numpy array with a
+    row for each day (in Europe/Brussels time) and a column for each sensor,
+    and folder/variable/cube.json with the first day and the sensor keys.
+    Missing values are NaN.  folder/variable/cube_seconds.npy holds the time
+    of day of each row (seconds since local midnight), so the timestamps of
+    the data are returned unchanged, like with the other engines.  The array is allocated with room for more days
+    and sensors, so most updates are written in place.
+
+    open_cube() returns the data as a memory map: it can be sliced without
+    reading the full file or unpickling anything.
+    """
+
+    # dtype of a new cube, eg. 'float32' to halve the size
+    DTYPE = 'float64'
+    # the array grows by multiples of these numbers of days and sensors
+    GROW_DAYS = 366
+    GROW_SENSORS = 64
+
+    def __init__(self, folder, variable, incremental=False):
+        super(CubeStorage, self).__init__(os.path.join(folder, variable), variable,
+                                          incremental=incremental)
+        if not os.path.exists(self.folder):
+            os.mkdir(self.folder)
+        self._data_path = os.path.join(self.folder, 'cube.npy')
+        self._meta_path = os.path.join(self.folder, 'cube.json')
+        self._seconds_path = os.path.join(self.folder, 'cube_seconds.npy')
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, 'r') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        misc.replace_file(tmp_path, self._meta_path)
+
+    def _allocate(self, meta, start, days, sensors):
+        """
+        Return the data array and the time of day array opened for writing,
+        with room for the given number of days since start (days since epoch)
+        and sensors.  If needed, the arrays are reallocated and the stored
+        data is copied.
+        """
+        if meta is not None:
+            data = np.load(self._data_path, mmap_mode='r+')
+            seconds = np.load(self._seconds_path, mmap_mode='r+') if os.path.exists(self._seconds_path) else None
+            old_start = _epoch_day(meta['start'])
+            if old_start == start and data.shape[0] >= days and data.shape[1] >= sensors \
+                    and seconds is not None and seconds.shape == data.shape[:1]:
+                return data, seconds
+            dtype = data.dtype
+            del data, seconds
+            stored = (old_start - start, meta['days'], len(meta['sensors']))
+        else:
+            dtype, stored = np.dtype(self.DTYPE), None
+
+        shape = (-(-days // self.GROW_DAYS) * self.GROW_DAYS,
+                 -(-sensors // self.GROW_SENSORS) * self.GROW_SENSORS)
+        return (self._reallocate(self._data_path, shape, dtype, stored),
+                self._reallocate(self._seconds_path, shape[:1], np.dtype('float64'), stored))
+
+    @staticmethod
+    def _reallocate(path, shape, dtype, stored=None):
+        """
+        Replace the array in path by a new one with the given shape, filled
+        with NaN.  stored is None or (offset, days, sensors): the stored days
+        and sensors are copied, starting at row offset.
+        Return the new array opened for writing.
+        """
+        tmp_path = path + '.tmp'
+        new = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+        new[:] = np.nan
+        if stored is not None and os.path.exists(path):
+            offset, days, sensors = stored
+            old = np.load(path, mmap_mode='r')
+            if old.ndim == 1:
+                new[offset:offset + days] = old[:days]
+            else:
+                new[offset:offset + days, :sensors] = old[:days, :sensors]
+            del old
+        new.flush()
+        del new
+        misc.replace_file(tmp_path, path)
+        return np.load(path, mmap_mode='r+')
+
+    def open_cube(self):
+        """
+        Return a read-only Cube with the stored data, or None if nothing is stored
+        """
+        meta = self._read_meta()
+        if meta is None:
+            return None
+        data = np.load(self._data_path, mmap_mode='r')
+        seconds = None
+        if os.path.exists(self._seconds_path):
+            seconds = np.load(self._seconds_path, mmap_mode='r')
+        if seconds is None or len(seconds) < meta['days']:
+            # written before the time of day was stored
+            seconds = None
+        else:
+            seconds = seconds[:meta['days']]
+        return Cube(data[:meta['days'], :len(meta['sensors'])], start=meta['start'], sensors=meta['sensors'],
+                    seconds=seconds)
+
+    def load(self, sensorkey):
+        """
+        Return a dataframe with cached data for this sensor or an empty dataframe.
+        """
+        dfs = self.read([sensorkey])
+        if dfs:
+            return dfs[0]
+        return pd.DataFrame()
+
+    def read(self, sensorkeys, start=None, end=None):
+        """
+        Return a list with one dataframe containing the columns of the
+        requested sensors between start and end.
+        """
+        cube = self.open_cube()
+        if cube is None:
+            return []
+        df = cube.to_frame(sensorkeys, start=start, end=end)
+        if df.empty:
+            return []
+        return [df]
+
+    def write(self, df):
+        """
+        Overwrite the cached data for each column (=sensor) of df.
+        """
+        meta = self._read_meta()
+        if meta is not None:
+            columns = [meta['sensors'].index(c) for c in df.columns if c in meta['sensors']]
+            if columns:
+                data = np.load(self._data_path, mmap_mode='r+')
+                data[:, columns] = np.nan
+                data.flush()
+                del data
+        return self.update(df)
+
+    def update(self, df):
+        """
+        Update the cached data for each column (=sensor) of df.
+        New values overwrite overlapping days, the array is updated in place.
+        """
+        df = df.dropna(how='all')
+        if df.empty:
+            return True
+        # the local calendar day of each row, as days since epoch, and the time of day
+        local = _to_local(df.index)
+        days = local.tz_localize(None).values.astype('datetime64[D]').astype(np.int64)
+        time_of_day = (local - local.normalize()).total_seconds().values
+
+        meta = self._read_meta()
+        if meta is None:
+            start, end, sensors = days.min(), days.max() + 1, []
+        else:
+            old_start = _epoch_day(meta['start'])
+            start = min(old_start, days.min())
+            end = max(old_start + meta['days'], days.max() + 1)
+            sensors = list(meta['sensors'])
+        sensors += [c for c in df.columns if c not in sensors]
+
+        data, seconds = self._allocate(meta, start, end - start, len(sensors))
+        rows = days - start
+        values = df.values
+        for j, sensor in enumerate(df.columns):
+            valid = ~np.isnan(values[:, j])
+            data[rows[valid], sensors.index(sensor)] = values[valid, j]
+        seconds[rows] = time_of_day
+        data.flush()
+        seconds.flush()
+        del data, seconds
+
+        self._write_meta({'start': str(np.datetime64(int(start), 'D')),
+                          'days': int(end - start),
+                          'sensors': sensors})
+        return True
+
+    def compact(self):
+        """
+        Nothing to do: updates are always written in place
+        """
+        return True
+
+
+STORAGE_ENGINES = {
+    'pickle': PickleStorage,
+    'partitioned': PartitionedStorage,
+    'cube': CubeStorage
+}
+
+
+def _to_local(index):
+    """
+    Return the index converted to (or localized in) Europe/Brussels.
+    """
+    try:
+        return index.tz_convert('Europe/Brussels')
+    except TypeError:
+        return index.tz_localize('Europe/Brussels')
+
+
+def _to_local_timestamp(t):
+    """
+    Return t as a pandas.Timestamp in Europe/Brussels.  Naive timestamps are
+    considered local.
+    """
+    t = misc.parse_date(t)
+    if t.tz is None:
+        return t.tz_localize('Europe/Brussels')
+    return t.tz_convert('Europe/Brussels')
+
+
+def _epoch_day(day):
+    """
+    Return the number of days since epoch of a date string YYYY-MM-DD
+    """
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+def _partition_name(ts):
+    """
+    Return the name of the monthly partition (YYYY-MM) containing timestamp ts.
+    """
+    if ts.tz is not None:
+        ts = ts.tz_convert('Europe/Brussels')
+    return ts.strftime('%Y-%m')
+
+
 class Cache(object):
     """
     A class to handle daily aggregated data or intermediate results
-    
-    The file format for the data is result_sensor.csv
+
+    The storage format is determined by a storage engine, see STORAGE_ENGINES.
+    By default, the file format for the data is variable_sensor.pkl
     """
     
-    def __init__(self, variable, folder=None):
+    def __init__(self, variable, folder=None, storage=None, incremental=False):
         """
         Create a cache object specifically for the specified variable
         
@@ -39,6 +593,15 @@ class Cache(object):
         folder : path
             Path where the files are stored
             If None, use the path specified in the opengrid configuration
+        storage : str or storage class, optional
+            'pickle' (one file per sensor), 'partitioned' (one file per month)
+            or 'cube' (a memory-mapped days x sensors array, see open_cube())
+            If None, use the storage specified in the opengrid configuration,
+            or 'pickle' if not specified.
+        incremental : bool, default=False
+            If True, update() appends the new data to a log instead of
+            rewriting the full history.  The log is compacted automatically
+            when it becomes large, or by calling compact().
             
         """
         self.variable = variable
@@ -53,6 +616,18 @@ class Cache(object):
         if not os.path.exists(self.folder):
             print("This folder does not exist: {}, it will be created".format(self.folder))
             os.mkdir(self.folder)
+
+        if storage is None:
+            if cfg.has_option('data', 'cache_storage'):
+                storage = cfg.get('data', 'cache_storage')
+            else:
+                storage = 'pickle'
+        if isinstance(storage, str):
+            try:
+                storage = STORAGE_ENGINES[storage]
+            except KeyError:
+                raise NotImplementedError("Cache storage '{}' is not supported".format(storage))
+        self.storage = storage(folder=self.folder, variable=self.variable, incremental=incremental)
             
         print("Cache object created for variable: {}".format(self.variable))
 
@@ -72,23 +647,12 @@ class Cache(object):
         df : tz-aware dataframe with cached daily results or empty dataframe.
         
         """
-        # Find the file and read into a dataframe
-        filename = self.variable + '_' + sensorkey + '.pkl'
-        path = os.path.join(self.folder, filename)
-        
-        if not os.path.exists(path):
-            #print("Could not find {}".format(path))
-            return pd.DataFrame()
-        with open(path, "rb") as f:
-            df = pickle.load(f)
-        if isinstance(df, pd.Series):
-            df = pd.DataFrame(df)
-        return df
+        return self.storage.load(sensorkey)
     
     
     def _write_single(self, df):
         """
-        Write the dataframe with single sensor to csv according to the filename conventions
+        Write the dataframe with single sensor to disk according to the storage conventions
 
         Arguments
         ---------
@@ -105,20 +669,11 @@ class Cache(object):
                 raise ValueError("pandas Series needs a name with sensor id")
             df_temp = pd.DataFrame(df)
 
-        df_temp = df_temp.dropna()
-
-        sensor = df_temp.columns[0]
-        # Find the file and read into a dataframe
-        filename = self.variable + '_' + sensor + '.pkl'
-        path = os.path.join(self.folder, filename)
-        with open(path, "wb") as f:
-            pickle.dump(df_temp, f)
-
-        return True
+        return self.storage.write(df_temp)
 
     def _write(self, df):
         """
-        Write the dataframe to csv according to the filename conventions
+        Write the dataframe to disk according to the storage conventions
 
         Parameters
         ----------
@@ -131,16 +686,13 @@ class Cache(object):
 
         Notes
         -----
-        For each sensor found in df, a csv is saved to disk with filename
-        self.folder/result_sensor.csv
+        Existing cached data for the sensors found in df is overwritten.
         """
 
         if isinstance(df, pd.Series):
             return self._write_single(df)
         else:
-            for sensor in df.columns:
-                self._write_single(df[sensor])
-            return True
+            return self.storage.write(df)
     
     def get(self, sensors, start=None, end=None):
         """
@@ -164,17 +716,10 @@ class Cache(object):
         if not isinstance(sensors, list):
             raise TypeError("Sensors has to be a list with Sensor objects, not a {}".format(type(sensors)))
 
-        dfs = []
-        for sensor in sensors:
-            df = self._load(sensor.key)
-            if not df.empty:
-                dfs.append(df)
+        dfs = self.storage.read([sensor.key for sensor in sensors], start=start, end=end)
         if dfs:
             df = pd.concat(dfs, axis=1)
-            try:
-                df.index = df.index.tz_convert('Europe/Brussels')
-            except TypeError:
-                df.index = df.index.tz_localize('Europe/Brussels')
+            df.index = _to_local(df.index)
         else:
             print("No cached sensordata found.")
             df = pd.DataFrame()
@@ -262,13 +807,7 @@ class Cache(object):
                 raise ValueError("pandas Series needs a name with sensor id")
             df_temp = pd.DataFrame(df)
 
-        # Find the file and read into a dataframe
-        sensor = df_temp.columns[0]
-        df_old = self._load(sensor) #
-        df_old.update(df_temp)
-        df_res = df_old.combine_first(df_temp)
-        self._write(df_res)
-        return True
+        return self.storage.update(df_temp)
 
 
     def update(self, df):
@@ -286,24 +825,90 @@ class Cache(object):
 
         Notes
         -----
-        For each sensor found in df, a csv is saved to disk with filename
-        self.folder/result_sensor.csv. If such a file was already present,
-        the values are updated with the ones provided in df (will overwrite
-        overlapping days).
+        For each sensor found in df, the data is saved to disk by the storage
+        engine. If the sensor was already cached, the values are updated with
+        the ones provided in df (will overwrite overlapping days).
         """
 
         if isinstance(df, pd.Series):
             return self._update_single(df)
         else:
-            for sensor in df.columns:
-                try:
-                    self._update_single(df[sensor])
-                except ValueError:
-                    pass
+            # all columns share the same index, so checking the dataframe once is sufficient
+            if self.check_df(df):
+                self.storage.update(df)
             return True
 
+    def compact(self):
+        """
+        Merge the logs written by incremental updates into the cached data
 
-def cache_results(hp, sensors, resultname, AnalysisClass, chunk=True, **kwargs):
+        Returns
+        -------
+        True if all logs are compacted successfully
+        """
+        return self.storage.compact()
+
+    def open_cube(self):
+        """
+        Open the cached data as a memory-mapped days x sensors array.
+        Only available with the 'cube' storage.
+
+        Returns
+        -------
+        Cube or None if there is no cached data
+        """
+        if not hasattr(self.storage, 'open_cube'):
+            raise NotImplementedError("open_cube() requires the 'cube' storage")
+        return self.storage.open_cube()
+
+
+def _run_analysis(hp, sensor, last_day, AnalysisClass, chunk, max_rows=None, **kwargs):
+    """
+    Run an analysis on a single sensor for the data since last_day
+
+    Returns
+    -------
+    list with the results of the analysis (one result per block of days if chunk is True)
+    """
+    results = []
+    if chunk:
+        if max_rows is None:
+            days = 1
+        else:
+            # hp.get_data returns minute values: 1440 rows per day
+            days = max(1, int(max_rows // 1440))
+        for d in pd.date_range(start=last_day, freq='{}D'.format(days), end=pd.Timestamp.now(tz=last_day.tz)):
+            # get new data for a block of days, full resolution
+            df_new = hp.get_data(sensors=[sensor], head=d, tail=d + pd.Timedelta(days=days))
+
+            # apply the method
+            results.append(AnalysisClass(df_new, **kwargs).result)
+    else:
+        # get new data, full resolution
+        df_new = hp.get_data(sensors=[sensor], head=last_day)
+
+        # apply the method
+        results.append(AnalysisClass(df_new, **kwargs).result)
+    return results
+
+
+# houseprint of a worker process, see cache_results
+_worker_hp = None
+
+
+def _init_worker(hp):
+    global _worker_hp
+    _worker_hp = hp
+
+
+def _run_analysis_in_worker(args):
+    sensorkey, last_day, AnalysisClass, chunk, max_rows, kwargs = args
+    sensor = _worker_hp.find_sensor(sensorkey)
+    return _run_analysis(_worker_hp, sensor, last_day, AnalysisClass, chunk, max_rows=max_rows, **kwargs)
+
+
+def cache_results(hp, sensors, resultname, AnalysisClass, chunk=True, max_rows=None, incremental=False, n_jobs=1,
+                  **kwargs):
     """
     Run an analysis on a set of sensors and cache the results
 
@@ -319,6 +924,21 @@ def cache_results(hp, sensors, resultname, AnalysisClass, chunk=True, **kwargs):
         Additional keyword arguments are passed to the instantiation of the analysis class
     chunk : boolean, default=True
         If True, cache day_by_day to reduce memory use.
+    max_rows : int, optional
+        Only used if chunk is True.  If given, the data is fetched and analysed
+        in blocks of several days instead of day by day, with at most max_rows
+        minute values per block.  All days of a block are cached in a single
+        update.  Use this only for analyses that treat each day independently,
+        like DailyAgg.
+    incremental : boolean, default=False
+        If True, append the new results to the cache instead of rewriting
+        the cached history for every update (see Cache).
+    n_jobs : int, default=1
+        Number of worker processes.  If larger than 1, the sensors are
+        analysed in parallel, each worker process with its own tmpo session.
+        The results are cached by the calling process only, so the cache
+        is never written concurrently.  If an analysis raises an error, the
+        other workers are stopped and the error is raised.
 
     Returns
     -------
@@ -331,40 +951,42 @@ def cache_results(hp, sensors, resultname, AnalysisClass, chunk=True, **kwargs):
     # Therefore, we create a for loop over the sensor ids
     # update: to reduce RAM use, we add another loop to run over the days
 
-    import importlib
-    cache = Cache(variable=resultname)
+    if n_jobs < 1:
+        raise ValueError("n_jobs should be at least 1, got {}".format(n_jobs))
+
+    cache = Cache(variable=resultname, incremental=incremental)
 
-    for sensor in tqdm(sensors):
-        # Get whatever is available as cache
-        # and only extract timeseries from tmpos since the last day
+    # Get whatever is available as cache
+    # and only extract timeseries from tmpos since the last day
+    last_days = []
+    for sensor in sensors:
         df_cached = cache.get([sensor])
         try:
-            last_day = df_cached.index[-1]
+            last_days.append(df_cached.index[-1])
         except IndexError:
-            last_day = pd.Timestamp('2013-01-01', tz='UTC')
-
-        if chunk:
-            for d in pd.DatetimeIndex(start=last_day, freq='D', end=pd.Timestamp.today()):
-                # get new data for a single day, full resolution
-                df_new = hp.get_data(sensors = [sensor], head=d, tail=d + pd.Timedelta(days=1))
-
-                # apply the method
-                df_day = AnalysisClass(df_new, **kwargs).result
+            last_days.append(pd.Timestamp('2013-01-01', tz='UTC'))
 
+    if n_jobs == 1:
+        for sensor, last_day in tqdm(zip(sensors, last_days), total=len(sensors)):
+            for df_day in _run_analysis(hp, sensor, last_day, AnalysisClass, chunk, max_rows=max_rows, **kwargs):
                 # cache the results
                 cache.update(df_day)
+    else:
+        import multiprocessing
+        tasks = [(sensor.key, last_day, AnalysisClass, chunk, max_rows, kwargs)
+                 for sensor, last_day in zip(sensors, last_days)]
+        pool = multiprocessing.Pool(processes=n_jobs, initializer=_init_worker, initargs=(hp,))
+        try:
+            for results in tqdm(pool.imap_unordered(_run_analysis_in_worker, tasks), total=len(tasks)):
+                for df_day in results:
+                    # cache the results
+                    cache.update(df_day)
+        except BaseException:
+            # stop the other workers instead of waiting until they have analysed all sensors
+            pool.terminate()
+            pool.join()
+            raise
         else:
-            # get new data, full resolution
-            df_new = hp.get_data(sensors=[sensor], head=last_day)
-
-            # apply the method
-            df_day = AnalysisClass(df_new, **kwargs).result
-
-            # cache the results
-            cache.update(df_day)
+            pool.close()
+            pool.join()
     return True
-
-
-
-
-
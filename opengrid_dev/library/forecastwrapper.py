@@ -2,9 +2,8 @@
 __author__ = 'Jan Pecinovsky'
 
 import datetime as dt
-import forecastio
-from forecastio.models import Forecast
-from geopy import Location, Point, GoogleV3
+import threading
+import time
 import numpy as np
 import pandas as pd
 import pytz
@@ -15,9 +14,22 @@ import pickle
 
 from .misc import dayset, calculate_temperature_equivalent, \
     calculate_degree_days
+from .caching import PartitionedStorage
 from opengrid_dev import config
 cfg = config.Config()
 
+# Dark Sky endpoint, requests are made to FORECAST_URL/apikey/lat,lng,time
+FORECAST_URL = 'https://api.darksky.net/forecast'
+
+# more verbose names for the properties in the 'solar' part of hourly data
+SOLAR_NAMES = {'altitude': 'SolarAltitude',
+               'dni': 'DirectNormalIrradiance',
+               'ghi': 'GlobalHorizontalIrradiance',
+               'dhi': 'DiffuseHorizontalIrradiance',
+               'etr': 'ExtraTerrestrialRadiation',
+               'azimuth': 'SolarAzimuth'
+               }
+
 
 class Weather():
     """
@@ -26,7 +38,8 @@ class Weather():
     """
 
     def __init__(self, location, start, end=None, cache=True, api_key=None,
-                 timezone=None):
+                 timezone=None, n_jobs=1, rate_limit=None, retries=0,
+                 backoff=1., url=FORECAST_URL):
         """
             Constructor
 
@@ -46,6 +59,23 @@ class Weather():
             timezone : str, optional
                 timezone lookup is done automatically, but you can set it
                 manually if you'd like
+            n_jobs : int
+                default 1
+                Number of days that are fetched concurrently.
+                Days in the cache are never fetched.
+            rate_limit : float, optional
+                Maximum number of requests per second, over all threads
+            retries : int
+                default 0
+                Number of times a request is retried after a connection
+                error, a 429 (too many requests) or a 5xx response
+            backoff : float
+                default 1.0
+                Seconds to wait before the first retry, doubled for every
+                next retry
+            url : str
+                default FORECAST_URL
+                Base url of the Dark Sky API
         """
         if api_key is not None:
             self.api_key = api_key
@@ -56,6 +86,11 @@ class Weather():
         self._end = end
         self.cache = cache
         self._tz = timezone
+        self.n_jobs = n_jobs
+        self.rate_limit = rate_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.url = url
 
         self._forecasts = []
 
@@ -68,6 +103,8 @@ class Weather():
         -------
         Location
         """
+        from geopy import Location, Point, GoogleV3
+
         # if the input was a string, we do a google lookup
         if isinstance(self._location, str):
             location = GoogleV3().geocode(self._location)
@@ -131,6 +168,7 @@ class Weather():
 
         # use Google geocoder to lookup timezone
         else:
+            from geopy import GoogleV3
             lat, long, _alt = self.location.point
             tz = GoogleV3().timezone(location=(lat, long)).zone
 
@@ -150,9 +188,7 @@ class Weather():
         if not self._forecasts:
             # get list of seperate days
             days = dayset(start=self.start, end=self.end)
-            # wrap in a tqdm so we get the progress bar
-            for date in tqdm(days):
-                self._forecasts.append(self._get_forecast(date=date))
+            self._forecasts = self._get_forecasts(dates=days)
 
         return self._forecasts
 
@@ -188,19 +224,22 @@ class Weather():
         """
 
         # add 2 days before to calculate degree days
-        self._add_forecast(self.start - pd.Timedelta(days=1))
-        self._add_forecast(self.start - pd.Timedelta(days=2))
+        dates = [(self.start - pd.Timedelta(days=2)).date(),
+                 (self.start - pd.Timedelta(days=1)).date()]
+        dates += [date for date in dayset(start=self.start, end=self.end) if date not in dates]
 
         # create a dataframe from the daily observations
-        day_list = [self._forecast_to_day_series(forecast=forecast)
-                    for forecast in tqdm(self.forecasts)]
-        frame = pd.concat(day_list)
-        frame = self._fix_index(frame).sort_index()
+        if self.cache:
+            frame = self._read_tables('days', dates)
+        else:
+            self._add_forecasts(dates[:2])
+            frame = self._forecasts_to_day_frame(self.forecasts)
+            frame = self._fix_index(frame).sort_index()
 
         # add aggregates from hourly observations to the dataframe
-        hourly_frame = self.hours(irradiances=irradiances,
-                                  no_truncate=True,
-                                  wind_orients=wind_orients)
+        hourly_frame = self._hours(dates=dates,
+                                   irradiances=irradiances,
+                                   wind_orients=wind_orients)
         temperature = hourly_frame.temperature.resample('d').mean()
         ghi = hourly_frame.GlobalHorizontalIrradiance.dropna().resample('d').sum()
         tilted_gi = hourly_frame.filter(regex='^GlobalIrradiance').dropna().resample('d').sum()
@@ -249,13 +288,35 @@ class Weather():
         -------
         pandas.DataFrame
         """
-        day_list = [self._forecast_to_hour_series(forecast)
-                    for forecast in tqdm(self.forecasts)]
-        frame = pd.concat(day_list)
-        frame = self._fix_index(frame)
-        frame.sort_index(inplace=True)
+        frame = self._hours(dates=dayset(start=self.start, end=self.end),
+                            irradiances=irradiances,
+                            wind_orients=wind_orients)
         if not no_truncate:
             frame = frame.truncate(before=self.start, after=self.end)
+        return frame
+
+    def _hours(self, dates, irradiances=None, wind_orients=None):
+        """
+        Create a dataframe with the hourly weather data of the given dates,
+        from the table cache or else from self.forecasts
+
+        Parameters
+        ----------
+        dates : list of datetime.date
+            consecutive dates
+        irradiances : list[tuple], optional
+        wind_orients : list[int] | list[float], optional
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        if self.cache:
+            frame = self._read_tables('hours', dates)
+        else:
+            frame = self._forecasts_to_hour_frame(self.forecasts)
+            frame = self._fix_index(frame)
+            frame.sort_index(inplace=True)
 
         if irradiances is not None:
             for ir in irradiances:
@@ -279,28 +340,102 @@ class Weather():
             -------
             forecastio forecast
         """
-        # Forecast takes a dt.datetime
-        # conversion from dt.date to dt.datetime, there must be a better way, right?
-        time = dt.datetime(year=date.year, month=date.month, day=date.day)
+        return self._get_forecasts(dates=[date])[0]
 
-        f = None
+    def _get_forecasts(self, dates):
+        """
+            Get the raw forecast objects for the given dates, from the cache
+            if possible. The other dates are fetched, n_jobs at a time,
+            and saved in the cache.
+
+            Parameters
+            ----------
+            dates : iterable of datetime.date
+
+            Returns
+            -------
+            list of forecastio forecast, in the order of dates
+        """
+        dates = list(dates)
+        forecasts = [None] * len(dates)
+        if self.cache:
+            for i, date in enumerate(dates):
+                forecasts[i] = self._load_from_cache(date)
+        missing = [i for i, f in enumerate(forecasts) if not f]
+        if not missing:
+            return forecasts
+
+        # look up the location and create the cache folder before starting the threads
+        lat, lng = self.location.latitude, self.location.longitude
         if self.cache:
-            f = self._load_from_cache(date)
-
-        if not f:
-            # We specifically ask for si units,
-            # so we can inject the SOLAR argument to get solar data
-            # which is in beta (januari 2017)
-            f = forecastio.load_forecast(key=self.api_key,
-                                         lat=self.location.latitude,
-                                         lng=self.location.longitude,
-                                         time=time,
-                                         units='si&solar'
-                                         )
+            self._make_cache_folder()
+        limiter = _RateLimiter(self.rate_limit)
+
+        def fetch(i):
+            f = self._fetch_forecast(dates[i], lat, lng, limiter)
             if self.cache:
-                self._save_in_cache(f, date)
+                self._save_in_cache(f, dates[i])
+            return i, f
+
+        if self.n_jobs == 1:
+            # wrap in a tqdm so we get the progress bar
+            for i in tqdm(missing):
+                forecasts[i] = fetch(i)[1]
+        else:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        return f
+            executor = ThreadPoolExecutor(max_workers=self.n_jobs)
+            futures = [executor.submit(fetch, i) for i in missing]
+            try:
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    i, f = future.result()
+                    forecasts[i] = f
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+
+        return forecasts
+
+    def _fetch_forecast(self, date, lat, lng, limiter):
+        """
+            Request the forecast of a date from the API, retry on connection
+            errors, 429 and 5xx responses
+
+            Parameters
+            ----------
+            date : datetime.date
+            lat, lng : float
+            limiter : _RateLimiter
+
+            Returns
+            -------
+            forecastio forecast
+        """
+        from forecastio.api import get_forecast
+        from requests.exceptions import HTTPError, ConnectionError
+
+        # Forecast takes a dt.datetime
+        # conversion from dt.date to dt.datetime, there must be a better way, right?
+        time_ = dt.datetime(year=date.year, month=date.month, day=date.day)
+        # We specifically ask for si units,
+        # so we can inject the SOLAR argument to get solar data
+        # which is in beta (januari 2017)
+        url = '{}/{}/{},{},{}?units=si&solar&lang=en'.format(self.url, self.api_key, lat, lng,
+                                                             time_.isoformat())
+
+        attempts = 0
+        while True:
+            attempts += 1
+            limiter.wait()
+            try:
+                return get_forecast(url)
+            except (HTTPError, ConnectionError) as e:
+                status = getattr(e.response, 'status_code', None)
+                retry = status is None or status == 429 or status >= 500
+                if not retry or attempts > self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** (attempts - 1))
 
     def _get_forecast_dates(self):
         """
@@ -336,6 +471,22 @@ class Weather():
         if date not in self._get_forecast_dates():
             self._forecasts.append(self._get_forecast(date))
 
+    def _add_forecasts(self, dates):
+        """
+        Add the forecasts of several dates to the list of forecasts,
+        fetching the missing ones together
+
+        Parameters
+        ----------
+        dates : list of dt.date | dt.datetime | pd.Timestamp
+        """
+        # for if you pass a datetime instead of a date
+        dates = [date.date() if hasattr(date, 'date') else date for date in dates]
+
+        known = self._get_forecast_dates()
+        dates = [date for date in dates if date not in known]
+        self._forecasts.extend(self._get_forecasts(dates))
+
     def _forecast_to_hour_series(self, forecast):
         """
         Transforms the hourly data of a forecast object to a pandas dataframe
@@ -349,49 +500,37 @@ class Weather():
         pd.DataFrame
 
         """
-
-        hour_list = [pd.Series(self._flatten_solar(hour.d)) for hour in forecast.hourly().data]
-        if len(hour_list) == 0:
-            return pd.DataFrame()
-        frame = pd.concat(hour_list, axis=1).T
-        frame.temperature = frame.temperature.astype(float)
-        return frame
+        return self._forecasts_to_hour_frame([forecast])
 
     @staticmethod
-    def _flatten_solar(j):
+    def _forecasts_to_hour_frame(forecasts):
         """
-        Extracts the 'solar' part from the response json,
-        renames the fields and includes them along with everything else
+        Transforms the hourly data of a list of forecast objects to a single
+        pandas dataframe, with the 'solar' part flattened into columns
 
         Parameters
         ----------
-        j : dict
+        forecasts : list of Forecast objects
 
         Returns
         -------
-        dict
-        """
-        try:
-            solar = j.pop('solar')
-        except KeyError:
-            return j
-        else:
-            # give the properties some more verbose names
-            new_names = {'altitude': 'SolarAltitude',
-                         'dni': 'DirectNormalIrradiance',
-                         'ghi': 'GlobalHorizontalIrradiance',
-                         'dhi': 'DiffuseHorizontalIrradiance',
-                         'etr': 'ExtraTerrestrialRadiation',
-                         'azimuth': 'SolarAzimuth'
-                         }
-            solar = {new_names[key]: val for key, val in solar.items()}
-            j.update(solar)
+        pd.DataFrame
 
+        """
+        hours = [hour for forecast in forecasts for hour in forecast.json.get('hourly', {}).get('data', [])]
+        if len(hours) == 0:
+            return pd.DataFrame()
+        frame = pd.DataFrame(hours)
+        if 'solar' in frame.columns:
+            solar = [j if isinstance(j, dict) else {} for j in frame.pop('solar')]
+            solar = pd.DataFrame(solar, index=frame.index).rename(columns=SOLAR_NAMES)
             # workaround for the 90 bug by Dark Sky
             # add 90 and take modulo 360 to stay between 0 and 360
-            j.update({'SolarAzimuth': (j.get('SolarAzimuth') + 90) % 360})
-
-            return j
+            if 'SolarAzimuth' in solar.columns:
+                solar['SolarAzimuth'] = (solar['SolarAzimuth'] + 90) % 360
+            frame = pd.concat([frame, solar], axis=1)
+        frame['temperature'] = frame['temperature'].astype(float)
+        return frame
 
     def _fix_index(self, frame):
         """
@@ -406,7 +545,7 @@ class Weather():
         Pandas Dataframe
 
         """
-        frame['time'] = pd.DatetimeIndex(frame['time'].astype('datetime64[s]'))
+        frame['time'] = pd.to_datetime(frame['time'].astype(np.int64), unit='s')
         frame = frame.drop_duplicates(subset='time', keep='first')
         frame.set_index('time', inplace=True)
         frame = frame.tz_localize('UTC')
@@ -437,16 +576,37 @@ class Weather():
         pandas.DataFrame
 
         """
-        data_list = forecast.daily().data
-        if len(data_list) == 0:
-            return pd.DataFrame()
+        return self._forecasts_to_day_frame([forecast])
 
-        data = data_list[0].d
-        frame = [pd.Series(data)]
-        return pd.concat(frame, axis=1).T
+    @staticmethod
+    def _forecasts_to_day_frame(forecasts):
+        """
+        Transforms the daily data of a list of forecast objects to a single
+        pandas dataframe, with one row per forecast
+
+        Parameters
+        ----------
+        forecasts : list of forecastio.models.Forecast
+
+        Returns
+        -------
+        pandas.DataFrame
+
+        """
+        days = [forecast.json.get('daily', {}).get('data', []) for forecast in forecasts]
+        days = [data[0] for data in days if data]
+        if len(days) == 0:
+            return pd.DataFrame()
+        return pd.DataFrame(days)
 
     @property
     def cache_folder(self):
+        return self._make_cache_folder()
+
+    def _make_cache_folder(self):
+        """
+        Return the cache folder of the location, create it if it does not exist
+        """
         location_str = "{}_{}".format(round(self.location.latitude, 4),
                                       round(self.location.longitude, 4))
 
@@ -461,6 +621,75 @@ class Weather():
 
         return location_folder
 
+    def _table(self, name):
+        """
+        Storage with the flattened 'hours' or 'days' frames of all cached
+        dates, or with the cached dates themselves ('dates'), in monthly
+        partitions in the cache folder
+        """
+        return PartitionedStorage(folder=self.cache_folder, variable=name)
+
+    def _read_table(self, name, start=None, end=None):
+        dfs = self._table(name).read(sensorkeys=None, start=start, end=end)
+        if not dfs:
+            return pd.DataFrame()
+        return dfs[0].tz_convert(self.tz.zone)
+
+    def _update_tables(self, dates):
+        """
+        Add the dates that are not yet in the table cache: the forecasts
+        are loaded from the pickle cache or fetched, flattened once and
+        appended to the 'hours' and 'days' tables.
+
+        Parameters
+        ----------
+        dates : list of datetime.date
+        """
+        cached = self._read_table('dates', start=self._midnight(min(dates)), end=self._midnight(max(dates)))
+        cached = set() if cached.empty else set(cached.index.date)
+        missing = [date for date in dates if date not in cached]
+        if not missing:
+            return
+
+        forecasts = self._get_forecasts(missing)
+        for name, frame in [('hours', self._forecasts_to_hour_frame(forecasts)),
+                            ('days', self._forecasts_to_day_frame(forecasts))]:
+            if not frame.empty:
+                self._table(name).update(self._fix_index(frame))
+
+        # also dates without data are marked as cached, so they are not fetched again
+        index = pd.DatetimeIndex([self._midnight(date) for date in missing])
+        hours = [len(forecast.json.get('hourly', {}).get('data', [])) for forecast in forecasts]
+        self._table('dates').update(pd.DataFrame(index=index, data={'hours': hours}))
+
+    def _read_tables(self, name, dates):
+        """
+        Return the 'hours' or 'days' frame of consecutive dates from the
+        table cache, after adding the missing dates to it
+
+        Parameters
+        ----------
+        name : 'hours' | 'days'
+        dates : list of datetime.date
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        self._update_tables(dates)
+        start = self._midnight(min(dates))
+        end = self._midnight(max(dates) + dt.timedelta(days=1))
+        frame = self._read_table(name, start=start, end=end)
+        if frame.empty:
+            return frame
+        return frame[(frame.index >= start) & (frame.index < end)]
+
+    def _midnight(self, date):
+        """
+        Return the start of a date in the local timezone
+        """
+        return pd.Timestamp(self.tz.localize(dt.datetime(date.year, date.month, date.day)))
+
     def _pickle_path(self, date):
         filename = str(date) + '.pkl'
         path = os.path.join(self.cache_folder, filename)
@@ -621,3 +850,24 @@ class Weather():
         frame[name] = oriented_speed ** 3
 
         return frame
+
+
+class _RateLimiter(object):
+    """
+    Spread calls to wait() over time, so there are at most rate per second,
+    shared between threads
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1. / rate if rate else 0.
+        self._next = 0.
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
@@ -2,6 +2,8 @@ __author__ = 'Jan Pecinovsky'
 
 import pandas as pd
 
+from .sensor import get_bulk_data
+
 """
 A Device is an entity that can contain multiple sensors.
 The generic Device class can be inherited by a specific device class, eg.
@@ -39,7 +41,7 @@ class Device(object):
         """
         return [sensor for sensor in self.sensors if sensor.type == sensortype or sensortype is None]
 
-    def get_data(self, sensortype=None, head=None, tail=None, diff='default', resample='min', unit='default'):
+    def get_data(self, sensortype=None, head=None, tail=None, diff='default', resample='min', unit='default', bulk=False):
         """
         Return a Pandas Dataframe with the joined data for all sensors in this device
 
@@ -59,6 +61,9 @@ class Device(object):
             Sampling rate, if any.  Use 'raw' if no resampling.
         unit : str , default='default'
             String representation of the target unit, eg m**3/h, kW, ...
+        bulk : bool, default=False
+            If True, read the data of all sensors from tmpo in a single pass
+            and interpolate them to a common index (see get_bulk_data)
 
         Returns
         -------
@@ -66,6 +71,8 @@ class Device(object):
         """
 
         sensors = self.get_sensors(sensortype)
+        if bulk:
+            return get_bulk_data(sensors, head=head, tail=tail, diff=diff, resample=resample, unit=unit)
         series = [sensor.get_data(head=head, tail=tail, diff=diff, resample=resample, unit=unit) for sensor in sensors]
 
         # workaround for https://github.com/pandas-dev/pandas/issues/12985
@@ -126,6 +133,8 @@ class Device(object):
         """
         sensor.device = self
         self.sensors.append(sensor)
+        if self.site is not None and self.site.hp is not None:
+            self.site.hp._add_to_index(sensor)
 
 
 class Fluksometer(Device):
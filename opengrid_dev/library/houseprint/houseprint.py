@@ -7,10 +7,11 @@ config = Config()
 import os
 import sys
 import json
-import jsonpickle
 import datetime as dt
+import time
+import threading
+import sqlite3
 import pandas as pd
-from requests.exceptions import HTTPError
 import warnings
 from tqdm import tqdm
 
@@ -20,17 +21,15 @@ if sys.version_info.major >= 3:
 else:
     import cPickle as pickle
 
-import tmpo
-
 # compatibility with py3
 if sys.version_info.major >= 3:
     from .site import Site
     from .device import Device, Fluksometer
-    from .sensor import Sensor, Fluksosensor
+    from .sensor import Sensor, Fluksosensor, get_bulk_data, prewarm_unit_conversion, _overlap, _time_chunks
 else:
     from site import Site
     from device import Device, Fluksometer
-    from sensor import Sensor, Fluksosensor
+    from sensor import Sensor, Fluksosensor, get_bulk_data, prewarm_unit_conversion, _overlap, _time_chunks
 
 """
 The Houseprint is a Singleton object which contains all metadata for sites, devices and sensors.
@@ -69,6 +68,91 @@ class Houseprint(object):
         if hasattr(self, '_tmpos'):
             self._add_sensors_to_tmpos()  
 
+    def __getstate__(self):
+        """
+        Return the state for pickling, without the tmpo session.
+        The session holds an sqlite connection which cannot be pickled, so
+        only the location of the tmpo database is kept.  A new session is
+        created when the unpickled houseprint needs one.
+        """
+        state = self.__dict__.copy()
+        state.pop('_index', None)
+        tmpos = state.pop('_tmpos', None)
+        if tmpos is not None:
+            state['_tmpos_path'] = _tmpo_path(tmpos)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @property
+    def sites(self):
+        """
+        List of sites.  A houseprint loaded from the table format only
+        creates its sites, devices and sensors when they are first needed.
+        """
+        if '_tables' in self.__dict__:
+            self.__dict__['sites'] = _from_tables(self, self.__dict__.pop('_tables'))
+        return self.__dict__['sites']
+
+    @sites.setter
+    def sites(self, sites):
+        self.__dict__.pop('_tables', None)
+        self._reset_index()
+        self.__dict__['sites'] = sites
+
+    def _get_index(self):
+        """
+        Return the lookup tables for sites, devices and sensors.
+        They are created from the sites when first needed, kept up to date
+        by add_site, Site.add_device and Device.add_sensor, and rebuilt when
+        the sites are replaced or the type or system of a sensor changes.
+        Sites, devices or sensors appended directly to the lists are not
+        found until the lookup tables are rebuilt (see _reset_index).
+
+        Returns
+        -------
+        dict with dicts
+            'site': key -> list of sites
+            'device': lowercase key -> device
+            'sensor': lowercase key -> sensor
+            'type', 'system': value -> list of sensors
+        """
+        if self.__dict__.get('_index') is None:
+            self._index = {'site': {}, 'device': {}, 'sensor': {}, 'type': {}, 'system': {}}
+            for site in self.sites:
+                self._add_to_index(site)
+        return self._index
+
+    def _reset_index(self):
+        """Drop the lookup tables, they are rebuilt when next needed"""
+        self.__dict__.pop('_index', None)
+
+    def _add_to_index(self, obj):
+        """
+        Add a site, device or sensor, with its devices and sensors, to the
+        lookup tables.  Nothing happens if the lookup tables are not created yet.
+
+        Parameters
+        ----------
+        obj : Site | Device | Sensor
+        """
+        index = self.__dict__.get('_index')
+        if index is None:
+            return
+        if isinstance(obj, Site):
+            index['site'].setdefault(obj.key, []).append(obj)
+            for device in obj.devices:
+                self._add_to_index(device)
+        elif isinstance(obj, Device):
+            index['device'].setdefault(obj.key.lower(), obj)
+            for sensor in obj.sensors:
+                self._add_to_index(sensor)
+        else:
+            index['sensor'].setdefault(obj.key.lower(), obj)
+            for attr in ['type', 'system']:
+                index[attr].setdefault(getattr(obj, attr, None), []).append(obj)
+
     def __repr__(self):
         return """
     Houseprint
@@ -143,7 +227,7 @@ class Houseprint(object):
                             k_level=r['K-level'],
                             e_level=r['E-level'],
                             epc_cert=r['EPC certificate'])
-            self.sites.append(new_site)
+            self.add_site(new_site)
 
         print('{} Sites created'.format(len(self.sites)))
 
@@ -175,7 +259,7 @@ class Houseprint(object):
                 raise NotImplementedError('Devices from {} are not supported'.format(r['manufacturer']))
 
             # add new device to parent site
-            site.devices.append(new_device)
+            site.add_device(new_device)
 
         print('{} Devices created'.format(sum([len(site.devices) for site in self.sites])))
 
@@ -226,7 +310,7 @@ class Houseprint(object):
             else:
                 raise NotImplementedError('Sensors from {} are not supported'.format(r['manufacturer']))
 
-            new_sensor.device.sensors.append(new_sensor)
+            new_sensor.device.add_sensor(new_sensor)
 
         print('{} sensors created'.format(sum([len(site.sensors) for site in self.sites])))
 
@@ -289,8 +373,13 @@ class Houseprint(object):
             variable found.
         """
 
+        if 'key' in kwargs:
+            sites = self._get_index()['site'].get(kwargs['key'], [])
+        else:
+            sites = self.sites
+
         result = []
-        for site in self.sites:
+        for site in sites:
             for keyword, value in kwargs.items():
                 if getattr(site, keyword) == value:
                     continue
@@ -312,9 +401,25 @@ class Houseprint(object):
             List of sensors satisfying the search criterion or empty list if no
             variable found.
         """
+        # candidates from the lookup tables by type and/or system
+        sensors = None
+        for keyword in ['type', 'system']:
+            value = kwargs.get(keyword)
+            if not isinstance(value, str):
+                continue
+            candidates = [sensor for attr, indexed in self._get_index()[keyword].items()
+                          if attr is not None and value in attr for sensor in indexed]
+            if sensors is None or len(candidates) < len(sensors):
+                sensors = candidates
+        if sensors is None:
+            sensors = self.get_sensors()
+        else:
+            # same order as get_sensors
+            candidates = set(id(sensor) for sensor in sensors)
+            sensors = [sensor for sensor in self.get_sensors() if id(sensor) in candidates]
 
         result = []
-        for sensor in self.get_sensors():
+        for sensor in sensors:
             for keyword, value in kwargs.items():
                 if value in getattr(sensor, keyword):
                     continue
@@ -335,11 +440,8 @@ class Houseprint(object):
             -------
             Site
         """
-
-        for site in self.sites:
-            if site.key == key:
-                return site
-        return None
+        sites = self._get_index()['site'].get(key)
+        return sites[0] if sites else None
 
     def find_device(self, key):
         """
@@ -351,10 +453,7 @@ class Houseprint(object):
             -------
             Device
         """
-        for device in self.get_devices():
-            if device.key.lower() == key.lower():
-                return device
-        return None
+        return self._get_index()['device'].get(key.lower())
 
     def find_sensor(self, key):
         """
@@ -366,10 +465,7 @@ class Houseprint(object):
             -------
             Sensor
         """
-        for sensor in self.get_sensors():
-            if sensor.key.lower() == key.lower():
-                return sensor
-        return None
+        return self._get_index()['sensor'].get(key.lower())
 
     def save(self, filename, pickle_format='jsonpickle'):
         """
@@ -381,9 +477,11 @@ class Houseprint(object):
             Filename, if relative path or just filename, it is appended to the
             current working directory
         pickle_format : str
-            'jsonpickle' or 'pickle'
+            'jsonpickle', 'pickle' or 'table'
             pickle may be more robust, but jsonpickle should be compatible
-            across python versions
+            across python versions.
+            'table' stores the sites, devices and sensors as tables with
+            references by row number, which is much faster to load.
 
         """
         # temporarily delete tmpo session
@@ -396,12 +494,16 @@ class Houseprint(object):
         abspath = os.path.join(os.getcwd(), filename)
 
         if pickle_format == 'jsonpickle':
+            import jsonpickle
             with open(abspath, 'w') as f:
                 frozen = jsonpickle.encode(self)
                 f.write(frozen)
         elif pickle_format == 'pickle':
             with open(abspath, 'wb') as f:
                 pickle.dump(self, file=f)
+        elif pickle_format == 'table':
+            with open(abspath, 'wb') as f:
+                pickle.dump(_to_tables(self), file=f, protocol=pickle.HIGHEST_PROTOCOL)
         else:
             raise NotImplementedError("Pickle format '{}' is not supported".format(pickle_format))
 
@@ -437,11 +539,15 @@ class Houseprint(object):
         if tmpos is not None:
             self._tmpos = tmpos
         else:
-            try:
-                path_to_tmpo_data = config.get('tmpo', 'data')
-            except:
-                path_to_tmpo_data = None
-
+            if path_to_tmpo_data is None:
+                path_to_tmpo_data = getattr(self, '_tmpos_path', None)
+            if path_to_tmpo_data is None:
+                try:
+                    path_to_tmpo_data = config.get('tmpo', 'data')
+                except:
+                    path_to_tmpo_data = None
+
+            import tmpo
             self._tmpos = tmpo.Session(path_to_tmpo_data)
             self._add_sensors_to_tmpos()
 
@@ -471,7 +577,7 @@ class Houseprint(object):
     def tmpos(self):
         return self.get_tmpos()
 
-    def sync_tmpos(self, http_errors='warn'):
+    def sync_tmpos(self, http_errors='warn', n_jobs=1, retries=None, backoff=1.):
         """
             Add all Flukso sensors to the TMPO session and sync
 
@@ -480,27 +586,95 @@ class Houseprint(object):
             http_errors : 'raise' | 'warn' | 'ignore'
                 default 'warn'
                 define what should be done with TMPO Http-errors
+            n_jobs : int
+                default 1
+                Number of sensors that are synced concurrently.  Each thread
+                uses its own tmpo session on the same database.
+            retries : int, optional
+                Number of times the sync of a sensor is retried after an
+                Http-, connection- or database error.  By default 0, or 2
+                if n_jobs > 1: concurrent writers can find the database locked
+            backoff : float
+                default 1.0
+                Seconds to wait before the first retry, doubled for every
+                next retry
+
+            Returns
+            -------
+            pd.DataFrame
+                With the sensor keys as index and columns 'seconds' (duration
+                of the sync, including retries), 'attempts' and 'error' (the
+                Http-error of the last attempt, or None)
         """
 
+        if retries is None:
+            retries = 0 if n_jobs == 1 else 2
         tmpos = self.get_tmpos()
-        for sensor in tqdm(self.get_fluksosensors()):
-            try:
+        sensors = self.get_fluksosensors()
+        report = []
+
+        def handle_error(key, e):
+            if e is None or http_errors == 'ignore':
+                return
+            elif http_errors == 'warn':
+                warnings.warn(message='Error for SensorID: ' + key
+                + str(e))
+            else:
+                print('Error for SensorID: ' + key)
+                raise e
+
+        if n_jobs == 1:
+            for sensor in tqdm(sensors):
                 warnings.simplefilter('ignore')
-                tmpos.sync(sensor.key)
-                warnings.simplefilter('default')
-            except HTTPError as e:
-                warnings.simplefilter('default')
-                if http_errors == 'ignore':
-                    continue
-                elif http_errors == 'warn':
-                    warnings.warn(message='Error for SensorID: ' + sensor.key
-                    + str(e))
-                else:
-                    print('Error for SensorID: ' + sensor.key)
-                    raise e
+                try:
+                    result = _sync_sensor(tmpos, sensor.key, retries=retries, backoff=backoff)
+                finally:
+                    warnings.simplefilter('default')
+                report.append(result)
+                handle_error(sensor.key, result[3])
+        else:
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            import tmpo
+
+            # a tmpo session holds a single sqlite connection, so it cannot be shared between threads
+            local = threading.local()
+            path = _tmpo_path(tmpos)
+            sessions = []
+            lock = threading.Lock()
+
+            def sync(key):
+                if not hasattr(local, 'tmpos'):
+                    local.tmpos = tmpo.Session(path)
+                    local.tmpos.host = tmpos.host
+                    with lock:
+                        sessions.append(local.tmpos)
+                return _sync_sensor(local.tmpos, key, retries=retries, backoff=backoff)
+
+            executor = ThreadPoolExecutor(max_workers=n_jobs)
+            futures = [executor.submit(sync, sensor.key) for sensor in sensors]
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    for future in tqdm(as_completed(futures), total=len(futures)):
+                        result = future.result()
+                        report.append(result)
+                        if result[3] is not None and http_errors == 'raise':
+                            break
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for session in sessions:
+                    _close_tmpo_session(session)
+
+            for key, seconds, attempts, e in report:
+                handle_error(key, e)
+
+        return pd.DataFrame(data=[r[1:] for r in report], index=[r[0] for r in report],
+                            columns=['seconds', 'attempts', 'error'])
 
     def get_data(self, sensors=None, sensortype=None, head=None, tail=None, diff='default', resample='min',
-                 unit='default'):
+                 unit='default', bulk=False):
         """
         Return a Pandas Dataframe with joined data for the given sensors
 
@@ -520,10 +694,15 @@ class Houseprint(object):
             Sampling rate, if any.  Use 'raw' if no resampling.
         unit : str , default='default'
             String representation of the target unit, eg m**3/h, kW, ...
+        bulk : bool, default=False
+            If True, read the data of all sensors from tmpo in a single pass
+            and interpolate them to a common index (see get_bulk_data)
         
         """
         if sensors is None:
             sensors = self.get_sensors(sensortype)
+        if bulk:
+            return get_bulk_data(sensors, head=head, tail=tail, diff=diff, resample=resample, unit=unit)
         series = [sensor.get_data(head=head, tail=tail, diff=diff, resample=resample, unit=unit) for sensor in sensors]
 
         # workaround for https://github.com/pandas-dev/pandas/issues/12985
@@ -585,6 +764,89 @@ class Houseprint(object):
             else:
                 yield ts
 
+    def get_data_chunked(self, sensors=None, sensortype=None, head=None,
+                         tail=None, freq='D', overlap=None, diff='default',
+                         resample='min', unit='default', bulk=False):
+        """
+        Yield Pandas Dataframes with joined data for the given sensors,
+        one for each chunk of time between head and tail.
+        This way, a long history can be processed in bounded memory.
+
+        Parameters
+        ----------
+        sensors : list(Sensor), optional
+            If None, use sensortype to make a selection
+        sensortype : str, optional
+            gas, water, electricity. If None, and Sensors = None,
+            all available sensors in the houseprint are fetched
+        head : dt.datetime | pd.Timestamp | int, optional
+            If None, start at the first timestamp of the sensors
+        tail : dt.datetime | pd.Timestamp | int, optional
+            If None, end now
+        freq : str
+            default='D'
+            Pandas frequency string for the chunks, eg. 'D', 'W', 'MS'
+            Chunks start at midnight UTC.
+        overlap : pd.Timedelta | str, optional
+            Time by which a chunk is extended to obtain its data, see
+            Sensor.get_data_chunked
+        diff : bool | str('default')
+            If True, the original data will be differentiated
+            If 'default', the sensor will decide: if it has the attribute
+            cumulative==True, the data will be differentiated.
+        resample : str
+            default='min'
+            Sampling rate, if any.  Use 'raw' if no resampling.
+        unit : str
+            default='default'
+            String representation of the target unit, eg m**3/h, kW, ...
+        bulk : bool
+            default=False
+            If True, read the data of all sensors in a single pass (see get_data)
+
+        Yields
+        ------
+        Pandas.DataFrame
+        """
+        if sensors is None:
+            sensors = self.get_sensors(sensortype)
+
+        if head is None:
+            timestamps = [sensor.first_timestamp() for sensor in sensors]
+            timestamps = [t for t in timestamps if t is not None]
+            if not timestamps:
+                return
+            head = min(timestamps)
+        overlap = _overlap(overlap, resample)
+
+        for start, end, last in _time_chunks(head, tail, freq, 'UTC'):
+            df = self.get_data(sensors=sensors, head=start - overlap, tail=end if last else end + overlap, diff=diff,
+                               resample=resample, unit=unit, bulk=bulk)
+            if df.empty:
+                continue
+            df = df[(df.index >= start) & (last | (df.index < end))]
+            if df.empty:
+                continue
+            yield df
+
+    def prewarm_unit_conversion(self, resamples=('min', 'hour', 'day'), units=('default',)):
+        """
+        Compute the unit conversion factors for all sensors in the houseprint
+        in advance, so get_data does not need to parse units.
+
+        Parameters
+        ----------
+        resamples : list(str)
+            Sampling rates, eg. 'min', 'hour', 'day'
+        units : list(str)
+            Target units, 'default' for the default unit of each sensor
+
+        Returns
+        -------
+        int : the number of conversion factors that are known
+        """
+        return prewarm_unit_conversion(self.get_sensors(), resamples=resamples, units=units)
+
     def add_site(self, site):
         """
         Parameters
@@ -593,6 +855,155 @@ class Houseprint(object):
         """
         site.hp = self
         self.sites.append(site)
+        self._add_to_index(site)
+
+
+def _tmpo_path(tmpos):
+    """
+    Return the path_to_tmpo_data of a tmpo session
+    """
+    # tmpos.db is path_to_tmpo_data/.tmpo/tmpo.sqlite3
+    return os.path.dirname(os.path.dirname(tmpos.db))
+
+
+def _close_tmpo_session(tmpos):
+    """
+    Close the http session (and its thread pool) and the database connection of a tmpo session
+    """
+    tmpos.rqs.close()
+    executor = getattr(tmpos.rqs, 'executor', None)
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if tmpos.dbcon is not None:
+        tmpos.dbcon.close()
+        tmpos.dbcon = None
+
+
+def _sync_sensor(tmpos, key, retries=0, backoff=1.):
+    """
+    Sync a single sensor, retry on Http-, connection- and database errors
+
+    Returns
+    -------
+    tuple (key, seconds, attempts, error)
+        error is the HTTPError of the last attempt or None.
+        Other errors are raised after the last attempt.
+    """
+    from requests.exceptions import HTTPError, ConnectionError
+    start = time.time()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            tmpos.sync(key)
+        except (HTTPError, ConnectionError, sqlite3.OperationalError) as e:
+            if attempts <= retries:
+                time.sleep(backoff * 2 ** (attempts - 1))
+                continue
+            if not isinstance(e, HTTPError):
+                raise
+            error = e
+        else:
+            error = None
+        return key, time.time() - start, attempts, error
+
+
+TABLE_FORMAT_VERSION = 1
+
+# classes that can be stored in the table format
+_TABLE_CLASSES = {cls.__name__: cls for cls in [Site, Device, Fluksometer, Sensor, Fluksosensor]}
+
+# attributes that are stored as references between the tables, or not at all
+_TABLE_REFS = {'sites': ['hp', 'devices', '_tmpos'],
+               'devices': ['site', 'sensors'],
+               'sensors': ['device', 'site', '_tmpos']}
+
+
+def _table(objects, refs, **references):
+    """
+    Return a table of objects: a dict with the class, reference and
+    attribute columns and the rows as tuples
+    """
+    columns = []
+    for obj in objects:
+        for attr in obj.__dict__:
+            if attr not in refs and attr not in columns:
+                columns.append(attr)
+    rows = [tuple(obj.__dict__.get(attr) for attr in columns) for obj in objects]
+    table = {'class': [obj.__class__.__name__ for obj in objects], 'columns': columns, 'rows': rows}
+    table.update(references)
+    return table
+
+
+def _to_tables(hp):
+    """
+    Return the houseprint as a dict of tables with builtin types only.
+    Devices refer to their site and sensors to their device by row number.
+    """
+    sites = hp.sites
+    devices = [device for site in sites for device in site.devices]
+    sensors = [sensor for device in devices for sensor in device.sensors]
+
+    site_rows = {id(site): i for i, site in enumerate(sites)}
+    device_rows = {id(device): i for i, device in enumerate(devices)}
+
+    for obj in sites + devices + sensors:
+        if obj.__class__.__name__ not in _TABLE_CLASSES:
+            raise NotImplementedError("Class {} is not supported by the table format".format(obj.__class__.__name__))
+
+    # the index refers to the sites, it is rebuilt when needed (see __getstate__)
+    attrs = {k: v for k, v in hp.__dict__.items() if k not in ['sites', '_tmpos', '_index']}
+    if '_tmpos' in hp.__dict__:
+        attrs['_tmpos_path'] = _tmpo_path(hp._tmpos)
+
+    return {'format': 'houseprint',
+            'version': TABLE_FORMAT_VERSION,
+            'attrs': attrs,
+            'sites': _table(sites, _TABLE_REFS['sites']),
+            'devices': _table(devices, _TABLE_REFS['devices'],
+                              site=[site_rows[id(device.site)] for device in devices]),
+            'sensors': _table(sensors, _TABLE_REFS['sensors'],
+                              device=[device_rows[id(sensor.device)] for sensor in sensors])}
+
+
+def _from_table(table):
+    """
+    Create the objects of a table, without calling their __init__
+    """
+    objects = []
+    columns = table['columns']
+    for classname, row in zip(table['class'], table['rows']):
+        obj = _TABLE_CLASSES[classname].__new__(_TABLE_CLASSES[classname])
+        obj.__dict__.update(zip(columns, row))
+        objects.append(obj)
+    return objects
+
+
+def _from_tables(hp, tables):
+    """
+    Return the list of sites of houseprint hp from its tables,
+    with all back-references between sites, devices and sensors
+    """
+    sites = _from_table(tables['sites'])
+    for site in sites:
+        site.hp = hp
+        site.devices = []
+        site._tmpos = None
+
+    devices = _from_table(tables['devices'])
+    for device, row in zip(devices, tables['devices']['site']):
+        device.site = sites[row]
+        device.sensors = []
+        device.site.devices.append(device)
+
+    sensors = _from_table(tables['sensors'])
+    for sensor, row in zip(sensors, tables['sensors']['device']):
+        sensor.device = devices[row]
+        sensor.site = sensor.device.site
+        sensor._tmpos = None
+        sensor.device.sensors.append(sensor)
+
+    return sites
 
 
 def load_houseprint_from_file(filename, pickle_format='jsonpickle'):
@@ -603,16 +1014,30 @@ def load_houseprint_from_file(filename, pickle_format='jsonpickle'):
     ----------
     filename : str
     pickle_format : str
-        'jsonpickle' or 'pickle'
+        'jsonpickle', 'pickle' or 'table'
         pickle may be more robust, but jsonpickle should be compatible
-        across python versions
+        across python versions.
+        With 'table', the sites, devices and sensors are only created when
+        they are first used.
     """
     if pickle_format == 'jsonpickle':
+        import jsonpickle
         with open(filename, 'r') as f:
             hp = jsonpickle.decode(f.read())
     elif pickle_format == 'pickle':
         with open(filename, 'rb') as f:
             hp = pickle.load(file=f)
+    elif pickle_format == 'table':
+        with open(filename, 'rb') as f:
+            tables = pickle.load(file=f)
+        if not isinstance(tables, dict) or tables.get('format') != 'houseprint':
+            raise ValueError("{} is not a houseprint in table format".format(filename))
+        if tables['version'] > TABLE_FORMAT_VERSION:
+            raise ValueError("Houseprint table format version {} is not supported".format(tables['version']))
+        hp = Houseprint(empty_init=True)
+        del hp.__dict__['sites']
+        hp.__dict__.update(tables['attrs'])
+        hp._tables = tables
     else:
         raise NotImplementedError("Pickle format '{}' is not supported".format(pickle_format))
 
@@ -9,9 +9,12 @@ This class contains all metadata concerning the function and type of the sensor
 """
 
 from opengrid_dev.library import misc
-from opengrid_dev import ureg
+import opengrid_dev
+import json
+import zlib
+import numpy as np
 import pandas as pd
-import tmpo, sqlite3
+import sqlite3
 
 
 class Sensor(object):
@@ -30,6 +33,15 @@ class Sensor(object):
         self.tariff = tariff
         self.cumulative = cumulative
 
+    def __setattr__(self, name, value):
+        super(Sensor, self).__setattr__(name, value)
+        if name in ['type', 'system']:
+            # the houseprint looks up sensors by type and system
+            site = getattr(getattr(self, 'device', None), 'site', None) or getattr(self, 'site', None)
+            hp = getattr(site, 'hp', None)
+            if hp is not None:
+                hp._reset_index()
+
     def __repr__(self):
         return """
     {}
@@ -143,30 +155,7 @@ class Sensor(object):
             if diff:
                 raise NotImplementedError("Differentiation always needs a sampled dataframe")
 
-        # get the source
-        if not self.type == 'gas':
-            if not diff:
-                source = self.unit
-            else:
-                # differentiation. Careful, this is a hack of the unit system.
-                # we have to take care manually of some corner cases
-                if self.unit:
-                    source = self.unit + '/' + resample
-                else:
-                    source = self.unit
-
-            return misc.unit_conversion_factor(source, target)
-        else:
-            # for gas, we need to take into account the calorific value
-            # as of now, we use 10 kWh/l by default
-            CALORIFICVALUE = 10
-            q_src = 1 * ureg(self.unit)
-            q_int = q_src * ureg('Wh/liter')
-            if not diff:
-                source = str(q_int.units)  # string representing the unit, mostly kWh
-            else:
-                source = str(q_int.units) + '/' + resample
-            return CALORIFICVALUE * misc.unit_conversion_factor(source, target)
+        return _conversion_factor(self.unit, self.type == 'gas', bool(diff), resample, target)
 
     def last_timestamp(self, epoch=False):
         """
@@ -185,6 +174,72 @@ class Sensor(object):
         """
         raise NotImplementedError("Subclass must implement abstract method")
 
+    def first_timestamp(self, epoch=False):
+        """
+        Get the first timestamp for a sensor
+
+        Parameters
+        ----------
+        epoch : bool
+            default False
+            If True return as epoch
+            If False return as pd.Timestamp
+
+        Returns
+        -------
+        pd.Timestamp | int
+        """
+        raise NotImplementedError("Subclass must implement abstract method")
+
+    def get_data_chunked(self, head=None, tail=None, freq='D', overlap=None, tz='UTC', **kwargs):
+        """
+        Yield Pandas Series with measurement data, one for each chunk of time
+        between head and tail.  This way, a long history can be processed in
+        bounded memory.
+
+        Each chunk is obtained with get_data for the chunk extended by overlap
+        on both sides (but not beyond tail), and then truncated to the chunk.  With sufficient
+        overlap, the interpolation and differentiation at the edges of a chunk
+        are the same as when obtaining all data at once.
+
+        Parameters
+        ----------
+        head, tail : timestamps
+            Begin and end of the interval.  If head is None, start at the first
+            timestamp of the sensor, if tail is None, end now.
+        freq : str, default='D'
+            Pandas frequency string for the chunks, eg. 'D', 'W', 'MS'
+            Chunks start at midnight (in timezone tz).
+        overlap : pd.Timedelta or str, optional
+            Time by which a chunk is extended to obtain its data. It should be
+            larger than the longest interval between two measurements.
+            If None, use two resample intervals, with a minimum of 1 hour.
+        tz : str, default='UTC'
+            Specify the timezone for the index of the returned series and for the chunks
+        kwargs : dict
+            Additional keyword arguments are passed to get_data (diff, resample, unit)
+
+        Yields
+        ------
+        Pandas Series
+        """
+        if head is None:
+            head = self.first_timestamp()
+            if head is None:
+                return
+        overlap = _overlap(overlap, kwargs.get('resample', 'min'))
+
+        for start, end, last in _time_chunks(head, tail, freq, tz):
+            ts = self.get_data(head=start - overlap, tail=end if last else end + overlap, tz=tz, **kwargs)
+            if ts.empty:
+                continue
+            unit = getattr(ts, 'unit', None)
+            ts = ts[(ts.index >= start) & (last | (ts.index < end))]
+            if ts.empty:
+                continue
+            ts.unit = unit
+            yield ts
+
 
 class Fluksosensor(Sensor):
     def __init__(self, key=None, token=None, device=None, type=None,
@@ -303,24 +358,13 @@ class Fluksosensor(Sensor):
 
         if resample != 'raw':
 
-            if resample == 'hour':
-                rule = 'H'
-            elif resample == 'day':
-                rule = 'D'
-            else:
-                rule = resample
-
-            # interpolate to requested frequency
-            newindex = data.resample(rule).first().index
-            data = data.reindex(data.index.union(newindex))
-            data = data.interpolate(method='time')
-            data = data.reindex(newindex)
+            rule = _resample_rule(resample)
 
             if diff == 'default':
                 diff = self.cumulative
 
-            if diff:
-                data = data.diff()
+            # interpolate to requested frequency
+            data = misc.resample_interpolate(data, rule, diff=diff)
 
         # unit conversion
         if unit == 'default':
@@ -349,3 +393,338 @@ class Fluksosensor(Sensor):
         """
         tmpos = self.site.hp.get_tmpos()
         return tmpos.last_timestamp(sid=self.key, epoch=epoch)
+
+    def first_timestamp(self, epoch=False):
+        """
+            Get the first timestamp for a sensor
+            It is the start of the first block, the actual first sensor stamp may be later
+
+            Parameters
+            ----------
+            epoch : bool
+                default False
+                If True return as epoch
+                If False return as pd.Timestamp
+
+            Returns
+            -------
+            pd.Timestamp | int
+        """
+        return self.tmpos.first_timestamp(sid=self.key, epoch=epoch)
+
+
+# conversion factors by (unit, gas, diff, resample, target), see _conversion_factor
+_CONVERSION_FACTORS = {}
+
+
+def _conversion_factor(unit, gas, diff, resample, target):
+    """
+    Return the factor to convert data in unit to target, see
+    Sensor._unit_conversion_factor.  The factors are computed with pint only
+    once, and then looked up.
+
+    Parameters
+    ----------
+    unit : str
+        Unit of the sensor
+    gas : bool
+        If True, convert volume to energy with the calorific value
+    diff : bool
+    resample : str
+    target : str
+
+    Returns
+    -------
+    cf : float
+    """
+    key = (unit, gas, diff, resample, target)
+    try:
+        return _CONVERSION_FACTORS[key]
+    except KeyError:
+        pass
+
+    # get the source
+    if not gas:
+        if not diff:
+            source = unit
+        else:
+            # differentiation. Careful, this is a hack of the unit system.
+            # we have to take care manually of some corner cases
+            if unit:
+                source = unit + '/' + resample
+            else:
+                source = unit
+
+        cf = misc.unit_conversion_factor(source, target)
+    else:
+        # for gas, we need to take into account the calorific value
+        # as of now, we use 10 kWh/l by default
+        CALORIFICVALUE = 10
+        ureg = opengrid_dev.get_ureg()
+        q_src = 1 * ureg(unit)
+        q_int = q_src * ureg('Wh/liter')
+        if not diff:
+            source = str(q_int.units)  # string representing the unit, mostly kWh
+        else:
+            source = str(q_int.units) + '/' + resample
+        cf = CALORIFICVALUE * misc.unit_conversion_factor(source, target)
+
+    _CONVERSION_FACTORS[key] = cf
+    return cf
+
+
+def prewarm_unit_conversion(sensors, resamples=('min', 'hour', 'day'), units=('default',)):
+    """
+    Compute the unit conversion factors of the sensors in advance, for the
+    given sampling rates and target units, with and without differentiation.
+
+    Sensors with the same type and unit share their conversion factors, so
+    this only takes time for each distinct combination.
+
+    Parameters
+    ----------
+    sensors : list(Sensor)
+    resamples : list(str)
+    units : list(str)
+        Target units, 'default' for the default unit of each sensor
+
+    Returns
+    -------
+    int : the number of conversion factors that are known
+    """
+    done = set()
+    for sensor in sensors:
+        if (sensor.type, sensor.unit) in done:
+            continue
+        done.add((sensor.type, sensor.unit))
+        for resample in resamples:
+            for diff in [False, True]:
+                for unit in units:
+                    try:
+                        sensor._unit_conversion_factor(diff=diff, resample=resample, target=unit)
+                    except Exception:
+                        # incompatible units are reported when the data is requested
+                        pass
+    return len(_CONVERSION_FACTORS)
+
+
+def _resample_rule(resample):
+    """
+    Return the pandas frequency string for the resample argument of get_data
+    """
+    if resample == 'hour':
+        return 'H'
+    elif resample == 'day':
+        return 'D'
+    else:
+        return resample
+
+
+def _overlap(overlap, resample):
+    """
+    Return the overlap for get_data_chunked as pd.Timedelta
+    """
+    if overlap is not None:
+        return pd.Timedelta(overlap)
+    if resample == 'raw':
+        return pd.Timedelta(0)
+    try:
+        step = pd.Timedelta(pd.tseries.frequencies.to_offset(_resample_rule(resample)))
+    except ValueError:
+        # no fixed duration, eg. months
+        step = pd.Timedelta(days=31)
+    return max(2 * step, pd.Timedelta(hours=1))
+
+
+def _time_chunks(head, tail, freq, tz):
+    """
+    Split the interval between head and tail in chunks
+
+    Returns
+    -------
+    list of tuples (start, end, last) with tz-aware pd.Timestamps
+    and last=True for the last chunk.
+    """
+    def parse(t):
+        t = misc.parse_date(t)
+        if t.tz is None:
+            t = t.tz_localize('UTC')
+        return t.tz_convert(tz)
+
+    head = parse(head)
+    tail = parse(pd.Timestamp.now(tz='UTC') if tail is None else tail)
+    if head >= tail:
+        return []
+
+    edges = [t for t in pd.date_range(start=head.normalize(), end=tail, freq=freq) if head < t < tail]
+    edges = [head] + edges + [tail]
+    return [(start, end, end == tail) for start, end in zip(edges[:-1], edges[1:])]
+
+
+def _epochs(t, default):
+    """
+    Return t as int epoch (seconds), like tmpo does for head and tail
+    """
+    if t is None:
+        return default
+    if isinstance(t, int):
+        return t
+    return int(np.floor(misc.parse_date(t).value / 1e9))
+
+
+# All blocks of the last recycle id of the given sensors that overlap with [head, tail]
+# The order of the blocks within a sensor is the same as in tmpo.Session.series
+SQL_TMPO_BLOCKS = """
+    SELECT sid, lvl, bid, ext, data
+    FROM tmpo AS t
+    WHERE sid IN ({})
+    AND rid = (SELECT MAX(rid) FROM tmpo WHERE sid = t.sid)
+    AND bid <= ? AND bid + (1 << lvl) > ?
+    ORDER BY sid, rid ASC, lvl DESC, bid ASC"""
+
+
+def _read_tmpo_blocks(tmpos, sids, head, tail):
+    """
+    Read the raw data of several sensors from the tmpo database in a single pass
+
+    Returns
+    -------
+    dict with sensor key: (timestamps, values), both numpy arrays.
+    The timestamps are int epochs in seconds.
+    """
+    blocks = dict((sid, []) for sid in sids)
+    dbcon = sqlite3.connect(tmpos.db)
+    try:
+        # sqlite limits the number of parameters of a query
+        for i in range(0, len(sids), 500):
+            chunk = sids[i:i + 500]
+            sql = SQL_TMPO_BLOCKS.format(', '.join('?' * len(chunk)))
+            for sid, lvl, bid, ext, data in dbcon.execute(sql, chunk + [tail, head]):
+                if ext != 'gz':
+                    raise NotImplementedError("Compression type not supported in tmpo")
+                # a block is gzipped json: a header and the deltas of timestamps and values
+                blk = json.loads(zlib.decompress(data, zlib.MAX_WBITS | 16).decode('utf-8'))
+                t = np.cumsum(np.array(blk['t'], dtype=np.int64)) + blk['h']['head'][0]
+                v = np.cumsum(np.array(blk['v'], dtype=float)) + blk['h']['head'][1]
+                keep = (t >= head) & (t <= tail)
+                blocks[sid].append((t[keep], v[keep]))
+    finally:
+        dbcon.close()
+
+    res = {}
+    for sid, blks in blocks.items():
+        if not blks:
+            continue
+        t = np.concatenate([b[0] for b in blks])
+        v = np.concatenate([b[1] for b in blks])
+        if len(t) > 1 and (np.diff(t) < 0).any():
+            order = np.argsort(t, kind='mergesort')
+            t, v = t[order], v[order]
+        res[sid] = (t, v)
+    return res
+
+
+def get_bulk_data(sensors, head=None, tail=None, diff='default', resample='min', unit='default', tz='UTC'):
+    """
+    Return a Pandas Dataframe with joined data for the given sensors
+
+    The result is the same as concatenating the series obtained with
+    sensor.get_data for each sensor, but the tmpo database is read in a
+    single pass for all sensors, and all sensors are interpolated to a
+    single target index in a preallocated array.
+    If resample is 'raw' or not all sensors are Fluksosensors sharing a
+    tmpo session, the data is obtained sensor by sensor.
+
+    Parameters
+    ----------
+    sensors : list of Sensor objects
+    head, tail: timestamps
+        Can be epoch, datetime of pd.Timestamp, with our without timezone (default=UTC)
+    diff : bool or 'default'
+        If True, the original data will be differentiated
+        If 'default', the sensor will decide: if it has the attribute
+        cumulative==True, the data will be differentiated.
+    resample : str (default='min')
+        Sampling rate, if any.  Use 'raw' if no resampling.
+    unit : str , default='default'
+        String representation of the target unit, eg m**3/h, kW, ...
+    tz : str, default='UTC'
+        Specify the timezone for the index of the returned dataframe
+
+    Returns
+    -------
+    Pandas DataFrame
+    """
+    bulk = resample != 'raw' and bool(sensors) and all(isinstance(sensor, Fluksosensor) for sensor in sensors)
+    if bulk:
+        tmpos = [sensor.tmpos for sensor in sensors]
+        bulk = all(t is tmpos[0] for t in tmpos)
+
+    if not bulk:
+        series = [sensor.get_data(head=head, tail=tail, diff=diff, resample=resample, unit=unit, tz=tz)
+                  for sensor in sensors]
+    else:
+        raw = _read_tmpo_blocks(tmpos[0], [sensor.key for sensor in sensors],
+                                head=_epochs(head, 0), tail=_epochs(tail, 2147483647))
+        raw = dict((key, (t, v)) for key, (t, v) in raw.items() if not np.isnan(v).all())
+        series = []
+
+    if bulk and raw:
+        # the target index for all sensors, from the first to the last timestamp
+        first = min(t[0] for t, v in raw.values())
+        last = max(t[-1] for t, v in raw.values())
+        bounds = pd.to_datetime([first, last], unit='s', utc=True).tz_convert(tz)
+        newindex = pd.Series(index=bounds, data=[0., 0.]).resample(_resample_rule(resample)).first().index
+        xnew = newindex.asi8
+
+        data = np.full((len(newindex), len(raw)), np.nan)
+        rows = np.zeros(len(newindex), dtype=bool)
+        columns = []
+        units = []
+        for sensor in sensors:
+            if sensor.key not in raw:
+                continue
+            t, v = raw[sensor.key]
+            x = t * 10 ** 9
+            # the part of the target index covered by this sensor
+            i0 = np.searchsorted(xnew, x[0], side='right') - 1
+            i1 = np.searchsorted(xnew, x[-1], side='right')
+            rows[i0:i1] = True
+
+            col = data[i0:i1, len(columns)]
+            col[:] = misc.interpolate_epochs(x, v, xnew[i0:i1])
+            sensor_diff = sensor.cumulative if diff == 'default' else diff
+            if sensor_diff:
+                col[1:] = np.diff(col)
+                col[0] = np.nan
+            sensor_unit = sensor._get_default_unit(diff=sensor_diff, resample=resample) if unit == 'default' else unit
+            col *= sensor._unit_conversion_factor(diff=sensor_diff, resample=resample, target=sensor_unit)
+
+            columns.append(sensor.key)
+            units.append(sensor_unit)
+
+        df = pd.DataFrame(data=data[rows], index=newindex[rows], columns=columns)
+        for key, sensor_unit in zip(columns, units):
+            try:
+                df[key].unit = sensor_unit
+            except:
+                pass
+        return df
+
+    # workaround for https://github.com/pandas-dev/pandas/issues/12985
+    series = [s for s in series if not s.empty]
+
+    if series:
+        df = pd.concat(series, axis=1)
+    else:
+        df = pd.DataFrame()
+
+    # Add unit as string to each series in the df.  This is not persistent: the attribute unit will get
+    # lost when doing operations with df, but at least it can be checked once.
+    for s in series:
+        try:
+            df[s.name].unit = s.unit
+        except:
+            pass
+
+    return df
@@ -2,6 +2,8 @@ __author__ = 'Jan Pecinovsky'
 
 import pandas as pd
 
+from .sensor import get_bulk_data
+
 """
 A Site is a physical entity (a house, appartment, school, or other building).
 It may contain multiple devices and sensors.
@@ -70,7 +72,7 @@ class Site(object):
         """
         return [sensor for sensor in self.sensors if sensor.type == sensortype or sensortype is None]
 
-    def get_data(self, sensortype=None, head=None, tail=None, diff='default', resample='min', unit='default'):
+    def get_data(self, sensortype=None, head=None, tail=None, diff='default', resample='min', unit='default', bulk=False):
         """
         Return a Pandas Dataframe with the joined data for all sensors in this device
 
@@ -90,12 +92,17 @@ class Site(object):
             Sampling rate, if any.  Use 'raw' if no resampling.
         unit : str , default='default'
             String representation of the target unit, eg m**3/h, kW, ...
+        bulk : bool, default=False
+            If True, read the data of all sensors from tmpo in a single pass
+            and interpolate them to a common index (see get_bulk_data)
 
         Returns
         -------
         Pandas DataFrame
         """
         sensors = self.get_sensors(sensortype)
+        if bulk:
+            return get_bulk_data(sensors, head=head, tail=tail, diff=diff, resample=resample, unit=unit)
         series = [sensor.get_data(head=head, tail=tail, diff=diff, resample=resample, unit=unit) for sensor in sensors]
 
         # workaround for https://github.com/pandas-dev/pandas/issues/12985
@@ -124,4 +131,6 @@ class Site(object):
         """
 
         device.site = self
-        self.devices.append(device)
\ No newline at end of file
+        self.devices.append(device)
+        if self.hp is not None:
+            self.hp._add_to_index(device)
\ No newline at end of file
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for reading the data of several sensors at once with get_bulk_data,
+and for reading data in chunks with get_data_chunked.
+The data is written as tmpo blocks in a temporary tmpo database.
+"""
+
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from opengrid_dev.library.houseprint import houseprint, Site, Fluksometer, Fluksosensor
+
+
+def gzip_block(t, v):
+    """Return a gzipped tmpo block with timestamps t and values v"""
+    blk = {"h": {"head": [int(t[0]), float(v[0])], "tail": [int(t[-1]), float(v[-1])]},
+           "t": [0] + np.diff(t).tolist(),
+           "v": [0.] + np.diff(v).tolist()}
+    compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return compressor.compress(json.dumps(blk, separators=(',', ':')).encode('utf-8')) + compressor.flush()
+
+
+class TmpoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+        self.hp = houseprint.Houseprint(empty_init=True)
+        site = Site(key=1)
+        self.hp.add_site(site)
+        self.device = Fluksometer(key='FL01', mastertoken='token')
+        site.add_device(self.device)
+        self.device.add_sensor(Fluksosensor(key='elec', token='', device=self.device, type='electricity'))
+        self.device.add_sensor(Fluksosensor(key='temp', token='', device=self.device, type='temperature'))
+        self.device.add_sensor(Fluksosensor(key='nodata', token='', device=self.device, type='water'))
+        self.hp.init_tmpo(path_to_tmpo_data=self.folder)
+
+        np.random.seed(0)
+        self._write_sensor('elec', 1458950000, 3 * 3600, cumulative=True)
+        self._write_sensor('temp', 1458950000 + 5000, 3 * 3600, cumulative=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write_sensor(self, sid, start, duration, cumulative):
+        t = start + np.cumsum(np.random.randint(1, 30, size=duration // 15))
+        v = np.random.rand(len(t))
+        if cumulative:
+            v = np.cumsum(v)
+        v[5] = np.nan
+        dbcon = sqlite3.connect(self.hp.get_tmpos().db)
+        # blocks of level 8 (256 seconds)
+        for bid in np.unique(t // 256 * 256):
+            mask = (t >= bid) & (t < bid + 256)
+            dbcon.execute("INSERT INTO tmpo (sid, rid, lvl, bid, ext, created, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (sid, 0, 8, int(bid), 'gz', 0., sqlite3.Binary(gzip_block(t[mask], v[mask]))))
+        dbcon.commit()
+        dbcon.close()
+
+
+class BulkDataTest(TmpoTestCase):
+
+    def _compare(self, **kwargs):
+        expected = self.hp.get_data(**kwargs)
+        result = self.hp.get_data(bulk=True, **kwargs)
+        self.assertListEqual(result.columns.tolist(), expected.columns.tolist())
+        self.assertTrue(result.index.equals(expected.index))
+        np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+        return result
+
+    def test_bulk_data(self):
+        """Same result as concatenating the data of each sensor"""
+        df = self._compare()
+        self.assertListEqual(df.columns.tolist(), ['elec', 'temp'])
+
+        self._compare(resample='hour')
+        self._compare(diff=False, unit='kWh', sensortype='electricity')
+        self._compare(head=pd.Timestamp('20160326 01:00:00', tz='UTC'), tail=1458950000 + 8000)
+
+    def test_bulk_data_device(self):
+        """Bulk data for a device"""
+        expected = self.device.get_data()
+        result = self.device.get_data(bulk=True)
+        np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+
+    def test_bulk_data_raw(self):
+        """Raw data is obtained sensor by sensor"""
+        self._compare(resample='raw', diff=False)
+
+    def test_bulk_data_empty(self):
+        """Return an empty dataframe if there is no data"""
+        df = self.hp.get_data(bulk=True, sensors=self.hp.search_sensors(key='nodata'))
+        self.assertTrue(df.empty)
+
+        # no sensors at all
+        self.assertTrue(self.hp.get_data(bulk=True, sensors=[]).empty)
+
+
+class ChunkedDataTest(TmpoTestCase):
+
+    def _compare(self, sensor, freq, **kwargs):
+        head = pd.Timestamp('20160325 23:00:00', tz='UTC')
+        tail = pd.Timestamp('20160326 04:00:00', tz='UTC')
+        expected = sensor.get_data(head=head, tail=tail, **kwargs)
+        chunks = list(sensor.get_data_chunked(head=head, tail=tail, freq=freq, **kwargs))
+        self.assertGreater(len(chunks), 1)
+        result = pd.concat(chunks)
+        self.assertTrue(result.index.equals(expected.index))
+        np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+        self.assertEqual(chunks[0].unit, expected.unit)
+
+    def test_sensor_chunks(self):
+        """Concatenated chunks are the same as the data obtained at once"""
+        elec = self.hp.find_sensor('elec')
+        self._compare(elec, freq='H')
+        self._compare(elec, freq='30min', diff=False, unit='kWh')
+        self._compare(self.hp.find_sensor('temp'), freq='H')
+        self._compare(elec, freq='H', resample='raw', diff=False)
+
+    def test_sensor_chunks_head(self):
+        """Without head, start at the first timestamp of the sensor"""
+        elec = self.hp.find_sensor('elec')
+        chunks = list(elec.get_data_chunked(tail=1458950000 + 3 * 3600, freq='H'))
+        self.assertEqual(chunks[0].index[0], elec.get_data().index[0])
+        self.assertEqual(list(self.hp.find_sensor('nodata').get_data_chunked()), [])
+
+    def test_houseprint_chunks(self):
+        """Chunked dataframes of the houseprint"""
+        expected = self.hp.get_data(tail=1458950000 + 4 * 3600)
+        chunks = list(self.hp.get_data_chunked(tail=1458950000 + 4 * 3600, freq='H'))
+        result = pd.concat(chunks)
+        self.assertListEqual(result.columns.tolist(), expected.columns.tolist())
+        self.assertTrue(result.index.equals(expected.index))
+        np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for the lookup tables of the houseprint used by find_* and search_*
+"""
+
+import pickle
+import unittest
+
+from opengrid_dev.library.houseprint import houseprint, Site, Fluksometer, Fluksosensor
+
+
+class HouseprintIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hp = houseprint.Houseprint(empty_init=True)
+        for i, system in enumerate(['grid', 'solar', 'grid']):
+            site = Site(key=i + 1)
+            self.hp.add_site(site)
+            device = Fluksometer(key='FL0{}'.format(i), mastertoken='token')
+            site.add_device(device)
+            device.add_sensor(Fluksosensor(key='Elec{}'.format(i), token='', device=device, type='electricity'))
+            device.add_sensor(Fluksosensor(key='gas{}'.format(i), token='', device=device, type='gas'))
+            device.sensors[0].system = system
+
+    def test_find(self):
+        """Find sites, devices and sensors by key"""
+        self.assertIs(self.hp.find_site(2), self.hp.sites[1])
+        self.assertIsNone(self.hp.find_site(4))
+        self.assertIs(self.hp.find_device('fl01'), self.hp.sites[1].devices[0])
+        self.assertIs(self.hp.find_sensor('ELEC2'), self.hp.sites[2].sensors[0])
+        self.assertIsNone(self.hp.find_sensor('elec3'))
+
+    def test_search(self):
+        """Search gives the same result as checking all sensors"""
+        self.assertEqual([s.key for s in self.hp.search_sensors(type='gas')], ['gas0', 'gas1', 'gas2'])
+        self.assertEqual([s.key for s in self.hp.search_sensors(type='elec', system='solar')], ['Elec1'])
+        self.assertEqual([s.key for s in self.hp.search_sensors(key='1')], ['Elec1', 'gas1'])
+        self.assertEqual(self.hp.search_sensors(type='water'), [])
+        self.assertEqual(self.hp.search_sites(key=3), [self.hp.sites[2]])
+        self.assertEqual(self.hp.search_sites(key=3, size=100), [])
+
+    def test_search_order(self):
+        """Sensors are found in the order of get_sensors, also if they are added later"""
+        self.hp.find_sensor('gas0')
+        device = self.hp.sites[0].devices[0]
+        device.add_sensor(Fluksosensor(key='gas3', token='', device=device, type='gas'))
+        keys = [s.key for s in self.hp.get_sensors() if 'gas' in s.type]
+        self.assertEqual(keys, ['gas0', 'gas3', 'gas1', 'gas2'])
+        self.assertEqual([s.key for s in self.hp.search_sensors(type='gas')], keys)
+
+    def test_search_changed(self):
+        """Sensors are found by their current type and system"""
+        self.hp.search_sensors(type='gas')
+        self.hp.sites[1].sensors[1].type = 'water'
+        self.hp.sites[2].sensors[0].system = 'solar'
+        self.assertEqual([s.key for s in self.hp.search_sensors(type='gas')], ['gas0', 'gas2'])
+        self.assertEqual([s.key for s in self.hp.search_sensors(type='water')], ['gas1'])
+        self.assertEqual([s.key for s in self.hp.search_sensors(system='solar')], ['Elec1', 'Elec2'])
+
+    def test_add(self):
+        """Sites, devices and sensors added later can be found"""
+        self.hp.find_sensor('gas0')
+        device = Fluksometer(key='FL03', mastertoken='token')
+        device.add_sensor(Fluksosensor(key='water3', token='', device=device, type='water'))
+        site = Site(key=4)
+        site.add_device(device)
+        self.hp.add_site(site)
+        self.assertIs(self.hp.find_site(4), site)
+        self.assertIs(self.hp.find_device('FL03'), device)
+        self.assertIs(self.hp.find_sensor('water3'), device.sensors[0])
+        self.assertEqual(self.hp.search_sensors(type='water'), device.sensors)
+
+        device.add_sensor(Fluksosensor(key='water4', token='', device=device, type='water'))
+        self.assertIs(self.hp.find_sensor('water4'), device.sensors[1])
+
+    def test_reset(self):
+        """The lookup tables are not pickled, and are rebuilt when the sites are replaced"""
+        self.hp.find_sensor('gas0')
+        hp = pickle.loads(pickle.dumps(self.hp))
+        self.assertNotIn('_index', hp.__dict__)
+        self.assertEqual(hp.find_sensor('gas0').key, 'gas0')
+
+        self.hp.sites = self.hp.sites[:1]
+        self.assertIsNone(self.hp.find_sensor('gas1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for saving and loading a houseprint in the table format.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from opengrid_dev.library.houseprint import houseprint, Site, Fluksometer, Fluksosensor
+
+
+def make_houseprint(n_sites=3, n_devices=2, n_sensors=3):
+    """Return a houseprint with n_sites, each with n_devices with n_sensors"""
+    hp = houseprint.Houseprint(empty_init=True)
+    types = ['electricity', 'gas', 'water', 'temperature']
+    for i in range(n_sites):
+        site = Site(key=i + 1, size=100 + i, inhabitants=i % 5, postcode=9000 + i,
+                    construction_year=1950, k_level='', e_level=80.5, epc_cert=102.27)
+        hp.add_site(site)
+        for j in range(n_devices):
+            device = Fluksometer(key='FL{:04d}{:02d}'.format(i, j), mastertoken='token{}'.format(j))
+            site.add_device(device)
+            for k in range(n_sensors):
+                device.add_sensor(Fluksosensor(key='{:04d}{:02d}{:02d}'.format(i, j, k), token='',
+                                               device=device, type=types[k % len(types)],
+                                               description='sensor {}'.format(k)))
+    return hp
+
+
+class HouseprintTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'hp.pkl')
+        self.hp = make_houseprint()
+        self.hp.save(self.filename, pickle_format='table')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_roundtrip(self):
+        """All attributes and references are restored"""
+        hp = houseprint.load_houseprint_from_file(self.filename, pickle_format='table')
+        self.assertEqual(hp.timestamp, self.hp.timestamp)
+
+        for site, expected in zip(hp.sites, self.hp.sites):
+            self.assertIs(site.hp, hp)
+            self.assertIsInstance(site, Site)
+            self.assertEqual(site.__dict__.keys(), expected.__dict__.keys())
+            self.assertEqual(site.epc_cert, expected.epc_cert)
+        self.assertEqual(len(hp.sites), 3)
+
+        sensors, expected = hp.get_sensors(), self.hp.get_sensors()
+        self.assertEqual(len(sensors), 18)
+        for sensor, exp in zip(sensors, expected):
+            self.assertIsInstance(sensor, Fluksosensor)
+            self.assertIs(sensor.site, sensor.device.site)
+            self.assertIn(sensor, sensor.device.sensors)
+            for attr in ['key', 'token', 'type', 'unit', 'cumulative', 'description']:
+                self.assertEqual(getattr(sensor, attr), getattr(exp, attr))
+        self.assertEqual([d.key for d in hp.get_devices()], [d.key for d in self.hp.get_devices()])
+        self.assertEqual(hp.find_sensor('00010002').device.key, 'FL000100')
+
+    def test_lazy(self):
+        """The objects are only created when the sites are needed"""
+        hp = houseprint.load_houseprint_from_file(self.filename, pickle_format='table')
+        self.assertIn('_tables', hp.__dict__)
+        self.assertNotIn('sites', hp.__dict__)
+        self.assertEqual(len(hp.sites), 3)
+        self.assertNotIn('_tables', hp.__dict__)
+
+    def test_pickle_lazy(self):
+        """A houseprint can be pickled before its objects are created"""
+        hp = houseprint.load_houseprint_from_file(self.filename, pickle_format='table')
+        hp = pickle.loads(pickle.dumps(hp))
+        self.assertEqual(len(hp.get_sensors()), 18)
+
+    def test_index(self):
+        """The index built by a search before saving is not saved, but rebuilt after loading"""
+        self.hp.find_sensor('00010002')
+        self.hp.save(self.filename, pickle_format='table')
+        self.assertNotIn('_index', houseprint._to_tables(self.hp)['attrs'])
+
+        hp = houseprint.load_houseprint_from_file(self.filename, pickle_format='table')
+        sensor = hp.find_sensor('00010002')
+        self.assertIn(sensor, hp.get_sensors())
+        self.assertIs(sensor.site.hp, hp)
+
+    def test_invalid(self):
+        """Other files or newer versions raise a ValueError"""
+        self.hp.save(self.filename, pickle_format='pickle')
+        self.assertRaises(ValueError, houseprint.load_houseprint_from_file, self.filename, pickle_format='table')
+
+        tables = houseprint._to_tables(self.hp)
+        tables['version'] = houseprint.TABLE_FORMAT_VERSION + 1
+        with open(self.filename, 'wb') as f:
+            pickle.dump(tables, f)
+        self.assertRaises(ValueError, houseprint.load_houseprint_from_file, self.filename, pickle_format='table')
+
+
+if __name__ == '__main__':
+    unittest.main()
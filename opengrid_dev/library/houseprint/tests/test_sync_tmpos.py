@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for Houseprint.sync_tmpos against a local stub of the Flukso API.
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+
+import tmpo
+from requests.exceptions import HTTPError
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from opengrid_dev.library.houseprint import houseprint, Site, Fluksometer, Fluksosensor
+
+BLOCK = {"rid": 0, "lvl": 8, "bid": 1458950144, "ext": "gz"}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FluksoStub(BaseHTTPRequestHandler):
+    """
+    Stub of the Flukso tmpo API.
+    Every sensor has a single block, except sensor 'bad' (always a server
+    error) and sensor 'flaky' (a server error on the first request only).
+    """
+    delay = 0.2
+    requests = []
+
+    def do_GET(self):
+        sid = self.path.split('/')[2]
+        FluksoStub.requests.append(self.path)
+        time.sleep(self.delay)
+        if sid == 'bad' or (sid == 'flaky' and len([p for p in FluksoStub.requests if '/flaky/' in p]) == 1):
+            self.send_response(500)
+            self.end_headers()
+        elif self.path.split('?')[0].endswith('/sync'):
+            # only return the block if it was not synced before
+            blocks = [] if 'bid={}'.format(BLOCK['bid']) in self.path else [BLOCK]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(blocks).encode('ascii'))
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/gzip')
+            self.end_headers()
+            self.wfile.write(b'block')
+
+    def log_message(self, *args):
+        pass
+
+
+class SyncTmposTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FluksoStub)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.api = tmpo.API_TMPO_SYNC, tmpo.API_TMPO_BLOCK
+        tmpo.API_TMPO_SYNC = "http://%s/sensor/%s/tmpo/sync"
+        tmpo.API_TMPO_BLOCK = "http://%s/sensor/%s/tmpo/%d/%d/%d"
+
+    @classmethod
+    def tearDownClass(cls):
+        tmpo.API_TMPO_SYNC, tmpo.API_TMPO_BLOCK = cls.api
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FluksoStub.requests = []
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _houseprint(self, keys):
+        hp = houseprint.Houseprint(empty_init=True)
+        site = Site(key=1)
+        hp.add_site(site)
+        device = Fluksometer(key='FL01', mastertoken='token')
+        site.add_device(device)
+        for key in keys:
+            device.add_sensor(Fluksosensor(key=key, token='', device=device, type='electricity'))
+        hp.init_tmpo(path_to_tmpo_data=self.folder)
+        hp.get_tmpos().host = '127.0.0.1:{}'.format(self.server.server_port)
+        return hp
+
+    def test_sync_concurrent(self):
+        """Sync sensors concurrently and report the timing per sensor"""
+        keys = ['s1', 's2', 's3', 's4']
+        hp = self._houseprint(keys)
+
+        start = time.time()
+        report = hp.sync_tmpos(n_jobs=4)
+        # each sensor does 2 requests of 0.2 s
+        self.assertLess(time.time() - start, 4 * 2 * FluksoStub.delay)
+
+        self.assertListEqual(sorted(report.index), keys)
+        self.assertTrue((report['seconds'] >= 2 * FluksoStub.delay).all())
+        self.assertTrue(report['error'].isnull().all())
+        for blocks in hp.get_tmpos().list(*keys):
+            self.assertEqual(len(blocks), 1)
+
+    def test_sync_sessions_closed(self):
+        """The tmpo sessions of the threads are closed, with their thread pools"""
+        hp = self._houseprint(['s1', 's2', 's3', 's4'])
+        sessions = []
+
+        class Session(tmpo.Session):
+            def __init__(self, *args, **kwargs):
+                super(Session, self).__init__(*args, **kwargs)
+                sessions.append(self)
+
+        tmpo.Session, session = Session, tmpo.Session
+        try:
+            hp.sync_tmpos(n_jobs=4)
+        finally:
+            tmpo.Session = session
+
+        self.assertGreater(len(sessions), 0)
+        for tmpos in sessions:
+            self.assertTrue(tmpos.rqs.executor._shutdown)
+            self.assertIsNone(tmpos.dbcon)
+
+    def test_sync_retry(self):
+        """A failing sensor is retried"""
+        hp = self._houseprint(['flaky'])
+        report = hp.sync_tmpos(n_jobs=2, retries=1, backoff=0.01)
+        self.assertEqual(report.loc['flaky', 'attempts'], 2)
+        self.assertIsNone(report.loc['flaky', 'error'])
+        self.assertEqual(len(hp.get_tmpos().list('flaky')[0]), 1)
+
+    def test_sync_retry_default(self):
+        """A failing sensor is retried by default when syncing concurrently"""
+        hp = self._houseprint(['flaky'])
+        report = hp.sync_tmpos(n_jobs=1)
+        self.assertEqual(report.loc['flaky', 'attempts'], 1)
+        self.assertIsNotNone(report.loc['flaky', 'error'])
+
+        FluksoStub.requests = []
+        report = hp.sync_tmpos(n_jobs=2, backoff=0.01)
+        self.assertEqual(report.loc['flaky', 'attempts'], 2)
+        self.assertIsNone(report.loc['flaky', 'error'])
+
+    def test_sync_http_errors(self):
+        """Http errors are raised, warned or ignored, also when syncing concurrently"""
+        for n_jobs in [1, 2]:
+            hp = self._houseprint(['s1', 'bad'])
+            self.assertRaises(HTTPError, hp.sync_tmpos, http_errors='raise', n_jobs=n_jobs, backoff=0.01)
+
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                report = hp.sync_tmpos(http_errors='warn', n_jobs=n_jobs, backoff=0.01)
+                self.assertEqual(len(w), 1)
+            self.assertIsInstance(report.loc['bad', 'error'], HTTPError)
+
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                hp.sync_tmpos(http_errors='ignore', n_jobs=n_jobs, backoff=0.01)
+                self.assertEqual(len(w), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
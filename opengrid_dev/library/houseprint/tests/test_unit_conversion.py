@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for the unit conversion factors of sensors
+"""
+
+import unittest
+
+import numpy as np
+
+from opengrid_dev.library.houseprint import houseprint, sensor, Site, Fluksometer, Fluksosensor
+
+
+class UnitConversionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.hp = houseprint.Houseprint(empty_init=True)
+        site = Site(key=1)
+        self.hp.add_site(site)
+        device = Fluksometer(key='FL01', mastertoken='token')
+        site.add_device(device)
+        for key, sensortype in [('elec1', 'electricity'), ('elec2', 'electricity'),
+                                ('gas', 'gas'), ('water', 'water'), ('temp', 'temperature')]:
+            device.add_sensor(Fluksosensor(key=key, token='', device=device, type=sensortype))
+        sensor._CONVERSION_FACTORS.clear()
+
+    def test_conversion_factors(self):
+        """The factors are computed once and looked up afterwards"""
+        elec = self.hp.find_sensor('elec1')
+        np.testing.assert_almost_equal(elec._unit_conversion_factor(diff=True, resample='min', target='kW'), 0.06)
+        np.testing.assert_almost_equal(elec._unit_conversion_factor(diff=False, resample='hour', target='kWh'), 1e-3)
+        np.testing.assert_almost_equal(self.hp.find_sensor('gas')._unit_conversion_factor(diff=True, resample='hour'),
+                                       10.)
+        self.assertEqual(len(sensor._CONVERSION_FACTORS), 3)
+
+        # sensors with the same unit share the factors
+        self.hp.find_sensor('elec2')._unit_conversion_factor(diff=True, resample='min', target='kW')
+        self.assertEqual(len(sensor._CONVERSION_FACTORS), 3)
+
+        self.assertRaises(NotImplementedError, elec._unit_conversion_factor, diff=True, resample='raw')
+
+    def test_prewarm(self):
+        """Prewarming computes the factors of all distinct units"""
+        n = self.hp.prewarm_unit_conversion(resamples=['min', 'hour'])
+        # 4 distinct (type, unit) pairs x 2 resamples x 2 diffs,
+        # except the differentiated temperature (degC/min to degC is not possible)
+        self.assertEqual(n, 14)
+        self.assertIn(('Wh', False, True, 'hour', 'W'), sensor._CONVERSION_FACTORS)
+
+
+    def test_ureg(self):
+        """The pint registry is created once"""
+        import opengrid_dev
+        ureg = opengrid_dev.get_ureg()
+        self.assertIs(opengrid_dev.get_ureg(), ureg)
+        self.assertAlmostEqual(opengrid_dev.Q_(1, 'kWh').to('Wh').magnitude, 1000)
+
+    def test_ureg_import(self):
+        """ureg and Q_ are module attributes, also on python versions without module __getattr__"""
+        import opengrid_dev
+        from opengrid_dev import ureg, Q_
+        self.assertIn('ureg', vars(opengrid_dev))
+        self.assertIn('Q_', vars(opengrid_dev))
+        self.assertAlmostEqual((1 * ureg('kWh')).to(ureg.Wh).magnitude, 1000)
+        self.assertAlmostEqual(Q_(1, 'kWh').to('Wh').magnitude, 1000)
+        self.assertIsInstance(Q_(1, 'kWh'), ureg.Quantity)
+
+
+if __name__ == '__main__':
+    unittest.main()
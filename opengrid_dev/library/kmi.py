@@ -1,5 +1,4 @@
 import requests
-import bs4
 import datetime as dt
 import pandas as pd
 from .misc import calculate_temperature_equivalent, calculate_degree_days
@@ -81,6 +80,7 @@ def parse(html, solar_duration_as_minutes=False):
     -------
     Pandas DataFrame
     """
+    import bs4
     soup = bs4.BeautifulSoup(html, "html.parser")
     day_values = soup.findAll("tbody")[1]  # the table we want is the second table called 'tbody'
     table_rows = day_values.findAll("tr")
@@ -4,7 +4,9 @@ Created on Thu Jan  7 10:31:00 2016
 
 @author: roel
 """
-from opengrid_dev import ureg
+import os
+import opengrid_dev
+import numpy as np
 import pandas as pd
 from dateutil import rrule
 import datetime as dt
@@ -59,7 +61,7 @@ def time_to_timedelta(t):
     ------
     The timezone of t (if present) is ignored.
     """
-    return pd.Timedelta(seconds=t.hour * 3600 + t.minute * 60 + t.second + t.microsecond * 1e-3)
+    return pd.Timedelta(hours=t.hour, minutes=t.minute, seconds=t.second, microseconds=t.microsecond)
 
 
 def split_by_day(df, starttime=dt.time.min, endtime=dt.time.max):
@@ -85,6 +87,135 @@ def split_by_day(df, starttime=dt.time.min, endtime=dt.time.max):
     return list_df
 
 
+def split_by_day_array(df, freq=None, starttime=dt.time.min, endtime=dt.time.max):
+    """
+    Reshape data with a regular frequency into a 3-D array with one row per
+    day, one column per time slot and one layer per sensor.
+
+    This is a fast alternative for split_by_day: statistics over days or
+    over the time of day, like quantiles, can be computed along an axis.
+
+    Parameters
+    ----------
+    df : pandas DataFrame or Series with datetimeindex
+        For a tz-aware index, days and times of day are in local time.
+    freq : str or pandas Timedelta, optional
+        Length of a time slot.  If None, use the frequency of the index, or
+        the median interval between its timestamps.
+    starttime, endtime : datetime.time objects
+        For each day, only keep the data between starttime and endtime
+
+    Returns
+    -------
+    values : numpy array with shape (days, slots, sensors)
+        NaN where there is no data, eg. for missing days or the hour that is
+        skipped when changing to summer time.  When changing to winter time,
+        only the first of the repeated hour is kept.
+    days : pandas DatetimeIndex
+        All days between the first and the last day with data
+    times : pandas TimedeltaIndex
+        The time of day of the start of each slot
+    """
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+
+    if freq is None:
+        freq = df.index.freq if df.index.freq is not None else pd.Timedelta(int(np.median(np.diff(df.index.asi8))))
+    if isinstance(freq, str):
+        freq = pd.tseries.frequencies.to_offset(freq)
+    step = pd.Timedelta(freq).value
+    start = time_to_timedelta(starttime).value
+    end = time_to_timedelta(endtime).value
+    times = pd.timedelta_range(start=pd.Timedelta(start), periods=-(-(end - start) // step), freq=pd.Timedelta(step))
+
+    # local day and time of day in int64 nanoseconds
+    index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    ns = index.asi8
+    day = ns // (86400 * 10 ** 9)
+    time_of_day = ns - day * 86400 * 10 ** 9
+    mask = (time_of_day >= start) & (time_of_day < end)
+    if not mask.any():
+        return np.empty((0, len(times), len(df.columns))), pd.DatetimeIndex([], tz=df.index.tz), times
+
+    day, slot = day[mask], (time_of_day[mask] - start) // step
+    first = day[0]
+    row = day - first
+    # keep the first value for each day and slot
+    _, unique = np.unique(row * len(times) + slot, return_index=True)
+
+    values = np.full((row[-1] + 1, len(times), len(df.columns)), np.nan)
+    values[row[unique], slot[unique]] = df.values[mask][unique]
+    days = pd.date_range(start=pd.Timestamp(first * 86400 * 10 ** 9), periods=len(values), freq='D',
+                         tz=df.index.tz)
+    return values, days, times
+
+
+def interpolate_epochs(x, y, xnew):
+    """
+    Linear interpolation of values y at timestamps x to the timestamps xnew
+
+    Parameters
+    ----------
+    x : numpy array with int64 timestamps, sorted
+    y : numpy array with values, NaN values are skipped
+    xnew : numpy array with int64 timestamps, same unit as x
+
+    Returns
+    -------
+    numpy array with the interpolated values at xnew.
+    Values before the first valid value are NaN, values after the last
+    valid value equal that last value (as for pandas.Series.interpolate).
+    """
+    y = np.asarray(y, dtype=float)
+    valid = ~np.isnan(y)
+    x = x[valid]
+    y = y[valid]
+
+    if len(x) == 0:
+        return np.full(len(xnew), np.nan)
+
+    # interpolate relative to the first timestamp to keep float precision
+    data = np.interp((xnew - x[0]).astype(float), (x - x[0]).astype(float), y)
+    data[xnew < x[0]] = np.nan
+    return data
+
+
+def resample_interpolate(ts, rule, diff=False):
+    """
+    Resample a timeseries to a regular frequency by linear interpolation in time
+
+    This gives the same result as reindexing ts to the resampled index,
+    followed by ts.interpolate(method='time'), but works directly on the
+    int64 timestamps without creating intermediate copies of ts.
+
+    Parameters
+    ----------
+    ts : pandas Series with DatetimeIndex
+        Sorted timeseries, eg. a cumulative counter.  NaN values are skipped.
+    rule : str
+        Pandas frequency string of the resampled index, eg. 'min', 'H', 'D'
+    diff : bool, default=False
+        If True, return the difference between consecutive resampled values
+
+    Returns
+    -------
+    pandas Series with the resampled index.
+    Values before the first valid value of ts are NaN, values after the
+    last valid value of ts equal that last value.
+    """
+    # the resampled index only depends on the first and last timestamp
+    newindex = ts.iloc[[0, -1]].resample(rule).first().index
+    data = interpolate_epochs(ts.index.asi8, ts.values, newindex.asi8)
+
+    if diff:
+        data[1:] = np.diff(data)
+        data[0] = np.nan
+
+    return pd.Series(data=data, index=newindex, name=ts.name)
+
+
 def unit_conversion_factor(source, target):
     """
     Shorthand function to get a conversion factor for unit conversion.
@@ -100,14 +231,25 @@ def unit_conversion_factor(source, target):
         Conversion factor. Multiply the source value with this factor to
         get the target value.  Works only for factorial conversion!
 
+    Notes
+    -----
+    The factors are computed once for each pair of units, and then looked up.
     """
 
     if not source or not target:
         return 1
     if source == target:
         return 1
-    else:
-        return 1 * ureg(source).to(target).magnitude
+    try:
+        return _UNIT_CONVERSION_FACTORS[(source, target)]
+    except KeyError:
+        cf = 1 * opengrid_dev.get_ureg()(source).to(target).magnitude
+        _UNIT_CONVERSION_FACTORS[(source, target)] = cf
+        return cf
+
+
+# parsing units with pint is slow: unit_conversion_factor remembers the factors
+_UNIT_CONVERSION_FACTORS = {}
 
 
 def dayset(start, end):
@@ -220,4 +362,27 @@ def last_midnight(timezone):
     now = dt.datetime.now(tz=tz)
     midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    return midnight
\ No newline at end of file
+    return midnight
+
+
+def replace_file(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists
+
+    Used for atomic writes: write to a temporary file, then replace the target.
+    os.rename does not replace an existing file on Windows.
+
+    Parameters
+    ----------
+    src : str
+    dst : str
+    """
+    try:
+        replace = os.replace
+    except AttributeError:
+        # python 2 has no os.replace, and its os.rename only replaces on posix
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+    else:
+        replace(src, dst)
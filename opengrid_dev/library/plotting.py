@@ -4,6 +4,7 @@ Created on Wed Nov 26 18:03:24 2014
 
 @author: KDB
 """
+import warnings
 import numpy as np
 import pandas as pd
 import datetime as dt
@@ -12,6 +13,8 @@ import matplotlib.cm as cm
 from matplotlib.dates import date2num, num2date, HourLocator, DayLocator, AutoDateLocator, DateFormatter
 from matplotlib.colors import LogNorm
 
+from opengrid_dev.library import misc
+
 
 def carpet(timeseries, **kwargs):
     """
@@ -50,21 +53,18 @@ def carpet(timeseries, **kwargs):
     vmin = max(0.1, kwargs.pop('vmin', ts[ts > 0].min()))
     vmax = max(vmin, kwargs.pop('vmax', ts.quantile(.999)))
 
-    # convert to dataframe with date as index and time as columns by
-    # first replacing the index by a MultiIndex
+    # convert to an array with a row per day and a column per minute
     # tz_convert('UTC'): workaround for https://github.com/matplotlib/matplotlib/issues/3896
-    mpldatetimes = date2num(ts.index.tz_convert('UTC').to_pydatetime())
-    ts.index = pd.MultiIndex.from_arrays(
-        [np.floor(mpldatetimes), 2 + mpldatetimes % 1])  # '2 +': matplotlib bug workaround.
-    # and then unstacking the second index level to columns
-    df = ts.unstack()
+    values, days, times = misc.split_by_day_array(ts.tz_convert('UTC'), freq='min')
+    dates = date2num(days.to_pydatetime())
+    hours = 2 + np.asarray(times / pd.Timedelta(days=1))  # '2 +': matplotlib bug workaround.
 
     # data plotting
 
     fig, ax = plt.subplots()
     # define the extent of the axes (remark the +- 0.5  for the y axis in order to obtain aligned date ticks)
-    extent = [df.columns[0], df.columns[-1], df.index[-1] + 0.5, df.index[0] - 0.5]
-    im = plt.imshow(df, vmin=vmin, vmax=vmax, extent=extent, cmap=cmap, aspect='auto', norm=norm,
+    extent = [hours[0], hours[-1], dates[-1] + 0.5, dates[0] - 0.5]
+    im = plt.imshow(values[:, :, 0], vmin=vmin, vmax=vmax, extent=extent, cmap=cmap, aspect='auto', norm=norm,
                     interpolation=interpolation, **kwargs)
 
     # figure formatting
@@ -118,8 +118,8 @@ def fanchart(timeseries, **kwargs):
         If None, the name of the timeseries is used if defined.
     """
 
-    start_hour = 2. + kwargs.pop('start_hour', 0.) / 24.
-    end_hour = 2. + kwargs.pop('end_hour', 24.) / 24.
+    start_hour = kwargs.pop('start_hour', 0.)
+    end_hour = kwargs.pop('end_hour', 24.)
     ylabel = kwargs.pop('ylabel', timeseries.name if timeseries.name else '')
     title = kwargs.pop('title', 'carpet plot: ' + timeseries.name if timeseries.name else '')
     # data preparation
@@ -128,33 +128,39 @@ def fanchart(timeseries, **kwargs):
         return
     ts = timeseries.resample('min', label='left', closed='left').mean()
 
-    # convert to dataframe with date as index and time as columns by
-    # first replacing the index by a MultiIndex
+    # convert to an array with a row per day and a column per minute between start_hour and end_hour (inclusive)
     # tz_convert('UTC'): workaround for https://github.com/matplotlib/matplotlib/issues/3896
-    mpldatetimes = date2num(ts.index.tz_convert('UTC').to_pydatetime())
-    ts.index = pd.MultiIndex.from_arrays(
-        [np.floor(mpldatetimes), 2 + mpldatetimes % 1])  # '2 +': matplotlib bug workaround.
-    # and then unstacking the second index level to columns
-    df = ts.unstack()
-    df = df.T.truncate(start_hour, end_hour)
+    starttime = (dt.datetime.min + dt.timedelta(hours=start_hour)).time()
+    if end_hour >= 24:
+        endtime = dt.time.max
+    else:
+        endtime = (dt.datetime.min + dt.timedelta(hours=end_hour, microseconds=1)).time()
+    values, days, times = misc.split_by_day_array(ts.tz_convert('UTC'), freq='min', starttime=starttime,
+                                                  endtime=endtime)
+    values = values[:, :, 0]
+    dates = date2num(days.to_pydatetime())
 
     num = 20
     num_max = 4
-    df_quant = df.quantile(np.linspace(0., 1., 2 * num + 1))
+    with warnings.catch_warnings():
+        # days without data in the period give NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quantiles = np.nanquantile(values, np.linspace(0., 1., 2 * num + 1), axis=1)
+        mean = np.nanmean(values, axis=1)
 
     # data plotting
 
     fig, ax = plt.subplots()
-    im = plt.plot(df.columns, df_quant.iloc[num], 'b', label='median')
+    im = plt.plot(dates, quantiles[num], 'b', label='median')
     for i in range(1, num):
-        plt.fill_between(df.columns, df_quant.iloc[num - i], df_quant.iloc[min(num + i, 2 * num - num_max)], color='b',
+        plt.fill_between(dates, quantiles[num - i], quantiles[min(num + i, 2 * num - num_max)], color='b',
                          alpha=0.05)
-    plt.plot(df.columns, df.mean(), 'k--', label='mean')
+    plt.plot(dates, mean, 'k--', label='mean')
     plt.legend()
 
     # x axis
     ax.xaxis_date()
-    plt.xlim(df.columns[0], df.columns[-1])
+    plt.xlim(dates[0], dates[-1])
     plt.ylabel(ylabel)
 
     # plot title
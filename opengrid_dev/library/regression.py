@@ -1,13 +1,10 @@
 from opengrid_dev.library import analysis
 import logging
-from scipy import stats
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-import statsmodels.formula.api as fm
-from statsmodels.sandbox.regression.predstd import wls_prediction_std
-from copy import deepcopy
+
+# statsmodels, scipy and matplotlib take seconds to import: they are imported
+# in the methods that need them, so importing this module stays cheap.
 
 
 class MVLinReg(analysis.Analysis):
@@ -51,10 +48,13 @@ class MVLinReg(analysis.Analysis):
             If a list with column names is given, only try these columns as exogenous variables
         confint : float, default=0.05
             Two-sided confidence interval for predictions.
-        cross_validation : bool, default=False
-            If True, compute the model based on cross-validation (leave one out)
-            Only possible if the df has less than 15 entries.
-            Note : this will take much longer computation times!
+        cross_validation : bool or str, default=False
+            If True or 'loo', select the model based on leave-one-out cross-validation
+            If 'kfold', based on k-fold cross-validation with randomly (but reproducibly) assigned folds
+            If 'blocked', based on k-fold cross-validation with folds of consecutive rows,
+            for time series where neighbouring rows are correlated
+        n_folds : int, default=5
+            Number of folds for 'kfold' and 'blocked' cross-validation
         allow_negative_predictions : bool, default=False
             If True, allow predictions to be negative.
             For gas consumption or PV production, this is not physical so allow_negative_predictions should be False
@@ -67,6 +67,7 @@ class MVLinReg(analysis.Analysis):
         self.list_of_exog = kwargs.get('list_of_exog', self.df.columns.tolist())
         self.confint = kwargs.get('confint', 0.05)
         self.cross_validation = kwargs.get('cross_validation', False)
+        self.n_folds = kwargs.get('n_folds', 5)
         self.allow_negative_predictions = kwargs.get('allow_negative_predictions', False)
         try:
             self.list_of_exog.remove(self.endog)
@@ -92,97 +93,103 @@ class MVLinReg(analysis.Analysis):
         Find the best model (fit) and create self.list_of_fits and self.fit
 
         """
+        import statsmodels.formula.api as fm
+
+        # the candidate models are evaluated by _ForwardSelection, only the
+        # selected models are fitted with statsmodels
+        selection = _ForwardSelection(self.df, self.endog, self.list_of_exog)
 
-        self.list_of_fits = []
         # first model is just the mean
-        self.list_of_fits.append(fm.ols(formula='{} ~ 1'.format(self.endog), data=self.df).fit())
+        list_of_exog = [[]]
         # try to improve the model until no improvements can be found
         all_exog = self.list_of_exog[:]
         while all_exog:
-            # try each x in all_exog and overwrite the best_fit if we find a better one
-            # the first best_fit is the one from the previous round
-            best_fit = deepcopy(self.list_of_fits[-1])
-            for x in all_exog:
-                # make new_fit, compare with best found so far
-                formula = self.list_of_fits[-1].model.formula + '+{}'.format(x)
-                fit = fm.ols(formula=formula, data=self.df).fit()
-                best_fit = self.find_best_bic([best_fit, fit])
+            # try each x in all_exog, the best one is added if it gives a lower BIC
+            exog = list_of_exog[-1]
+            bic = selection.bic_of_additions(exog, all_exog)
+            best = np.argmin(bic)
+            if bic[best] < selection.fit(exog)['bic']:
+                exog = exog + [all_exog[best]]
 
             # Sometimes, the obtained fit may be better, but contains unsignificant parameters.
             # Correct the fit by removing the unsignificant parameters and estimate again
-            best_fit = self._prune(best_fit, p_max=self.p_max)
+            pvalues = selection.fit(exog)['pvalues'][1:]
+            exog = [x for x, p in zip(exog, pvalues) if not p > self.p_max]
 
-            # if best_fit does not contain more variables than last fit in self.list_of_fits, exit
-            if best_fit.model.formula in self.list_of_fits[-1].model.formula:
+            # if the model does not contain more variables than the last one, exit
+            if self._formula(exog) in self._formula(list_of_exog[-1]):
                 break
             else:
-                self.list_of_fits.append(best_fit)
-                all_exog.remove(x)
+                list_of_exog.append(exog)
+                # as before, the last candidate is removed rather than the one that was added
+                # (which gives an identical model if it is tried again)
+                all_exog.pop()
+
+        self.list_of_fits = [fm.ols(formula=self._formula(exog), data=self.df).fit() for exog in list_of_exog]
         self.fit = self.list_of_fits[-1]
 
+    def _formula(self, exog):
+        """Return the formula of a model with the exogenous variables exog"""
+        return '{} ~ 1'.format(self.endog) + ''.join('+{}'.format(x) for x in exog)
+
 
     def _do_analysis_cross_validation(self):
         """
-        Find the best model (fit) based on cross-valiation (leave one out)
+        Find the best model (fit) based on cross-validation
+
+        The cross-validation error of a model is the mean absolute error of
+        the predictions for the left-out rows.  It is computed from a single
+        fit on all rows: the residuals of left-out rows follow from the hat
+        matrix (PRESS residuals for leave-one-out).
 
         """
-        assert len(self.df) < 15, "Cross-validation is not implemented if your sample contains more than 15 datapoints"
+        import statsmodels.formula.api as fm
 
-        # initialization: first model is the mean, but compute cv correctly.
-        errors = []
-        formula = '{} ~ 1'.format(self.endog)
-        for i in self.df.index:
-            # make new_fit, compute cross-validation and store error
-            df_ = self.df.drop(i, axis=0)
-            fit = fm.ols(formula=formula, data=df_).fit()
-            cross_prediction = self._predict(fit=fit, df=self.df.loc[[i], :])
-            errors.append(cross_prediction['predicted'] - cross_prediction[self.endog])
+        selection = _ForwardSelection(self.df, self.endog, self.list_of_exog)
+        folds = self._folds()
+        clip = not self.allow_negative_predictions
 
-        self.list_of_fits = [fm.ols(formula=formula, data=self.df).fit()]
-        self.list_of_cverrors = [np.mean(np.abs(np.array(errors)))]
+        # initialization: first model is the mean
+        list_of_exog = [[]]
+        self.list_of_cverrors = [selection.cv_error([], folds=folds, clip=clip)]
 
         # try to improve the model until no improvements can be found
         all_exog = self.list_of_exog[:]
         while all_exog:
-            #import pdb;pdb.set_trace()
-            # try each x in all_exog and overwrite if we find a better one
-            # at the end of iteration (and not earlier), save the best of the iteration
-            better_model_found = False
-            best = dict(fit=self.list_of_fits[-1], cverror=self.list_of_cverrors[-1])
+            # try each x in all_exog and keep the one with the lowest cross-validation error
+            best = dict(exog=None, cverror=self.list_of_cverrors[-1])
             for x in all_exog:
-                formula = self.list_of_fits[-1].model.formula + '+{}'.format(x)
-                # cross_validation, currently only implemented for monthly data
-                # compute the mean error for a given formula based on leave-one-out.
-                errors = []
-                for i in self.df.index:
-                    # make new_fit, compute cross-validation and store error
-                    df_ = self.df.drop(i, axis=0)
-                    fit = fm.ols(formula=formula, data=df_).fit()
-                    cross_prediction = self._predict(fit=fit, df=self.df.loc[[i], :])
-                    errors.append(cross_prediction['predicted'] - cross_prediction[self.endog])
-                cverror = np.mean(np.abs(np.array(errors)))
+                exog = list_of_exog[-1] + [x] if x not in list_of_exog[-1] else list_of_exog[-1]
+                cverror = selection.cv_error(exog, folds=folds, clip=clip)
                 # compare the model with the current fit
-                if  cverror < best['cverror']:
-                    # better model, keep it
-                    # first, reidentify using all the datapoints
-                    best['fit'] = fm.ols(formula=formula, data=self.df).fit()
-                    best['cverror'] = cverror
-                    better_model_found = True
-
-            if better_model_found:
-                self.list_of_fits.append(best['fit'])
+                if cverror < best['cverror']:
+                    best = dict(exog=exog, cverror=cverror)
+
+            if best['exog'] is not None:
+                list_of_exog.append(best['exog'])
                 self.list_of_cverrors.append(best['cverror'])
             else:
                 # if we did not find a better model, exit
                 break
 
-            # next iteration with the found exog removed
-            all_exog.remove(x)
+            # next iteration with the added variable removed
+            all_exog.remove(best['exog'][-1])
 
+        self.list_of_fits = [fm.ols(formula=self._formula(exog), data=self.df).fit() for exog in list_of_exog]
         self.fit = self.list_of_fits[-1]
 
-
-
+    def _folds(self):
+        """
+        Return an array with the fold of each row of self.df, or None for leave-one-out
+        """
+        if self.cross_validation in [True, 'loo']:
+            return None
+        n = len(self.df)
+        if self.cross_validation == 'kfold':
+            return np.random.RandomState(0).permutation(n) % self.n_folds
+        elif self.cross_validation == 'blocked':
+            return np.arange(n) * self.n_folds // n
+        raise ValueError("Unknown cross_validation: {}".format(self.cross_validation))
 
     def _prune(self, fit, p_max):
         """
@@ -202,6 +209,7 @@ class MVLinReg(analysis.Analysis):
             Won't contain any insignificant parameters
 
         """
+        import statsmodels.formula.api as fm
 
         for par in fit.pvalues.where(fit.pvalues > p_max).dropna().index:
 
@@ -245,6 +253,7 @@ class MVLinReg(analysis.Analysis):
         df : pandas DataFrame
             same as df with additional columns 'predicted', 'interval_u' and 'interval_l'
         """
+        from statsmodels.sandbox.regression.predstd import wls_prediction_std
 
 
         confint = kwargs.get('confint', self.confint)
@@ -306,6 +315,7 @@ class MVLinReg(analysis.Analysis):
         figures : List of plt.figure objects.
 
         """
+        import matplotlib.pyplot as plt
         figures = []
         fit = kwargs.get('fit', self.fit)
         df = kwargs.get('df', self.df)
@@ -392,6 +402,7 @@ class LinearRegression(analysis.Analysis):
         super(LinearRegression, self).__init__(df=df, *args, **kwargs)
 
     def do_analysis(self, *args, **kwargs):
+        from scipy import stats
         df = self._calculate_regression_data()
         slope, self.intercept, r_value, self.p_value, self.std_err = stats.linregress(
             df.independent, df.dependent)
@@ -521,6 +532,7 @@ class LinearRegression(analysis.Analysis):
         -------
         matplotlib figure
         """
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax1 = fig.add_subplot(111)
 
@@ -819,7 +831,7 @@ class LinearRegression3(LinearRegression2):
         """
             Decide what data to use for the linear regression.
             In this case all data past the breakpoint (from Linearregression2),
-            but we iterate over them and drop values that are close to the base load.
+            but the first values (sorted by x-value) that are close to the base load are dropped.
         """
         # make a list of indices of entries that are to be excluded from the regression
         to_drop = self.df[self.df.independent <= self.breakpoint].sort_values(by='independent').index.tolist()
@@ -828,15 +840,11 @@ class LinearRegression3(LinearRegression2):
         res = super(LinearRegression3, self)._calculate_regression_data()
 
         if self.base_load is not None:
-            # sort by x-value and iterate
-            for entry in res.sort_values(by='independent').iterrows():
-                # if the y value is smaller than the percentage of the baseload
-                if entry[1].dependent < self.base_load * (1 + self.percentage):
-                    # add the entry to the list to be dropped
-                    to_drop.append(entry[0])
-                else:
-                    # if not, end the loop
-                    break
+            # sort by x-value and drop the entries up to the first one with a y value
+            # that is not smaller than the percentage of the baseload
+            res = res.sort_values(by='independent')
+            close = np.logical_and.accumulate(res.dependent.values < self.base_load * (1 + self.percentage))
+            to_drop.extend(res.index[close])
 
             # if we want to include the last value of the base load in the regression, remove it from the todrop list
             if self.include_end_of_base_load and len(to_drop) > 0:
@@ -846,3 +854,365 @@ class LinearRegression3(LinearRegression2):
         res = self.df.drop(to_drop)
 
         return res
+
+
+class LinearRegressionBreakpoint(LinearRegression2):
+    """
+    Calculate a linear regression with baseload like LinearRegression2, with the breakpoint that fits the data best
+
+    All candidate breakpoints are evaluated in a single pass over the sorted data: the sums of x, y, x², xy and y²
+    below and above every breakpoint follow from cumulative sums.  The best breakpoint is the one with the smallest
+    sum of squared errors of the baseload (mean of y below the breakpoint) and the regression line (above the
+    breakpoint), among those with a positive slope.  The analysis is then that of LinearRegression2 with this
+    breakpoint, so all attributes and scores are available.
+
+    Examples
+    --------
+
+    >> lr = LinearRegressionBreakpoint(heating_degree_days, gas, breakpoints=np.arange(0, 10, 0.5))
+    >> lr.breakpoint, lr.base_load, lr.slope, lr.score_total(max_spacing=20, expected_observations=12)
+    """
+
+    def __init__(self, independent, dependent, breakpoints=None, min_points=3, *args, **kwargs):
+        """
+        Parameters
+        ----------
+        independent : pandas.Series
+        dependent : pandas.Series
+        breakpoints : array of int | float, optional
+            candidate breakpoints, by default every value of independent (but the largest ones)
+        min_points : int, default=3
+            minimal number of points above the breakpoint for the regression
+        """
+        self.breakpoints = breakpoints
+        self.min_points = min_points
+        super(LinearRegressionBreakpoint, self).__init__(independent=independent,
+                                                         dependent=dependent,
+                                                         breakpoint=None, *args,
+                                                         **kwargs)
+
+    def do_analysis(self, *args, **kwargs):
+        self.breakpoints, self.sse = _breakpoint_sse(self.df.independent.values, self.df.dependent.values,
+                                                     breakpoints=self.breakpoints, min_points=self.min_points)
+        if not np.isfinite(self.sse).any():
+            raise ValueError("No breakpoint with enough data and a positive slope")
+        self.breakpoint = self.breakpoints[np.argmin(self.sse)]
+        super(LinearRegressionBreakpoint, self).do_analysis(*args, **kwargs)
+
+
+def _breakpoint_sse(x, y, breakpoints=None, min_points=3):
+    """
+    Return the sum of squared errors of the fit of LinearRegression2 for every candidate breakpoint
+
+    Parameters
+    ----------
+    x, y : numpy arrays
+    breakpoints : array, optional
+        if None, every value of x that has at least one larger value
+    min_points : int
+        minimal number of points above the breakpoint
+
+    Returns
+    -------
+    breakpoints : numpy array
+    sse : numpy array
+        inf for breakpoints without points below, less than min_points above or a negative slope
+    """
+    order = np.argsort(x, kind='mergesort')
+    # centered, so the differences of cumulative sums do not lose precision
+    xs = x[order] - np.mean(x)
+    ys = y[order] - np.mean(y)
+    n = len(xs)
+
+    if breakpoints is None:
+        k = np.flatnonzero(xs[:-1] < xs[1:]) + 1
+        breakpoints = x[order][k - 1]
+    else:
+        breakpoints = np.asarray(breakpoints, dtype=float)
+        k = np.searchsorted(xs, breakpoints - np.mean(x), side='right')
+
+    def cumsum(values):
+        return np.concatenate([[0.], np.cumsum(values)])
+
+    # sums of the points below (up to and including) the breakpoint
+    sums = [cumsum(values) for values in [xs, ys, xs * xs, xs * ys, ys * ys]]
+    sx, sy, sxx, sxy, syy = [c[k] for c in sums]
+    # and of the points above the breakpoint
+    tx, ty, txx, txy, tyy = [c[-1] - c[k] for c in sums]
+    n_below, n_above = k, n - k
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sse_below = syy - sy ** 2 / n_below
+        vxx = txx - tx ** 2 / n_above
+        vxy = txy - tx * ty / n_above
+        sse_above = tyy - ty ** 2 / n_above - vxy ** 2 / vxx
+        slope = vxy / vxx
+        valid = (n_below > 0) & (n_above >= max(min_points, 2)) & (vxx > 1e-12 * np.maximum(txx, 1e-300)) & (slope >= 0)
+    sse = np.where(valid, sse_below + sse_above, np.inf)
+    return breakpoints, sse
+
+class _ForwardSelection(object):
+    """
+    Numeric engine for the forward selection of MVLinReg.
+
+    The design matrix of all candidate variables is built once.  Adding a
+    candidate to a model is evaluated with a single Gram-Schmidt step on the
+    QR decomposition of that model, for all candidates at once, instead of
+    fitting a new model per candidate.  The statistics are those of a
+    statsmodels ols fit with intercept: rows with missing values in the
+    variables of a model are left out of that model.
+    """
+
+    def __init__(self, df, endog, exog):
+        self.exog = list(exog)
+        not_numeric = [x for x in [endog] + self.exog if not pd.api.types.is_numeric_dtype(df[x])]
+        if not_numeric:
+            raise ValueError("Only numeric variables are supported, not {} (use pd.get_dummies for categorical "
+                             "variables)".format(', '.join(not_numeric)))
+        self.y = df[endog].values.astype(float)
+        self.X = df[self.exog].values.astype(float).reshape(len(df), len(self.exog))
+        self.notnull = ~np.isnan(self.X)
+        self.notnull_y = ~np.isnan(self.y)
+        self._fits = {}
+
+    def _columns(self, exog):
+        return [self.exog.index(x) for x in exog]
+
+    def _mask(self, columns):
+        return self.notnull_y & self.notnull[:, columns].all(axis=1)
+
+    def _design(self, columns, mask):
+        return np.column_stack([np.ones(mask.sum()), self.X[mask][:, columns]])
+
+    @staticmethod
+    def _bic(ssr, nobs, k):
+        llf = -nobs / 2. * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+        return -2 * llf + np.log(nobs) * k
+
+    def fit(self, exog):
+        """
+        Fit the model with intercept and the variables in exog
+
+        Returns
+        -------
+        dict with params, bse, pvalues (intercept first), ssr, nobs, bic and aic
+        """
+        key = tuple(exog)
+        if key not in self._fits:
+            from scipy import stats
+
+            mask = self._mask(self._columns(exog))
+            design = self._design(self._columns(exog), mask)
+            y = self.y[mask]
+            nobs, k = design.shape
+            q, r = np.linalg.qr(design)
+            params = np.linalg.solve(r, q.T.dot(y))
+            ssr = np.sum((y - design.dot(params)) ** 2)
+            df_resid = nobs - k
+            with np.errstate(divide='ignore', invalid='ignore'):
+                r_inv = np.linalg.inv(r)
+                bse = np.sqrt(ssr / df_resid * np.sum(r_inv ** 2, axis=1))
+                pvalues = 2 * stats.t.sf(np.abs(params / bse), df_resid)
+                bic = self._bic(ssr, nobs, k)
+            self._fits[key] = dict(params=params, bse=bse, pvalues=pvalues, ssr=ssr, nobs=nobs,
+                                   bic=bic, aic=bic - (np.log(nobs) - 2) * k)
+        return self._fits[key]
+
+    def cv_error(self, exog, folds=None, clip=True):
+        """
+        Return the cross-validation error (mean absolute error of the
+        predictions for the left-out rows) of the model with exog
+
+        The residual of the left-out rows of a fold F are (I - H_FF)^-1 e_F,
+        with e the residuals and H the hat matrix of the fit on all rows.
+        For leave-one-out, this is e_i / (1 - h_ii).
+
+        Parameters
+        ----------
+        exog : list of str
+        folds : array of int, optional
+            The fold of each row, if None: leave-one-out
+        clip : bool, default=True
+            Set negative predictions to 0
+
+        Returns
+        -------
+        float, NaN if a variable in exog is missing in a row with a known
+        endog: all models are compared on the same rows
+        """
+        mask = self._mask(self._columns(exog))
+        if (mask != self.notnull_y).any():
+            return np.nan
+        design = self._design(self._columns(exog), mask)
+        y = self.y[mask]
+        q, r = np.linalg.qr(design)
+        resid = y - q.dot(q.T.dot(y))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if folds is None:
+                cv_resid = resid / (1 - np.sum(q ** 2, axis=1))
+            else:
+                folds = np.asarray(folds)[mask]
+                cv_resid = np.empty_like(resid)
+                for fold in np.unique(folds):
+                    rows = folds == fold
+                    q_fold = q[rows]
+                    try:
+                        cv_resid[rows] = np.linalg.solve(np.eye(rows.sum()) - q_fold.dot(q_fold.T), resid[rows])
+                    except np.linalg.LinAlgError:
+                        cv_resid[rows] = np.inf
+
+        predicted = y - cv_resid
+        if clip:
+            predicted = np.maximum(predicted, 0)
+        return np.mean(np.abs(predicted - y))
+
+    def bic_of_additions(self, exog, candidates):
+        """
+        Return an array with the BIC of the model with exog + [x] for each x
+        in candidates.  Adding a variable that is already in exog, or that is
+        a linear combination of exog, gives the BIC of exog itself.
+        """
+        columns = self._columns(exog)
+        mask = self._mask(columns)
+        current = self.fit(exog)
+        bic = np.full(len(candidates), current['bic'])
+
+        design = self._design(columns, mask)
+        q, r = np.linalg.qr(design)
+        resid = self.y[mask] - q.dot(q.T.dot(self.y[mask]))
+        nobs, k = design.shape
+
+        new = [i for i, x in enumerate(candidates) if x not in exog]
+        new_columns = self._columns([candidates[i] for i in new])
+        # candidates with missing values in other rows than the model are fitted separately
+        same_rows = self.notnull[mask][:, new_columns].all(axis=0)
+        for i, column, same in zip(new, new_columns, same_rows):
+            if not same:
+                bic[i] = self.fit(exog + [candidates[i]])['bic']
+        new = [i for i, same in zip(new, same_rows) if same]
+        new_columns = [c for c, same in zip(new_columns, same_rows) if same]
+        if not new:
+            return bic
+
+        # orthogonalize the candidates on the model: the part of y they explain is removed from the residuals
+        x = self.X[mask][:, new_columns]
+        x_orth = x - q.dot(q.T.dot(x))
+        xx = np.sum(x_orth ** 2, axis=0)
+        independent = xx > 1e-10 * np.maximum(np.sum(x ** 2, axis=0), 1e-300)
+        ssr = current['ssr'] - np.where(independent, x_orth.T.dot(resid) ** 2 / np.where(independent, xx, 1), 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bic[new] = np.where(independent, self._bic(ssr, nobs, k + 1), current['bic'])
+        return bic
+
+
+def _summarize(mv):
+    """
+    Return a Series with the selected variables, coefficients and goodness of fit of a MVLinReg
+
+    The cverror is the cross-validation error of the selected model, leave-one-out
+    if the model was not selected by cross-validation.
+    """
+    fit = mv.fit
+    exog = [x for x in fit.params.index if x != 'Intercept']
+    if mv.cross_validation:
+        cverror = mv.list_of_cverrors[-1]
+    else:
+        cverror = _ForwardSelection(mv.df, mv.endog, exog).cv_error(exog, clip=not mv.allow_negative_predictions)
+    summary = pd.Series(dict(nobs=int(fit.nobs), variables='+'.join(exog), rsquared=fit.rsquared,
+                             rsquared_adj=fit.rsquared_adj, bic=fit.bic, cverror=cverror))
+    return pd.concat([summary, fit.params])
+
+
+def _fit_model(series, exog, endog, rule, end, min_nobs, kwargs):
+    """Fit a MVLinReg on a single series, return the summary (nobs only if there is not enough data)"""
+    data = pd.concat([series.rename(endog), exog], axis=1).dropna()
+    if rule is not None:
+        data = data.resample(rule=rule).sum()
+    if end is not None:
+        data = data.loc[:end]
+    if len(data) < min_nobs:
+        return pd.Series(dict(nobs=len(data)))
+    return _summarize(MVLinReg(data, endog, **kwargs))
+
+
+# exogenous data of a worker process, see fit_models
+_worker_exog = None
+
+
+def _init_worker(exog):
+    global _worker_exog
+    _worker_exog = exog
+
+
+def _fit_model_in_worker(args):
+    series, endog, rule, end, min_nobs, kwargs = args
+    return series.name, _fit_model(series, _worker_exog, endog, rule, end, min_nobs, kwargs)
+
+
+def fit_models(df, exog, endog='consumption', rule=None, end=None, min_nobs=2, n_jobs=1, **kwargs):
+    """
+    Fit a MVLinReg model for every column of df, with the same exogenous variables
+
+    For each column, the rows with missing values are dropped before resampling,
+    like for a single sensor in the recipe mvreg_sensor.
+
+    Parameters
+    ----------
+    df : pandas DataFrame
+        One column per sensor, eg. the daily totals from a Cache
+    exog : pandas DataFrame
+        The exogenous variables with the same index as df, eg. Weather.days()
+    endog : str, default='consumption'
+        Name of the endogenous variable in the models.  The columns of df are
+        renamed because sensor keys are no valid variable names in a formula.
+    rule : str, optional
+        If given, resample the data of each sensor with this rule (sum), eg. 'MS' or 'W'
+    end : timestamp, optional
+        Last timestamp of the data for the models
+    min_nobs : int, default=2
+        Sensors with less rows are not modelled
+    n_jobs : int, default=1
+        Number of worker processes.  The exogenous data is sent to each worker
+        only once.  If a fit raises an error, the other workers are stopped
+        and the error is raised.
+    kwargs
+        Passed to MVLinReg, eg. p_max or cross_validation
+
+    Returns
+    -------
+    summary : pandas DataFrame
+        One row per column of df, with the number of observations (nobs), the
+        selected variables, rsquared, rsquared_adj, bic, cverror and the
+        coefficients of the model (NaN if the variable is not selected).
+        All but nobs are NaN for the columns that are not modelled, and
+        these columns are there even if no column of df is modelled.
+    """
+    if n_jobs < 1:
+        raise ValueError("n_jobs should be at least 1, got {}".format(n_jobs))
+
+    tasks = [(df[column], endog, rule, end, min_nobs, kwargs) for column in df.columns]
+    if n_jobs == 1:
+        results = [(task[0].name, _fit_model(task[0], exog, *task[1:])) for task in tasks]
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes=n_jobs, initializer=_init_worker, initargs=(exog,))
+        try:
+            results = list(pool.imap_unordered(_fit_model_in_worker, tasks))
+        except BaseException:
+            # stop the other workers instead of waiting until they have fitted all models
+            pool.terminate()
+            pool.join()
+            raise
+        else:
+            pool.close()
+            pool.join()
+
+    summary = pd.DataFrame({key: result for key, result in results}).T
+    # all columns are there, also if no sensor could be modelled
+    columns = ['nobs', 'variables', 'rsquared', 'rsquared_adj', 'bic', 'cverror']
+    summary = summary.reindex(index=df.columns, columns=columns + [c for c in summary if c not in columns])
+    for column in summary:
+        if column != 'variables':
+            summary[column] = summary[column].astype(float)
+    return summary
@@ -1,9 +1,22 @@
 __author__ = 'Jan Pecinovsky'
 
-import geocoder
-import astral
+import json
 import math
+import os
+from collections import namedtuple
+import numpy as np
 import pandas as pd
+from cached_property import cached_property
+
+from opengrid_dev import config
+from opengrid_dev.library import misc
+cfg = config.Config()
+
+NS_PER_DAY = 86400 * 10 ** 9
+
+# in-memory copy of the location cache files, by path
+_LOCATIONS = {}
+
 
 class SolarInsolation(object):
     """
@@ -11,15 +24,39 @@ class SolarInsolation(object):
         basic solar parameters (angle) based on a location and a date.
         Formulas from pveducation.org
     """
-    def __init__(self, location):
+    def __init__(self, location=None, latitude=None, longitude=None, elevation=None, cache=True):
         """
+            Either location, or latitude and longitude must be given.
+            Locations and elevations that are looked up with geocoder
+            are saved in a location cache in the data folder, so the
+            lookup is only done once.
+
             Parameters
             ----------
-            location: String
+            location: String, optional
+            latitude, longitude: float, optional
+                in degrees
+            elevation: float, optional
+                in meters, if None it is looked up
+            cache: bool (optional, default=True)
+                use the location cache or not
         """
-        self.location = geocoder.google(location)
-        self.elevation = geocoder.google(self.location.latlng, method='Elevation').elevation
-        self.astral = astral.Astral()
+        if latitude is None or longitude is None:
+            if location is None:
+                raise ValueError("Pass a location or latitude and longitude")
+            latitude, longitude, looked_up = lookup_location(location, cache=cache)
+            if elevation is None:
+                elevation = looked_up
+        elif elevation is None:
+            elevation = lookup_elevation(latitude, longitude, cache=cache)
+
+        self.location = Location(lat=latitude, lng=longitude)
+        self.elevation = elevation
+
+    @cached_property
+    def astral(self):
+        import astral
+        return astral.Astral()
 
     def _airMass(self, angleFromVertical):
         """
@@ -151,23 +188,53 @@ class SolarInsolation(object):
                                           longitude = self.location.lng)
         return math.radians(deg)
 
-    def df(self, start, end):
+    def frame(self, index):
+        """
+            Calculate the solar parameters for all timestamps at once
+
+            Parameters
+            ----------
+            index: pandas.DatetimeIndex
+                timezone-naive timestamps are considered UTC
+
+            Returns
+            -------
+            Pandas Dataframe
+                with index and columns solarElevation, solarAzimuth (in radians),
+                airMass, directIntensity and globalIrradiance (in W/m**2).
+                airMass is -1 when the sun is below the horizon.
+        """
+        elevation, azimuth = solar_position(index, latitude=self.location.lat, longitude=self.location.lng)
+        elevation = np.radians(elevation)
+        am = air_mass(math.pi / 2 - elevation)
+
+        di = np.zeros(len(am))
+        up = am != -1
+        di[up] = self._directIntensity(self.elevation, am[up])
+
+        return pd.DataFrame(index=index, data={'solarElevation': elevation,
+                                               'solarAzimuth': np.radians(azimuth),
+                                               'airMass': am,
+                                               'directIntensity': di,
+                                               'globalIrradiance': self._globalIrradiance(di)})
+
+    def df(self, start, end, freq='h'):
         """
             Creates a dataframe with the insolation in W/m**2 in hourly resolution
 
             Parameters
             ----------
             start, end: datetime.datetime
+            freq: str (optional, default='h')
+                resolution of the dataframe
 
             Returns
             -------
             Pandas Dataframe
         """
 
-        hours = pd.date_range(start=start, end=end, freq='h')
-        gis = []
-        for hour in hours:
-            gis.append(self.globalIrradiance(hour))
+        hours = pd.date_range(start=start, end=end, freq=freq)
+        gis = self.frame(hours)['globalIrradiance'].values
 
         df = pd.DataFrame(gis, index=hours, columns = ['insolation'])
         return df.tz_localize('UTC')
@@ -186,24 +253,131 @@ class SolarInsolation(object):
                                         longitude=self.location.lng)
         return math.radians(deg)
 
+class Location(namedtuple('Location', ['lat', 'lng'])):
+    """
+        Latitude and longitude (in degrees) of a SolarInsolation
+    """
+
+    @property
+    def latlng(self):
+        return [self.lat, self.lng]
+
+
+def _location_cache_path():
+    return os.path.join(os.path.abspath(cfg.get('data', 'folder')), 'locations.json')
+
+
+def _cached_lookup(key, lookup, cache=True):
+    """
+        Return the value for key from the location cache, or else
+        call lookup() and add the result to the cache
+
+        Parameters
+        ----------
+        key: str
+        lookup: callable
+            returns a json-serializable value, or a list of them
+        cache: bool
+
+        Raises
+        ------
+        ValueError if the lookup returns None (or a list with None): geocoder
+        returns None when it fails, eg. offline or without API key.  The
+        result is not cached, so the next lookup tries again.
+    """
+    def checked_lookup():
+        value = lookup()
+        if value is None or (isinstance(value, list) and None in value):
+            raise ValueError("Lookup of {} failed: {}".format(key, value))
+        return value
+
+    if not cache:
+        return checked_lookup()
+
+    path = _location_cache_path()
+    if path not in _LOCATIONS:
+        locations = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                locations = json.load(f)
+        _LOCATIONS[path] = locations
+    locations = _LOCATIONS[path]
+
+    if key not in locations:
+        locations[key] = checked_lookup()
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # write to a temporary file first, so readers never see a half-written file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(locations, f, indent=1, sort_keys=True)
+        misc.replace_file(tmp_path, path)
+    return locations[key]
+
+
+def lookup_location(location, cache=True):
+    """
+        Look up the latitude, longitude and elevation of a location with geocoder
+
+        Parameters
+        ----------
+        location: String
+        cache: bool (optional, default=True)
+            use the location cache or not
+
+        Returns
+        -------
+        latitude, longitude, elevation: float
+    """
+    def lookup():
+        import geocoder
+        g = geocoder.google(location)
+        return [g.lat, g.lng, geocoder.google(g.latlng, method='Elevation').elevation]
+
+    return tuple(_cached_lookup('location:' + location, lookup, cache=cache))
+
+
+def lookup_elevation(latitude, longitude, cache=True):
+    """
+        Look up the elevation (in meters) of a point with geocoder
+
+        Parameters
+        ----------
+        latitude, longitude: float
+        cache: bool (optional, default=True)
+            use the location cache or not
+
+        Returns
+        -------
+        float
+    """
+    def lookup():
+        import geocoder
+        return geocoder.google([latitude, longitude], method='Elevation').elevation
+
+    return _cached_lookup('elevation:{},{}'.format(latitude, longitude), lookup, cache=cache)
+
+
 class PVModel(SolarInsolation):
     """
         Module that models a theoretically perfect PV installation,
         extending the Solar Insolation Model, but adding PV orientation and tilt.
     """
 
-    def __init__(self, location, orient=180, tilt=35):
+    def __init__(self, location=None, orient=180, tilt=35, **kwargs):
         """
             Parameters
             ----------
-            location: String
+            location: String, optional
             orient: number (optional, default=180 (south))
                 degrees (0-360)
             tilt: number (optional, default=35)
                 degrees
+            kwargs: latitude, longitude, elevation, cache
+                see SolarInsolation
         """
 
-        super(PVModel, self).__init__(location = location)
+        super(PVModel, self).__init__(location = location, **kwargs)
         self.orient = math.radians(orient)
         self.tilt = math.radians(tilt)
 
@@ -250,4 +424,131 @@ class PVModel(SolarInsolation):
         di = super(PVModel, self).directIntensity(datetime)
 
         #add the tilted and oriented direct intensity to the background irradiance
-        return self.directIntensity(datetime) + self._backgroundIrradiance(di)
\ No newline at end of file
+        return self.directIntensity(datetime) + self._backgroundIrradiance(di)
+
+    def frame(self, index):
+        """
+            Calculate the solar parameters for all timestamps at once,
+            directIntensity and globalIrradiance compensate for the PV orientation and tilt
+
+            Parameters
+            ----------
+            index: pandas.DatetimeIndex
+                timezone-naive timestamps are considered UTC
+
+            Returns
+            -------
+            Pandas Dataframe
+        """
+        frame = super(PVModel, self).frame(index)
+        di = frame['directIntensity'].values
+        a = frame['solarElevation'].values
+        b = self.tilt
+        c = self.orient
+        d = frame['solarAzimuth'].values
+
+        PVdi = di * (np.cos(a)*np.sin(b)*np.cos(c-d) + np.sin(a)*np.cos(b))
+
+        #PVdi cannot be negative
+        frame['directIntensity'] = np.maximum(0, PVdi)
+        frame['globalIrradiance'] = frame['directIntensity'] + self._backgroundIrradiance(di)
+        return frame
+
+
+def solar_position(index, latitude, longitude):
+    """
+        Calculate the elevation (corrected for atmospheric refraction) and
+        azimuth of the sun for all timestamps at once, with the NOAA
+        algorithm used by astral
+
+        Parameters
+        ----------
+        index: pandas.DatetimeIndex
+            timezone-naive timestamps are considered UTC
+        latitude, longitude: float
+            in degrees
+
+        Returns
+        -------
+        elevation, azimuth: numpy.ndarray
+            in degrees, azimuth from north (0 = north, 90 = east, ...)
+    """
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    ns = index.values.astype('datetime64[ns]').astype(np.int64)
+    latitude = min(max(latitude, -89.8), 89.8)
+
+    # julian century
+    t = (ns / float(NS_PER_DAY) + 2440587.5 - 2451545.0) / 36525.0
+
+    l0 = np.radians((280.46646 + t * (36000.76983 + 0.0003032 * t)) % 360.0)
+    m = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    omega = np.radians(125.04 - 1934.136 * t)
+
+    # declination
+    center = np.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t)) + \
+             np.sin(2 * m) * (0.019993 - 0.000101 * t) + np.sin(3 * m) * 0.000289
+    apparent_long = np.radians(np.degrees(l0) + center - 0.00569 - 0.00478 * np.sin(omega))
+    seconds = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    obliquity = np.radians(23.0 + (26.0 + (seconds / 60.0)) / 60.0 + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+
+    # equation of time, in minutes
+    y = np.tan(obliquity / 2.0) ** 2
+    eqtime = 4.0 * np.degrees(y * np.sin(2 * l0) - 2.0 * e * np.sin(m) + 4.0 * e * y * np.sin(m) * np.cos(2 * l0) -
+                              0.5 * y * y * np.sin(4 * l0) - 1.25 * e * e * np.sin(2 * m))
+
+    true_solar_time = (ns % NS_PER_DAY) / 60e9 + eqtime + 4.0 * longitude
+    hourangle = (true_solar_time / 4.0) % 360.0 - 180.0
+
+    lat = math.radians(latitude)
+    csz = np.clip(np.sin(lat) * np.sin(declination) +
+                  np.cos(lat) * np.cos(declination) * np.cos(np.radians(hourangle)), -1.0, 1.0)
+    zenith = np.arccos(csz)
+
+    az_denom = np.cos(lat) * np.sin(zenith)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        az = np.clip((np.sin(lat) * np.cos(zenith) - np.sin(declination)) / az_denom, -1.0, 1.0)
+    azimuth = 180.0 - np.degrees(np.arccos(az))
+    azimuth = np.where(hourangle > 0, -azimuth, azimuth)
+    azimuth = np.where(np.abs(az_denom) > 0.001, azimuth, 180.0 if latitude > 0 else 0.0)
+    azimuth = azimuth % 360.0
+
+    elevation = 90.0 - np.degrees(zenith)
+    return elevation + _refraction(elevation), azimuth
+
+
+def _refraction(elevation):
+    """
+        Atmospheric refraction correction (in degrees) of the solar elevation (in degrees)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        te = np.tan(np.radians(elevation))
+        correction = np.select(
+            [elevation > 85.0, elevation > 5.0, elevation > -0.575],
+            [0.0,
+             58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5,
+             1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))],
+            -20.774 / te)
+    return correction / 3600.0
+
+
+def air_mass(angleFromVertical):
+    """
+        Air mass for an array of angles, see SolarInsolation._airMass
+
+        Parameters
+        ----------
+        angleFromVertical: numpy.ndarray
+            in radians
+
+        Returns
+        -------
+        numpy.ndarray
+            -1 where the sun is below the horizon
+    """
+    with np.errstate(invalid='ignore'):
+        denom = np.cos(angleFromVertical) + 0.50572 * (96.07995 - angleFromVertical) ** -1.6364
+        return np.where(denom >= 0, 1 / denom, -1.)
\ No newline at end of file
@@ -100,6 +100,50 @@ class AnalysisTest(unittest.TestCase):
         result2 = anls.result.copy()
         self.assertFalse((result1==result2).all().all())
 
+    def test_daily_agg(self):
+        "daily_agg gives the same result as filtering on the time of day and resampling"
+        index = pd.date_range(start='20160320 00:51:15', freq='7min', periods=5000, tz='Europe/Brussels')
+        np.random.seed(0)
+        df = pd.DataFrame(index=index, data=np.random.rand(5000, 2), columns=['A', 'B'])
+        df.iloc[::13, 1] = np.nan
+
+        starttime, endtime = dt.time(hour=3, minute=34), dt.time(hour=22, minute=55)
+        df_filtered = df[(df.index.time >= starttime) & (df.index.time < endtime)]
+        for agg in ['min', 'max', 'mean', 'sum', 'count', 'std', 'median']:
+            expected = df_filtered.resample('D').agg(agg)
+            result = analysis.daily_agg(df, agg=agg, windows=[(starttime, endtime)])
+            self.assertTrue(result.index.equals(expected.index))
+            np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+
+        result = analysis.daily_agg(df, agg=0.9)
+        np.testing.assert_allclose(result.values, df.resample('D').quantile(0.9).values, rtol=1e-10)
+
+    def test_daily_agg_resample(self):
+        "Days without data and aggregations that are not vectorized give the same result as resample"
+        index = pd.date_range(start='20160320 00:51:15', freq='7min', periods=5000, tz='Europe/Brussels')
+        np.random.seed(0)
+        df = pd.DataFrame(index=index, data=np.random.rand(5000, 2), columns=['A', 'B'])
+        df = df[(df.index.day != 25) & (df.index.day != 26)]
+
+        for agg in ['sum', 'count', 'min', 'first', 'last', np.ptp]:
+            expected = df.resample('D').agg(agg)
+            result = analysis.daily_agg(df, agg=agg)
+            self.assertTrue(result.index.equals(expected.index))
+            np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+        self.assertEqual(analysis.DailyAgg(df, agg='sum').result.loc['20160325', 'A'], 0)
+
+    def test_daily_agg_multiple(self):
+        "Multiple windows and aggregations in a single call"
+        index = pd.date_range(start='20160101', freq='h', periods=72, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data={'A': np.arange(72.), 'B': np.zeros(72)})
+
+        windows = {'night': (dt.time(0), dt.time(5)), 'evening': (dt.time(18), dt.time(22))}
+        result = analysis.daily_agg(df, agg=['min', 'max', 0.5], windows=windows)
+        self.assertEqual(result.shape, (3, 12))
+        self.assertListEqual(result[('night', 'min', 'A')].tolist(), [0, 24, 48])
+        self.assertListEqual(result[('night', 'max', 'A')].tolist(), [4, 28, 52])
+        self.assertListEqual(result[('evening', 0.5, 'A')].tolist(), [19.5, 43.5, 67.5])
+        self.assertEqual(result.index.freqstr, 'D')
 
 
 if __name__ == '__main__':
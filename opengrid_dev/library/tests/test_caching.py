@@ -19,12 +19,15 @@ import numpy as np
 import pdb
 import pandas as pd
 import pytz
+import shutil
+import tempfile
+import time
 
 test_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 os.chdir(test_dir)
 # add the path to opengrid to sys.path
 sys.path.insert(1, os.path.join(test_dir, os.pardir, os.pardir, os.pardir))
-from opengrid_dev.library import caching
+from opengrid_dev.library import caching, analysis
 from opengrid_dev.library.houseprint import Sensor
 
 # Note: there is a opengrid.cfg in the test_dir which is loaded here!!
@@ -251,12 +254,361 @@ class CacheTest(unittest.TestCase):
 
 
 
+class PartitionedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ch = caching.Cache('elec_temp', folder=self.folder, storage='partitioned')
+        self.sensors = [Sensor(key=key, device=None, site='None', type=None, description=None, system=None,
+                               quantity=None, unit=None, direction=None, tariff=None, cumulative=None)
+                        for key in ['testsensor1', 'testsensor2']]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_init_raises(self):
+        """Raise NotImplementedError for an unknown storage engine"""
+        self.assertRaises(NotImplementedError, caching.Cache, 'elec_temp', folder=self.folder, storage='foo')
+
+    def test_update_writes_monthly_partitions(self):
+        """One file per month, containing all sensors"""
+        index = pd.date_range(start='20160125', freq='D', periods=10, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(10.), testsensor2=np.arange(10.)))
+        self.ch.update(df)
+
+        self.assertListEqual(self.ch.storage.partitions(), ['2016-01', '2016-02'])
+        self.assertListEqual(self.ch.storage.partitions(start='20160201'), ['2016-02'])
+        self.assertListEqual(self.ch.storage.partitions(end='20160131'), ['2016-01'])
+
+    def test_update_and_get(self):
+        """Update an existing cached sensor with new information"""
+        index = pd.date_range(start='20160101', freq='D', periods=3, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=[0, 1, 2], testsensor2=[0, 1, 2]))
+        self.ch.update(df)
+
+        index = pd.date_range(start='20160103', freq='D', periods=3, tz='Europe/Brussels')
+        df_new = pd.DataFrame(index=index, data=dict(testsensor2=[100, 200, 300]))
+        self.ch.update(df_new)
+
+        df_res = self.ch.get([self.sensors[1]])
+        self.assertListEqual(df_res.columns.tolist(), ['testsensor2'])
+        self.assertEqual(len(df_res), 5)
+        self.assertEqual(df_res.iloc[1, 0], 1)
+        self.assertEqual(df_res.iloc[2, 0], 100)
+        self.assertEqual(df_res.iloc[4, 0], 300)
+
+        # the other sensor is untouched
+        df_res = self.ch.get([self.sensors[0]])
+        self.assertEqual(len(df_res), 3)
+        self.assertEqual(df_res.iloc[2, 0], 2)
+
+    def test_get_multiple_with_period(self):
+        """Obtain a truncated dataframe, columns in the order of the sensors"""
+        index = pd.date_range(start='20160101', freq='D', periods=90, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(90.), testsensor2=np.arange(90.)))
+        self.ch.update(df)
+
+        df_res = self.ch.get(self.sensors[::-1], start='20160210', end='20160305')
+        self.assertListEqual(df_res.columns.tolist(), ['testsensor2', 'testsensor1'])
+        self.assertEqual(df_res.index[0], pd.Timestamp('20160210', tz='Europe/Brussels'))
+        self.assertEqual(df_res.index[-1], pd.Timestamp('20160305', tz='Europe/Brussels'))
+
+    def test_write_single_overwrites(self):
+        """Writing a sensor replaces its full history"""
+        index = pd.date_range(start='20160101', freq='D', periods=60, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(60.), testsensor2=np.arange(60.)))
+        self.ch.update(df)
+
+        self.ch._write_single(df['testsensor1'].iloc[:3])
+        self.assertEqual(len(self.ch.get([self.sensors[0]])), 3)
+        self.assertEqual(len(self.ch.get([self.sensors[1]])), 60)
+
+
+class CubeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.ch = caching.Cache('elec_temp', folder=self.folder, storage='cube')
+        self.sensors = [Sensor(key=key, device=None, site='None', type=None, description=None, system=None,
+                               quantity=None, unit=None, direction=None, tariff=None, cumulative=None)
+                        for key in ['testsensor1', 'testsensor2']]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_update_and_get(self):
+        """Update an existing cached sensor with new information"""
+        index = pd.date_range(start='20160101', freq='D', periods=3, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=[0, 1, 2], testsensor2=[0, 1, 2]))
+        self.ch.update(df)
+
+        index = pd.date_range(start='20160103', freq='D', periods=3, tz='Europe/Brussels')
+        df_new = pd.DataFrame(index=index, data=dict(testsensor2=[100, 200, 300]))
+        self.ch.update(df_new)
+
+        df_res = self.ch.get([self.sensors[1]])
+        self.assertListEqual(df_res.columns.tolist(), ['testsensor2'])
+        self.assertListEqual(df_res['testsensor2'].tolist(), [0, 1, 100, 200, 300])
+        self.assertEqual(df_res.index[0], pd.Timestamp('20160101', tz='Europe/Brussels'))
+
+        # the other sensor is untouched
+        df_res = self.ch.get([self.sensors[0]])
+        self.assertEqual(len(df_res), 3)
+        self.assertEqual(df_res.iloc[2, 0], 2)
+
+    def test_grow(self):
+        """Days before and after the stored ones, and many sensors, reallocate the array"""
+        index = pd.date_range(start='20160301', freq='D', periods=60, tz='Europe/Brussels')
+        self.ch.update(pd.DataFrame(index=index, data=dict(testsensor1=np.arange(60.))))
+
+        index = pd.date_range(start='20151201', freq='D', periods=600, tz='Europe/Brussels')
+        keys = ['sensor{}'.format(i) for i in range(100)]
+        self.ch.update(pd.DataFrame(index=index, data=np.ones((600, 100)), columns=keys))
+
+        df_res = self.ch.get(self.sensors + [Sensor(key='sensor99')])
+        self.assertListEqual(df_res.columns.tolist(), ['testsensor1', 'sensor99'])
+        self.assertEqual(len(df_res), 600)
+        self.assertEqual(df_res.loc[pd.Timestamp('20160302', tz='Europe/Brussels'), 'testsensor1'], 1.)
+        self.assertEqual(df_res['testsensor1'].count(), 60)
+        # a day in summer time is still at midnight
+        self.assertEqual(df_res.index[300].hour, 0)
+
+    def test_open_cube(self):
+        """The cube is a memory map that can be sliced without copying"""
+        index = pd.date_range(start='20160101', freq='D', periods=90, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(90.), testsensor2=np.arange(90.) * 2))
+        self.ch.update(df)
+
+        cube = self.ch.open_cube()
+        self.assertIsInstance(cube.data, np.memmap)
+        self.assertEqual(cube.data.shape, (90, 2))
+        self.assertEqual(cube.sensors, ['testsensor1', 'testsensor2'])
+        rows = cube.rows('20160210', '20160305')
+        np.testing.assert_array_equal(cube.data[rows, cube.column('testsensor2')], np.arange(40., 65.) * 2)
+
+        df_res = self.ch.get(self.sensors[::-1], start='20160210', end='20160305')
+        self.assertListEqual(df_res.columns.tolist(), ['testsensor2', 'testsensor1'])
+        self.assertEqual(len(df_res), 25)
+
+        self.assertRaises(NotImplementedError, caching.Cache('elec_temp', folder=self.folder).open_cube)
+
+    def test_write_single_overwrites(self):
+        """Writing a sensor replaces its full history"""
+        index = pd.date_range(start='20160101', freq='D', periods=60, tz='Europe/Brussels')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(60.), testsensor2=np.arange(60.)))
+        self.ch.update(df)
+
+        self.ch._write_single(df['testsensor1'].iloc[:3])
+        self.assertEqual(len(self.ch.get([self.sensors[0]])), 3)
+        self.assertEqual(len(self.ch.get([self.sensors[1]])), 60)
+
+
+class StorageEnginesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sensors = [Sensor(key=key) for key in ['testsensor1', 'testsensor2']]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_same_timestamps(self):
+        """All engines return the timestamps of the data, also for UTC midnight across a DST change"""
+        index = pd.date_range(start='20160315', freq='D', periods=20, tz='UTC')
+        df = pd.DataFrame(index=index, data=dict(testsensor1=np.arange(20.), testsensor2=np.arange(20.) * 2))
+        index = pd.date_range(start='20160401', freq='D', periods=5, tz='UTC')
+        df_new = pd.DataFrame(index=index, data=dict(testsensor2=np.arange(5.) + 100))
+
+        results = {}
+        for storage in ['pickle', 'partitioned', 'cube']:
+            ch = caching.Cache('elec_temp', folder=os.path.join(self.folder, storage), storage=storage)
+            ch.update(df)
+            ch.update(df_new)
+            results[storage] = [ch.get(self.sensors), ch.get(self.sensors[1:], start='20160320', end='20160402')]
+
+        expected = results['pickle'][0]
+        self.assertTrue(expected.index.equals(caching._to_local(df.index.union(df_new.index))))
+        self.assertEqual(expected.index[0].hour, 1)
+        self.assertEqual(expected.index[-1].hour, 2)
+        for storage in ['partitioned', 'cube']:
+            for df_res, df_expected in zip(results[storage], results['pickle']):
+                pd.testing.assert_frame_equal(df_res, df_expected, check_freq=False)
+
+class IncrementalCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sensor = Sensor(key='testsensor', device=None, site='None', type=None, description=None, system=None,
+                             quantity=None, unit=None, direction=None, tariff=None, cumulative=None)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _update_day_by_day(self, ch):
+        index = pd.date_range(start='20160101', freq='D', periods=3, tz='Europe/Brussels')
+        ch.update(pd.DataFrame(index=index, data=[0, 1, 2], columns=['testsensor']))
+        for i, day in enumerate(pd.date_range(start='20160103', freq='D', periods=3, tz='Europe/Brussels')):
+            ch.update(pd.Series(index=pd.DatetimeIndex([day], freq='D'), data=[100. * (i + 1)], name='testsensor'))
+
+    def _check_result(self, ch):
+        df_res = ch.get([self.sensor])
+        self.assertEqual(len(df_res), 5)
+        self.assertEqual(df_res.iloc[1, 0], 1)
+        self.assertEqual(df_res.iloc[2, 0], 100)
+        self.assertEqual(df_res.iloc[4, 0], 300)
+
+    def test_update_appends_to_log(self):
+        """Incremental updates are appended to a log and give the same result"""
+        ch = caching.Cache('elec_temp', folder=self.folder, incremental=True)
+        self._update_day_by_day(ch)
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'elec_temp_testsensor.pkl.log')))
+        self._check_result(ch)
+
+        # the log is merged by compacting, without changing the result
+        ch.compact()
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'elec_temp_testsensor.pkl.log')))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'elec_temp_testsensor.pkl')))
+        self._check_result(ch)
+
+    def test_log_is_compacted_automatically(self):
+        """A log larger than the stored file is compacted"""
+        ch = caching.Cache('elec_temp', folder=self.folder, incremental=True)
+        ch.storage.COMPACT_SIZE = 0
+        index = pd.date_range(start='20160101', freq='D', periods=3, tz='Europe/Brussels')
+        ch.update(pd.DataFrame(index=index, data=[0, 1, 2], columns=['testsensor']))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'elec_temp_testsensor.pkl')))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'elec_temp_testsensor.pkl.log')))
+
+    def test_partitioned(self):
+        """Incremental updates for the partitioned storage"""
+        ch = caching.Cache('elec_temp', folder=self.folder, storage='partitioned', incremental=True)
+        self._update_day_by_day(ch)
+        self.assertListEqual(ch.storage.partitions(), ['2016-01'])
+        self._check_result(ch)
+        ch.compact()
+        self.assertListEqual(os.listdir(os.path.join(self.folder, 'elec_temp')), ['2016-01.pkl'])
+        self._check_result(ch)
+
+
+class FakeHouseprint(object):
+    """Stand-in for a houseprint, returning 10 days of daily data for each sensor"""
+
+    def find_sensor(self, key):
+        return Sensor(key=key)
+
+    def get_data(self, sensors, head=None, tail=None):
+        index = pd.date_range(start='20160101', freq='D', periods=10, tz='Europe/Brussels')
+        return pd.DataFrame(index=index, data={sensor.key: np.arange(10.) for sensor in sensors})
+
+
+class MinuteHouseprint(object):
+    """Stand-in for a houseprint, returning minute data from 2016-01-01 until 2016-01-11"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_data(self, sensors, head=None, tail=None):
+        self.calls += 1
+        head = max(head, pd.Timestamp('20160101', tz='Europe/Brussels'))
+        tail = min(tail, pd.Timestamp('20160111', tz='Europe/Brussels'))
+        if head >= tail:
+            return pd.DataFrame()
+        index = pd.date_range(start=head, end=tail - pd.Timedelta(minutes=1), freq='min')
+        return pd.DataFrame(index=index, data={sensor.key: index.day.values for sensor in sensors})
+
+
+class DailyMin(analysis.Analysis):
+    def do_analysis(self):
+        if not self.df.empty:
+            self.result = self.df.resample('D').min()
+        else:
+            self.result = pd.DataFrame()
+
+
+class FailingAnalysis(analysis.Analysis):
+    """Fails for testsensor0, takes a second for the other sensors"""
+    def do_analysis(self):
+        if 'testsensor0' in self.df:
+            raise ValueError("analysis failed")
+        time.sleep(1)
+        self.result = self.df
+
+
+class CacheResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cfg_folder = caching.cfg.get('data', 'folder')
+        caching.cfg.set('data', 'folder', self.folder)
+        self.sensors = [Sensor(key='testsensor{}'.format(i)) for i in range(4)]
+
+    def tearDown(self):
+        caching.cfg.set('data', 'folder', self.cfg_folder)
+        shutil.rmtree(self.folder)
+
+    def _check_result(self):
+        df = caching.Cache('elec_temp').get(self.sensors)
+        self.assertListEqual(df.columns.tolist(), [sensor.key for sensor in self.sensors])
+        self.assertEqual(len(df), 10)
+        self.assertEqual(df.iloc[9, 3], 9)
+
+    def test_cache_results(self):
+        """Run an analysis for all sensors and cache the results"""
+        caching.cache_results(FakeHouseprint(), self.sensors, 'elec_temp', analysis.Analysis, chunk=False)
+        self._check_result()
+        # not incremental by default
+        self.assertFalse([f for f in os.listdir(os.path.join(self.folder, 'cache_day')) if f.endswith('.log')])
+
+    def test_cache_results_incremental(self):
+        """The results are appended to the cache if incremental is True"""
+        caching.cache_results(FakeHouseprint(), self.sensors, 'elec_temp', analysis.Analysis, chunk=False,
+                              incremental=True)
+        self._check_result()
+        self.assertTrue([f for f in os.listdir(os.path.join(self.folder, 'cache_day')) if f.endswith('.log')])
+
+    def test_cache_results_parallel(self):
+        """Run an analysis in worker processes and cache the results"""
+        caching.cache_results(FakeHouseprint(), self.sensors, 'elec_temp', analysis.Analysis, chunk=False,
+                              n_jobs=2)
+        self._check_result()
+
+    def test_cache_results_parallel_error(self):
+        """An error in a worker is raised without waiting for the other sensors"""
+        sensors = [Sensor(key='testsensor{}'.format(i)) for i in range(16)]
+        start = time.time()
+        self.assertRaises(ValueError, caching.cache_results, FakeHouseprint(), sensors, 'elec_temp',
+                          FailingAnalysis, chunk=False, n_jobs=2)
+        self.assertLess(time.time() - start, 4)
+
+        self.assertRaises(ValueError, caching.cache_results, FakeHouseprint(), self.sensors, 'elec_temp',
+                          analysis.Analysis, chunk=False, n_jobs=0)
+
+    def test_cache_results_blocks(self):
+        """Fetch and analyse blocks of days, limited by max_rows"""
+        index = pd.date_range(start='20160101', freq='D', periods=1, tz='Europe/Brussels')
+        caching.Cache('elec_temp').update(pd.DataFrame(index=index, data=[-1.], columns=['testsensor0']))
+
+        hp = MinuteHouseprint()
+        caching.cache_results(hp, self.sensors[:1], 'elec_temp', DailyMin, chunk=True, max_rows=1440 * 4)
+        df = caching.Cache('elec_temp').get(self.sensors[:1])
+        self.assertEqual(len(df), 10)
+        self.assertListEqual(df['testsensor0'].tolist(), list(range(1, 11)))
+
+        # blocks of 4 days since 2016-01-01
+        days = (pd.Timestamp.now(tz='Europe/Brussels') - pd.Timestamp('20160101', tz='Europe/Brussels')).days
+        self.assertEqual(hp.calls, days // 4 + 1)
+
+
 if __name__ == '__main__':
     
 
 
     suite1 = unittest.TestLoader().loadTestsFromTestCase(CacheTest)
-    alltests = unittest.TestSuite([suite1])
+    suite2 = unittest.TestLoader().loadTestsFromTestCase(PartitionedCacheTest)
+    suite3 = unittest.TestLoader().loadTestsFromTestCase(IncrementalCacheTest)
+    suite4 = unittest.TestLoader().loadTestsFromTestCase(CacheResultsTest)
+    suite5 = unittest.TestLoader().loadTestsFromTestCase(CubeCacheTest)
+    alltests = unittest.TestSuite([suite1, suite2, suite3, suite4, suite5])
     
     #selection = unittest.TestSuite()
     #selection.addTest(HouseprintTest('test_get_sensor'))
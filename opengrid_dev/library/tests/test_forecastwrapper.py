@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for fetching forecasts in forecastwrapper, with a local server
+in place of the Dark Sky API
+"""
+
+import datetime as dt
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+
+import numpy as np
+import pandas as pd
+import pytz
+from forecastio.models import Forecast
+
+from opengrid_dev.library import forecastwrapper
+
+TZ = 'Europe/Brussels'
+
+
+def forecast_json(date):
+    """Dark Sky response for a day with 24 hourly observations"""
+    midnight = pytz.timezone(TZ).localize(dt.datetime(date.year, date.month, date.day))
+    epoch = int((midnight - pd.Timestamp('1970-01-01', tz='UTC')).total_seconds())
+    hours = [{'time': epoch + 3600 * h, 'temperature': float(h), 'windSpeed': 2., 'windBearing': 180,
+              'solar': {'altitude': 10., 'dni': 100., 'ghi': 50., 'dhi': 20., 'etr': 1000., 'azimuth': 90.}}
+             for h in range(24)]
+    day = {'time': epoch, 'temperatureMax': 23., 'temperatureMin': 0.,
+           'sunriseTime': epoch + 8 * 3600, 'sunsetTime': epoch + 17 * 3600}
+    return {'latitude': 50.8, 'longitude': 4.4, 'timezone': TZ, 'offset': 1,
+            'currently': hours[12], 'hourly': {'data': hours}, 'daily': {'data': [day]}}
+
+
+def flatten_solar(j):
+    """The flattening of the solar fields of an hour, as before _forecasts_to_hour_frame"""
+    j = dict(j)
+    try:
+        solar = j.pop('solar')
+    except KeyError:
+        return j
+    j.update({forecastwrapper.SOLAR_NAMES[key]: val for key, val in solar.items()})
+    j.update({'SolarAzimuth': (j.get('SolarAzimuth') + 90) % 360})
+    return j
+
+
+def hour_frame_per_forecast(forecasts):
+    """A frame per forecast with a series per hour, as before _forecasts_to_hour_frame"""
+    frames = []
+    for forecast in forecasts:
+        frame = pd.concat([pd.Series(flatten_solar(hour.d)) for hour in forecast.hourly().data], axis=1).T
+        frame.temperature = frame.temperature.astype(float)
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """Answers forecast requests, the first request for every day fails when flaky is True"""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.flaky = False
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/forecast'.format(self.server_address[1])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        time = path.split('/')[-1].split(',')[2]
+        date = dt.datetime.strptime(time, '%Y-%m-%dT%H:%M:%S').date()
+        with self.server.lock:
+            first = date not in self.server.requests
+            self.server.requests.append(date)
+        if self.server.flaky and first:
+            self.send_response(503)
+            self.end_headers()
+            return
+        body = json.dumps(forecast_json(date)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WeatherFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        self.folder = tempfile.mkdtemp()
+        self.data_folder = forecastwrapper.cfg.get('data', 'folder')
+        forecastwrapper.cfg.set('data', 'folder', self.folder)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        forecastwrapper.cfg.set('data', 'folder', self.data_folder)
+        shutil.rmtree(self.folder)
+
+    def weather(self, **kwargs):
+        return forecastwrapper.Weather(location=(50.8, 4.4), start=dt.datetime(2017, 1, 1),
+                                       end=dt.datetime(2017, 1, 10), api_key='key', timezone=TZ,
+                                       url=self.server.url, **kwargs)
+
+    def test_concurrent(self):
+        """All days are fetched once, in order, and saved in the cache"""
+        weather = self.weather(n_jobs=4)
+        forecasts = weather.forecasts
+        self.assertEqual(len(forecasts), 10)
+        dates = list(pd.date_range('20170101', '20170110').date)
+        self.assertEqual(sorted(self.server.requests), dates)
+        self.assertEqual(weather._get_forecast_dates(), set(dates))
+        self.assertEqual([f.daily().data[0].d['time'] for f in forecasts],
+                         sorted(f.daily().data[0].d['time'] for f in forecasts))
+        self.assertEqual(len(os.listdir(weather.cache_folder)), 10)
+
+        # a second weather object only reads the cache
+        hours = self.weather(n_jobs=4).hours()
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(len(hours), 24 * 9 + 1)
+
+    def test_days(self):
+        """The two days before start are added, sequentially by default"""
+        frame = self.weather().days()
+        self.assertEqual(len(self.server.requests), 12)
+        self.assertEqual(frame.index[-1], pd.Timestamp('20170110', tz=TZ))
+
+    def test_tables(self):
+        """The flattened frames are cached in tables, the same as without cache"""
+        weather = self.weather(n_jobs=4)
+        hours, days = weather.hours(), weather.days()
+        self.assertEqual(sorted(os.listdir(os.path.join(weather.cache_folder, 'hours'))), ['2016-12.pkl', '2017-01.pkl'])
+
+        # the tables are read without the forecast pickles
+        for f in os.listdir(weather.cache_folder):
+            if f.endswith('.pkl'):
+                os.remove(os.path.join(weather.cache_folder, f))
+        weather = self.weather()
+        pd.testing.assert_frame_equal(weather.hours(), hours)
+        pd.testing.assert_frame_equal(weather.days(), days)
+        self.assertEqual(len(self.server.requests), 12)
+        self.assertEqual(weather._forecasts, [])
+
+        # a longer period only fetches the new dates
+        weather = forecastwrapper.Weather(location=(50.8, 4.4), start=dt.datetime(2017, 1, 1),
+                                          end=dt.datetime(2017, 1, 15), api_key='key', timezone=TZ,
+                                          url=self.server.url)
+        self.assertEqual(len(weather.hours()), 24 * 14 + 1)
+        self.assertEqual(len(self.server.requests), 17)
+
+        no_cache = self.weather(cache=False).days()
+        pd.testing.assert_frame_equal(days, no_cache, check_dtype=False)
+
+    def test_retries(self):
+        """Failed requests are retried, or raise an error"""
+        self.server.flaky = True
+        self.assertEqual(len(self.weather(n_jobs=4, retries=1, backoff=0, cache=False).forecasts), 10)
+        self.assertEqual(len(self.server.requests), 20)
+
+        from requests.exceptions import HTTPError
+        self.server.requests = []
+        self.assertRaises(HTTPError, lambda: self.weather(n_jobs=4, cache=False).forecasts)
+
+    def test_rate_limit(self):
+        """Requests are spread over time"""
+        start = dt.datetime.now()
+        self.weather(n_jobs=4, rate_limit=50, cache=False).forecasts
+        self.assertGreaterEqual((dt.datetime.now() - start).total_seconds(), 9 / 50.)
+
+
+class FlattenTest(unittest.TestCase):
+
+    def setUp(self):
+        jsons = [forecast_json(dt.date(2017, 1, day)) for day in range(1, 4)]
+        # no solar data during the night
+        for j in jsons:
+            for hour in j['hourly']['data'][:6] + j['hourly']['data'][20:]:
+                del hour['solar']
+        jsons[1]['hourly']['data'][12]['summary'] = 'Clear'
+        self.forecasts = [Forecast(j, None, {}) for j in jsons]
+        self.weather = forecastwrapper.Weather(location=(50.8, 4.4), start=dt.datetime(2017, 1, 1),
+                                               end=dt.datetime(2017, 1, 3), api_key='key', timezone=TZ)
+
+    def test_hour_frame(self):
+        """Same hourly data as with a frame per forecast"""
+        result = forecastwrapper.Weather._forecasts_to_hour_frame(self.forecasts)
+        expected = hour_frame_per_forecast(self.forecasts)
+        self.assertEqual(sorted(result.columns), sorted(expected.columns))
+        self.assertEqual(len(result), 72)
+        for column in expected.columns.drop('summary'):
+            np.testing.assert_allclose(result[column].values.astype(float), expected[column].values.astype(float))
+        self.assertEqual(result['summary'].count(), 1)
+        self.assertTrue(np.isnan(result['SolarAzimuth'][0]))
+        self.assertEqual(result['SolarAzimuth'][30], 180.)
+
+        # hours with only part of the solar fields
+        del self.forecasts[0].json['hourly']['data'][12]['solar']['azimuth']
+        result = forecastwrapper.Weather._forecasts_to_hour_frame(self.forecasts)
+        self.assertTrue(np.isnan(result['SolarAzimuth'][12]))
+        self.assertEqual(result['GlobalHorizontalIrradiance'][12], 50.)
+
+    def test_day_frame(self):
+        """Same daily data as with a series per forecast"""
+        result = forecastwrapper.Weather._forecasts_to_day_frame(self.forecasts)
+        expected = pd.concat([pd.Series(forecast.daily().data[0].d) for forecast in self.forecasts], axis=1).T
+        pd.testing.assert_frame_equal(result, expected.reset_index(drop=True), check_dtype=False)
+        self.assertTrue(forecastwrapper.Weather._forecasts_to_day_frame([]).empty)
+
+    def test_fix_index(self):
+        """The epochs are converted to local timestamps"""
+        frame = self.weather._fix_index(forecastwrapper.Weather._forecasts_to_hour_frame(self.forecasts))
+        self.assertEqual(frame.index[0], pd.Timestamp('2017-01-01 00:00', tz=TZ))
+        self.assertEqual(frame.index[-1], pd.Timestamp('2017-01-03 23:00', tz=TZ))
+        self.assertTrue((frame.index == pd.date_range('20170101', periods=72, freq='h', tz=TZ)).all())
+
+        # also for epochs in an object column, like in the frames built with a series per hour
+        frame = self.weather._fix_index(hour_frame_per_forecast(self.forecasts))
+        self.assertTrue((frame.index == pd.date_range('20170101', periods=72, freq='h', tz=TZ)).all())
+
+        frame = self.weather._fix_index(forecastwrapper.Weather._forecasts_to_day_frame(self.forecasts))
+        self.assertEqual(list(frame.index), list(pd.date_range('20170101', periods=3, freq='D', tz=TZ)))
+        self.assertEqual(frame['sunriseTime'][0], int(pd.Timestamp('2017-01-01 08:00', tz=TZ).timestamp()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -73,6 +73,8 @@ class MiscTest(unittest.TestCase):
         t = dt.time(2, 45, 23, tzinfo=pytz.timezone('Europe/Brussels'))
         self.assertEqual(time_to_timedelta(t).total_seconds(), 7200 + 45 * 60 + 23.0)
 
+        self.assertEqual(time_to_timedelta(dt.time.max), pd.Timedelta(days=1) - pd.Timedelta(microseconds=1))
+
     def test_split_by_day(self):
         index = pd.DatetimeIndex(start='20160101 03:51:15', freq='h', periods=80)
         df = pd.DataFrame(index=index, data=np.random.randn(80, 2), columns=['A', 'B'])
@@ -98,6 +100,53 @@ class MiscTest(unittest.TestCase):
         self.assertEqual(list_daily[1].index[0], pd.Timestamp('20160102 01:51:15'))
         self.assertEqual(list_daily[1].index[-1], pd.Timestamp('20160102 05:51:15'))
 
+    def test_split_by_day_array(self):
+        """Same values as split_by_day, in a (days, slots, sensors) array"""
+        index = pd.date_range(start='20160101 03:51:15', freq='h', periods=80)
+        df = pd.DataFrame(index=index, data=np.random.randn(80, 2), columns=['A', 'B'])
+
+        values, days, times = split_by_day_array(df, starttime=dt.time(1, 30), endtime=dt.time(6))
+        self.assertEqual(values.shape, (4, 5, 2))
+        self.assertTrue(days.equals(pd.date_range(start='20160101', freq='D', periods=4)))
+        self.assertEqual(times[0], pd.Timedelta(hours=1, minutes=30))
+        for day, df_day in zip(values, split_by_day(df, starttime=dt.time(1, 30), endtime=dt.time(6))):
+            np.testing.assert_array_equal(day[~np.isnan(day[:, 0])], df_day.values)
+        self.assertTrue(np.isnan(values[0, :2]).all())
+
+    def test_split_by_day_array_dst(self):
+        """Days with 23 or 25 hours have 24 hours of slots"""
+        index = pd.date_range(start='20161029', freq='15min', periods=96 * 3, tz='Europe/Brussels')
+        ts = pd.Series(index=index, data=np.arange(96 * 3.))
+
+        values, days, times = split_by_day_array(ts)
+        self.assertEqual(values.shape, (3, 96, 1))
+        self.assertEqual(days[1], pd.Timestamp('20161030', tz='Europe/Brussels'))
+        # the first of the repeated hour is kept
+        np.testing.assert_array_equal(values[1, 8:12, 0], [104, 105, 106, 107])
+        np.testing.assert_array_equal(values[1, 12:16, 0], [112, 113, 114, 115])
+        # the data ends an hour earlier on the last day
+        self.assertEqual(np.isnan(values[2]).sum(), 4)
+
+    def test_resample_interpolate(self):
+        """Same result as reindexing and interpolating with pandas"""
+        np.random.seed(0)
+        seconds = np.cumsum(np.random.randint(1, 300, size=1000))
+        index = pd.to_datetime(1458950000 + seconds, unit='s').tz_localize('UTC').tz_convert('Europe/Brussels')
+        ts = pd.Series(index=index, data=np.cumsum(np.random.rand(1000)), name='sensor')
+        ts.iloc[[0, 10, 11, 500, -1]] = np.nan
+
+        for rule in ['min', '15min', 'H', 'D']:
+            for diff in [False, True]:
+                newindex = ts.resample(rule).first().index
+                expected = ts.reindex(ts.index.union(newindex)).interpolate(method='time').reindex(newindex)
+                if diff:
+                    expected = expected.diff()
+
+                result = resample_interpolate(ts, rule, diff=diff)
+                self.assertTrue(result.index.equals(newindex))
+                self.assertEqual(result.name, 'sensor')
+                np.testing.assert_allclose(result.values, expected.values, rtol=1e-10)
+
     def test_unit_conversion_factor(self):
         cf = unit_conversion_factor('liter/minute', 'm**3/hour')
         np.testing.assert_array_almost_equal(cf, 1 / 1e3 * 60.)
@@ -138,6 +187,20 @@ class MiscTest(unittest.TestCase):
         self.assertEqual(cdd.tolist(), [0.0, 0.0, 1.5])
         self.assertEqual(cdd.name, 'cooling_degree_days_24')
 
+    def test_replace_file(self):
+        import tempfile
+        folder = tempfile.mkdtemp()
+        src, dst = os.path.join(folder, 'new'), os.path.join(folder, 'old')
+        for path, content in [(src, 'new'), (dst, 'old')]:
+            with open(path, 'w') as f:
+                f.write(content)
+        replace_file(src, dst)
+        self.assertEqual(os.listdir(folder), ['old'])
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'new')
+        os.remove(dst)
+        os.rmdir(folder)
+
 
 if __name__ == '__main__':
     # http://stackoverflow.com/questions/4005695/changing-order-of-unit-tests-in-python
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for the forward selection of regression.MVLinReg
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as fm
+
+from opengrid_dev.library import regression
+
+
+def make_df(n=40, n_exog=12, seed=0, noise=0.):
+    """y depends on x0, x1 and x2, the other variables are noise, x3 is (close to) a linear combination of x0 and x1"""
+    np.random.seed(seed)
+    df = pd.DataFrame(np.random.rand(n, n_exog) * 10, columns=['x{}'.format(i) for i in range(n_exog)],
+                      index=pd.date_range('20150101', periods=n, freq='MS'))
+    df['x3'] = df['x0'] + 2 * df['x1'] + noise * np.random.randn(n)
+    df['y'] = 5 + 3 * df['x0'] + 2 * df['x1'] + 0.5 * df['x2'] + np.random.randn(n)
+    return df
+
+
+def forward_selection_ols(df, endog, list_of_exog, p_max):
+    """The selection of MVLinReg with a statsmodels fit for every candidate"""
+    fits = [fm.ols(formula='{} ~ 1'.format(endog), data=df).fit()]
+    all_exog = list_of_exog[:]
+    while all_exog:
+        best_fit = fits[-1]
+        for x in all_exog:
+            fit = fm.ols(formula=fits[-1].model.formula + '+{}'.format(x), data=df).fit()
+            if fit.bic < best_fit.bic:
+                best_fit = fit
+        for par in best_fit.pvalues.where(best_fit.pvalues > p_max).dropna().index:
+            best_fit = fm.ols(formula=best_fit.model.formula.replace('+{}'.format(par), ''), data=df).fit()
+        if best_fit.model.formula in fits[-1].model.formula:
+            break
+        fits.append(best_fit)
+        all_exog.remove(x)
+    return [fit.model.formula for fit in fits]
+
+
+def cv_error_ols(df, formula, folds, clip=True):
+    """The cross-validation error with a statsmodels fit for every fold"""
+    errors = []
+    for fold in np.unique(folds):
+        fit = fm.ols(formula=formula, data=df[folds != fold]).fit()
+        predicted = fit.predict(df[folds == fold]).values
+        if clip:
+            predicted = np.maximum(predicted, 0)
+        errors.extend(predicted - df.loc[folds == fold, 'y'].values)
+    return np.mean(np.abs(errors))
+
+
+class ForwardSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_df()
+        self.exog = ['x{}'.format(i) for i in range(12)]
+
+    def test_fit(self):
+        """Same statistics as statsmodels"""
+        selection = regression._ForwardSelection(self.df, 'y', self.exog)
+        for exog in [[], ['x0'], ['x0', 'x2', 'x5']]:
+            expected = fm.ols(formula='y ~ 1' + ''.join('+' + x for x in exog), data=self.df).fit()
+            fit = selection.fit(exog)
+            np.testing.assert_allclose(fit['params'], expected.params.values)
+            np.testing.assert_allclose(fit['pvalues'], expected.pvalues.values)
+            self.assertAlmostEqual(fit['bic'], expected.bic)
+            self.assertAlmostEqual(fit['aic'], expected.aic)
+
+    def test_bic_of_additions(self):
+        """Same BIC as statsmodels, also with missing values and linear combinations"""
+        self.df.iloc[3, 4] = np.nan
+        selection = regression._ForwardSelection(self.df, 'y', self.exog)
+        bic = selection.bic_of_additions(['x0', 'x1'], self.exog)
+        for x, b in zip(self.exog, bic):
+            formula = 'y ~ 1+x0+x1' + ('' if x in ['x0', 'x1'] else '+' + x)
+            self.assertAlmostEqual(b, fm.ols(formula=formula, data=self.df).fit().bic, places=6)
+
+    def test_not_numeric(self):
+        """Categorical variables raise a clear error, booleans are numeric"""
+        self.df['x5'] = np.where(self.df['x5'] > 5, 'high', 'low')
+        self.df['x6'] = self.df['x6'].astype('category')
+        with self.assertRaises(ValueError) as cm:
+            regression._ForwardSelection(self.df, 'y', self.exog)
+        self.assertIn('x5, x6', str(cm.exception))
+        self.assertRaises(ValueError, regression.MVLinReg, self.df, 'y', list_of_exog=['x0', 'x5'])
+        self.df['x5'] = self.df['x5'] == 'high'
+        mv = regression.MVLinReg(self.df, 'y', list_of_exog=['x0', 'x1', 'x5'])
+        self.assertIn('x0', mv.fit.params)
+
+    def test_mvlinreg(self):
+        """The same models are selected as with a statsmodels fit per candidate"""
+        for seed in range(5):
+            df = make_df(seed=seed, noise=1.)
+            for p_max in [0.05, 0.5]:
+                mv = regression.MVLinReg(df, 'y', p_max=p_max)
+                expected = forward_selection_ols(df, 'y', self.exog, p_max)
+                self.assertEqual([fit.model.formula for fit in mv.list_of_fits], expected)
+        self.assertIn('x0', mv.fit.params)
+
+    def test_cv_error(self):
+        """Same cross-validation error as with a statsmodels fit per fold"""
+        self.df['y'] -= 60
+        selection = regression._ForwardSelection(self.df, 'y', self.exog)
+        loo = np.arange(len(self.df))
+        kfold = np.random.RandomState(0).permutation(len(self.df)) % 5
+        for exog in [[], ['x0'], ['x0', 'x2', 'x5']]:
+            formula = 'y ~ 1' + ''.join('+' + x for x in exog)
+            for folds in [None, kfold]:
+                for clip in [True, False]:
+                    expected = cv_error_ols(self.df, formula, loo if folds is None else folds, clip=clip)
+                    self.assertAlmostEqual(selection.cv_error(exog, folds=folds, clip=clip), expected)
+
+    def test_mvlinreg_cross_validation(self):
+        """Cross-validation also works for more than 15 rows, with each kind of folds"""
+        df = make_df(noise=1.)
+        exog = ['x0', 'x1', 'x2', 'x4']
+        folds = {'loo': np.arange(len(df)), 'kfold': np.random.RandomState(0).permutation(len(df)) % 5,
+                 'blocked': np.arange(len(df)) * 5 // len(df)}
+        for cross_validation in ['loo', 'kfold', 'blocked']:
+            mv = regression.MVLinReg(df, 'y', list_of_exog=exog, cross_validation=cross_validation)
+            self.assertIn('x0', mv.fit.params)
+            self.assertEqual(len(mv.list_of_fits), len(mv.list_of_cverrors))
+            for fit, cverror in zip(mv.list_of_fits, mv.list_of_cverrors):
+                self.assertAlmostEqual(cverror, cv_error_ols(df, fit.model.formula, folds[cross_validation]))
+
+
+    def test_cross_validation_selection(self):
+        """The selection does not depend on the order of the candidates"""
+        df = make_df(noise=1.)
+        for exog in [['x0', 'x1', 'x2'], ['x2', 'x1', 'x0']]:
+            mv = regression.MVLinReg(df, 'y', list_of_exog=exog, cross_validation='loo')
+            self.assertEqual(mv.fit.model.formula, 'y ~ 1+x0+x1+x2')
+
+    def test_cross_validation_missing_values(self):
+        """A candidate with missing values is not selected because it is scored on fewer rows"""
+        df = make_df(noise=1.)
+        df['x12'] = df['y']
+        df.iloc[5, df.columns.get_loc('x12')] = np.nan
+        selection = regression._ForwardSelection(df, 'y', ['x0', 'x12'])
+        self.assertTrue(np.isnan(selection.cv_error(['x12'])))
+        self.assertTrue(np.isnan(selection.cv_error(['x0', 'x12'])))
+        mv = regression.MVLinReg(df, 'y', list_of_exog=['x0', 'x1', 'x12'], cross_validation='loo')
+        self.assertEqual(mv.fit.model.formula, 'y ~ 1+x0+x1')
+
+class FitModelsTest(unittest.TestCase):
+
+    def setUp(self):
+        df = make_df(n=3 * 365, n_exog=4, noise=1.)
+        df.index = pd.date_range('20150101', periods=len(df), freq='D')
+        self.exog = df[['x0', 'x1', 'x2', 'x3']]
+        self.df = pd.DataFrame({'sensor1': df['y'], 'sensor2': 2 * df['y'] + 3 * df['x3'],
+                                'sensor3': df['y'].where(df.index < '20150201')})
+        self.df.loc['20150301':'20150401', 'sensor2'] = np.nan
+
+    def test_fit_models(self):
+        """Same models as MVLinReg per sensor, in parallel or not"""
+        summary = regression.fit_models(self.df, self.exog, rule='MS', end='20161231', min_nobs=3, p_max=0.1)
+        self.assertEqual(list(summary.index), ['sensor1', 'sensor2', 'sensor3'])
+        self.assertEqual(summary.loc['sensor3', 'nobs'], 1)
+        self.assertTrue(np.isnan(summary.loc['sensor3', 'rsquared']))
+
+        data = pd.concat([self.df['sensor2'].rename('consumption'), self.exog], axis=1).dropna()
+        mv = regression.MVLinReg(data.resample('MS').sum().loc[:'20161231'], 'consumption', p_max=0.1)
+        self.assertEqual(summary.loc['sensor2', 'nobs'], 24)
+        self.assertEqual(summary.loc['sensor2', 'variables'], '+'.join(mv.fit.params.index[1:]))
+        self.assertAlmostEqual(summary.loc['sensor2', 'rsquared'], mv.fit.rsquared)
+        for x, coefficient in mv.fit.params.items():
+            self.assertAlmostEqual(summary.loc['sensor2', x], coefficient)
+
+        parallel = regression.fit_models(self.df, self.exog, rule='MS', end='20161231', min_nobs=3, p_max=0.1,
+                                         n_jobs=2)
+        pd.testing.assert_frame_equal(parallel, summary)
+
+    def test_no_models(self):
+        """The summary has all columns when no sensor has enough data, or there are no sensors"""
+        columns = ['nobs', 'variables', 'rsquared', 'rsquared_adj', 'bic', 'cverror']
+        summary = regression.fit_models(self.df, self.exog, rule='MS', min_nobs=100)
+        self.assertEqual(list(summary.columns), columns)
+        self.assertEqual(list(summary.index), ['sensor1', 'sensor2', 'sensor3'])
+        self.assertEqual(summary['rsquared'].count(), 0)
+        self.assertEqual(summary.loc['sensor1', 'nobs'], 36)
+
+        summary = regression.fit_models(pd.DataFrame(), self.exog, rule='MS', n_jobs=2)
+        self.assertEqual(list(summary.columns), columns)
+        self.assertEqual(len(summary), 0)
+
+    def test_parallel_error(self):
+        """An error in a worker is raised"""
+        self.assertRaises(KeyError, regression.fit_models, self.df, self.exog, rule='MS', n_jobs=2,
+                          list_of_exog=['unknown'])
+        self.assertRaises(ValueError, regression.fit_models, self.df, self.exog, n_jobs=0)
+
+    def test_cverror(self):
+        """The cverror is that of the selection, or leave-one-out of the selected model"""
+        summary = regression.fit_models(self.df[['sensor1']], self.exog, rule='W', cross_validation='blocked')
+        data = pd.concat([self.df['sensor1'].rename('consumption'), self.exog], axis=1).resample('W').sum()
+        mv = regression.MVLinReg(data, 'consumption', cross_validation='blocked')
+        self.assertAlmostEqual(summary.loc['sensor1', 'cverror'], mv.list_of_cverrors[-1])
+
+        summary = regression.fit_models(self.df[['sensor1']], self.exog, rule='W')
+        formula = 'consumption ~ 1' + ''.join('+' + x for x in summary.loc['sensor1', 'variables'].split('+'))
+        self.assertAlmostEqual(summary.loc['sensor1', 'cverror'],
+                               cv_error_ols(data.rename(columns={'consumption': 'y'}), formula.replace('consumption', 'y'),
+                                            np.arange(len(data))))
+
+
+def breakpoint_sse_loop(x, y, breakpoint):
+    """The sum of squared errors of the baseload and regression line of LinearRegression2"""
+    try:
+        lr = regression.LinearRegression2(x, y, breakpoint=breakpoint)
+    except ValueError:
+        return np.inf
+    below = lr.df.independent <= breakpoint
+    if not below.any() or (~below).sum() < 3:
+        return np.inf
+    above = lr.df[~below]
+    return (np.sum((lr.df.dependent[below] - lr.base_load) ** 2) +
+            np.sum((above.dependent - lr.slope * above.independent - lr.intercept) ** 2))
+
+
+class LinearRegressionBreakpointTest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        x = np.round(np.random.rand(60) * 20, 1)
+        y = 100 + 10 * np.maximum(x - 8, 0) + np.random.randn(60) * 5
+        index = pd.date_range('20150101', periods=60, freq='D')
+        self.x, self.y = pd.Series(x, index=index), pd.Series(y, index=index)
+
+    def test_sse(self):
+        """Same sum of squared errors as LinearRegression2, for each breakpoint"""
+        breakpoints = np.arange(-1, 21, 0.5)
+        lr = regression.LinearRegressionBreakpoint(self.x, self.y, breakpoints=breakpoints)
+        np.testing.assert_allclose(lr.sse, [breakpoint_sse_loop(self.x, self.y, b) for b in breakpoints])
+
+        lr = regression.LinearRegressionBreakpoint(self.x, self.y)
+        self.assertEqual(len(lr.breakpoints), len(np.unique(self.x)) - 1)
+        np.testing.assert_allclose(lr.sse, [breakpoint_sse_loop(self.x, self.y, b) for b in lr.breakpoints])
+
+    def test_breakpoint(self):
+        """The analysis is that of LinearRegression2 with the best breakpoint"""
+        lr = regression.LinearRegressionBreakpoint(self.x, self.y)
+        self.assertTrue(7 < lr.breakpoint < 9)
+        expected = regression.LinearRegression2(self.x, self.y, breakpoint=lr.breakpoint)
+        for attribute in ['slope', 'intercept', 'base_load', 'intersect', 'rsquared']:
+            self.assertAlmostEqual(getattr(lr, attribute), getattr(expected, attribute))
+        self.assertAlmostEqual(lr.score_total(max_spacing=20, expected_observations=50),
+                               expected.score_total(max_spacing=20, expected_observations=50))
+
+        self.assertRaises(ValueError, regression.LinearRegressionBreakpoint, self.x, -self.y)
+
+
+class LinearRegression3Test(unittest.TestCase):
+
+    def test_regression_data(self):
+        """The points past the breakpoint are dropped up to the first one not close to the base load"""
+        index = pd.date_range('20150101', periods=10, freq='D')
+        x = pd.Series([1, 2, 3, 4, 5, 5, 6, 7, 8, 9], index=index)
+        y = pd.Series([10, 10, 10, 10.5, 10.8, 12, 10.5, 14, 16, 18], index=index)
+        lr = regression.LinearRegression3(x, y, breakpoint=3, percentage=0.1)
+        self.assertEqual(list(lr._calculate_regression_data().independent), [5, 5, 6, 7, 8, 9])
+        lr = regression.LinearRegression3(x, y, breakpoint=3, percentage=0.1, include_end_of_base_load=False)
+        self.assertEqual(list(lr._calculate_regression_data().independent), [5, 6, 7, 8, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
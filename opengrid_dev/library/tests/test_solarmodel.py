@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Unit test for the vectorized solar position and irradiance in solarmodel
+"""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from opengrid_dev.library import solarmodel
+from opengrid_dev.library.solarmodel import SolarInsolation, PVModel
+
+
+class SolarPositionTest(unittest.TestCase):
+
+    def test_solar_position(self):
+        """Same elevation and azimuth as astral"""
+        index = pd.DatetimeIndex(['2016-06-21 12:00', '2016-12-21 08:30', '2016-03-20 18:00'])
+        elevation, azimuth = solarmodel.solar_position(index, latitude=50.8, longitude=4.4)
+        np.testing.assert_allclose(elevation, [62.4728, 4.8922, -1.2388], atol=1e-4)
+        np.testing.assert_allclose(azimuth, [187.8117, 137.1174, 272.1478], atol=1e-4)
+
+        # timezone-aware timestamps give the same position
+        local = index.tz_localize('UTC').tz_convert('Europe/Brussels')
+        np.testing.assert_allclose(solarmodel.solar_position(local, latitude=50.8, longitude=4.4)[0], elevation)
+
+    def test_air_mass(self):
+        """Same air mass as the scalar formula"""
+        angles = np.linspace(0, math.pi, 25)
+        expected = [SolarInsolation._airMass(None, angle) for angle in angles]
+        np.testing.assert_allclose(solarmodel.air_mass(angles), expected)
+
+
+class SolarModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.data_folder = solarmodel.cfg.get('data', 'folder')
+        solarmodel.cfg.set('data', 'folder', self.folder)
+        solarmodel._LOCATIONS.clear()
+
+    def tearDown(self):
+        solarmodel.cfg.set('data', 'folder', self.data_folder)
+        solarmodel._LOCATIONS.clear()
+        shutil.rmtree(self.folder)
+
+    def test_latitude_longitude(self):
+        """A model with latitude, longitude and elevation needs no lookup"""
+        model = PVModel(latitude=50.8, longitude=4.4, elevation=50, orient=180, tilt=35)
+        self.assertEqual(model.location.latlng, [50.8, 4.4])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'locations.json')))
+
+        frame = model.frame(pd.date_range('20160621', periods=24, freq='h'))
+        self.assertEqual(list(frame.columns), ['solarElevation', 'solarAzimuth', 'airMass',
+                                               'directIntensity', 'globalIrradiance'])
+        # dark at night, the sun in the south at noon
+        self.assertEqual(frame['globalIrradiance'].iloc[0], 0)
+        self.assertAlmostEqual(np.degrees(frame['solarAzimuth'].iloc[12]), 187.8, places=1)
+        self.assertGreater(frame['globalIrradiance'].iloc[12], 800)
+
+        df = model.df(start='20160621', end='20160622')
+        np.testing.assert_allclose(df['insolation'].values[:24], frame['globalIrradiance'].values)
+
+    def test_location_cache(self):
+        """Locations are read from the location cache"""
+        with open(os.path.join(self.folder, 'locations.json'), 'w') as f:
+            json.dump({'location:Brussels': [50.85, 4.35, 60.], 'elevation:50.8,4.4': 50.}, f)
+        model = SolarInsolation('Brussels')
+        self.assertEqual((model.location.lat, model.location.lng, model.elevation), (50.85, 4.35, 60.))
+        self.assertEqual(SolarInsolation(latitude=50.8, longitude=4.4).elevation, 50.)
+        self.assertEqual(PVModel('Brussels', elevation=0).elevation, 0)
+        self.assertRaises(ValueError, SolarInsolation)
+
+    def test_lookup(self):
+        """Lookups are added to the location cache"""
+        self.assertEqual(solarmodel._cached_lookup('location:Gent', lambda: [51.05, 3.72, 10.]), [51.05, 3.72, 10.])
+        self.assertEqual(solarmodel._cached_lookup('location:Gent', lambda: None), [51.05, 3.72, 10.])
+        solarmodel._LOCATIONS.clear()
+        self.assertEqual(solarmodel.lookup_location('Gent'), (51.05, 3.72, 10.))
+
+    def test_lookup_failed(self):
+        """Failed lookups raise an error and are not cached"""
+        self.assertRaises(ValueError, solarmodel._cached_lookup, 'location:Gent', lambda: [None, None, None])
+        self.assertRaises(ValueError, solarmodel._cached_lookup, 'elevation:51.05,3.72', lambda: None)
+        self.assertRaises(ValueError, solarmodel._cached_lookup, 'location:Gent', lambda: [51.05, 3.72, None],
+                          cache=False)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'locations.json')))
+        self.assertEqual(solarmodel._cached_lookup('location:Gent', lambda: [51.05, 3.72, 10.]), [51.05, 3.72, 10.])
+
+
+if __name__ == '__main__':
+    unittest.main()
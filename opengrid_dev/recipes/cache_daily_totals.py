@@ -27,8 +27,9 @@ except Exception as e:
 hp.init_tmpo()
 
 # Get the cache objects for gas, elec and water, and update them, sensor by sensor
+# The caches are updated incrementally: new days are appended without rewriting the full history
 for sensortype in ['gas', 'electricity', 'water']:
-    cache = caching.Cache(variable=sensortype + '_daily_total')
+    cache = caching.Cache(variable=sensortype + '_daily_total', incremental=True)
     sensors = hp.get_sensors(sensortype=sensortype)
     df_cached = cache.get(sensors=sensors)
 
@@ -44,19 +45,20 @@ for sensortype in ['gas', 'electricity', 'water']:
         except:
             last_ts = pd.Timestamp('1970-01-01', tz='Europe/Brussels')
 
-        # Only get data until the end of the last day
-        # Chunk the data retrieval and caching to avoid memory overflow
-        end_ts = pd.Timestamp(pd.Timestamp('now', tz='Europe/Brussels'))
-        months = pd.DatetimeIndex(start=last_ts, end=end_ts, freq='M').tolist()
-        months.insert(0, last_ts - pd.Timedelta(days=2))
-        months.append(end_ts)
-        for start, end in zip(months[:-1], months[1:]):
-            df = sensor.get_data(head=start - pd.Timedelta(days=1),
-                                 tail=end,
-                                 resample='day',
-                                 diff=False,
-                                 tz='Europe/Brussels')
-            df = df.diff().shift(-1).dropna()
+        # Stream the data month by month to avoid memory overflow.
+        # The last daily value of each chunk is carried over to compute the first total of the next one.
+        end_ts = pd.Timestamp('now', tz='Europe/Brussels')
+        previous = None
+        for ts in sensor.get_data_chunked(head=last_ts - pd.Timedelta(days=2),
+                                          tail=end_ts,
+                                          freq='MS',
+                                          resample='day',
+                                          diff=False,
+                                          tz='Europe/Brussels'):
+            if previous is not None:
+                ts = pd.concat([previous, ts])
+            previous = ts.iloc[-1:]
+            df = ts.diff().shift(-1).dropna()
             if not len(df) == 0:
                 cache.update(df)
 
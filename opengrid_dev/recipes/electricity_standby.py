@@ -64,10 +64,10 @@ hp.init_tmpo()
 starttime = dt.time(0, tzinfo=BXL)
 endtime = dt.time(5, tzinfo=BXL)
 caching.cache_results(hp=hp, sensors=sensors, resultname='elec_min_night_0-5', AnalysisClass=DailyAgg,  
-                      agg='min', chunk=False, starttime=starttime, endtime=endtime)
+                      agg='min', chunk=False, starttime=starttime, endtime=endtime, incremental=True)
 
 caching.cache_results(hp=hp, sensors=sensors, resultname='elec_max_night_0-5', AnalysisClass=DailyAgg, 
-                      agg='max', chunk=False, starttime=starttime, endtime=endtime)
+                      agg='max', chunk=False, starttime=starttime, endtime=endtime, incremental=True)
 
 
 # In[ ]:
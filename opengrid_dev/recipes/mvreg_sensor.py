@@ -3,11 +3,16 @@
 Script for generating a multivariable regression model for a single sensor.
 The script will fetch the data, build a model and make graphs.
 
+With 'all' instead of a sensorid, a monthly model is built for every gas, electricity
+and water sensor.  The weather and the daily totals are loaded once, the models are
+fitted in parallel and a summary table is written to the data folder.
+
 Created on 26/03/2017 by Roel De Coninck
 
 """
 
 import sys, os
+import multiprocessing
 import matplotlib
 matplotlib.use('Agg')
 
@@ -21,8 +26,7 @@ plt.style.use('ggplot')
 plt.rcParams['figure.figsize'] = 10,5
 
 
-def compute(sensorid, start_model, end_model):
-    end = pd.Timestamp('now', tz='Europe/Brussels')
+def load_houseprint():
     # Create houseprint from saved file, if not available, parse the google spreadsheet
     try:
         hp_filename = os.path.join(c.get('data', 'folder'), 'hp_anonymous.pkl')
@@ -32,16 +36,12 @@ def compute(sensorid, start_model, end_model):
         print(e)
         print("Because of this error we try to build the houseprint from source")
         hp = houseprint.Houseprint()
-    hp.init_tmpo()
+    return hp
 
-    # Load the cached daily data
-    sensor = hp.find_sensor(sensorid)
-    cache = caching.Cache(variable='{}_daily_total'.format(sensor.type))
-    df_day = cache.get(sensors=[sensor])
-    df_day.rename(columns={sensorid: sensor.type}, inplace=True)
 
+def load_weather(start, end):
     # Load the cached weather data, clean up and compose a combined dataframe
-    weather = forecastwrapper.Weather(location=(50.8024, 4.3407), start=start_model, end=end)
+    weather = forecastwrapper.Weather(location=(50.8024, 4.3407), start=start, end=end)
     irradiances = [
         (0, 90),  # north vertical
         (90, 90),  # east vertical
@@ -61,6 +61,21 @@ def compute(sensorid, start_model, end_model):
         weather_data[d] = 0
         weather_data.loc[weather_data.index.weekday == i, d] = 1
     weather_data = weather_data.applymap(float)
+    return weather_data
+
+
+def compute(sensorid, start_model, end_model):
+    end = pd.Timestamp('now', tz='Europe/Brussels')
+    hp = load_houseprint()
+    hp.init_tmpo()
+
+    # Load the cached daily data
+    sensor = hp.find_sensor(sensorid)
+    cache = caching.Cache(variable='{}_daily_total'.format(sensor.type))
+    df_day = cache.get(sensors=[sensor])
+    df_day.rename(columns={sensorid: sensor.type}, inplace=True)
+
+    weather_data = load_weather(start_model, end)
 
     data = pd.concat([df_day, weather_data], axis=1).dropna()
     data = data.tz_convert('Europe/Brussels')
@@ -91,6 +106,30 @@ def compute(sensorid, start_model, end_model):
             dpi=100)
 
 
+def compute_all(start_model, end_model, sensortypes=('gas', 'electricity', 'water'), n_jobs=None):
+    """
+    Build a monthly model for all sensors of the given types and save a summary per type
+    """
+    end = pd.Timestamp('now', tz='Europe/Brussels')
+    hp = load_houseprint()
+    weather_data = load_weather(start_model, end).tz_convert('Europe/Brussels')
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+
+    for sensortype in sensortypes:
+        # Load the cached daily data of all sensors at once
+        cache = caching.Cache(variable='{}_daily_total'.format(sensortype))
+        df_day = cache.get(sensors=hp.get_sensors(sensortype=sensortype))
+        if not df_day.empty:
+            df_day = df_day.tz_convert('Europe/Brussels')
+
+        summary = regression.fit_models(df_day, weather_data, endog=sensortype, rule='MS', end=end_model,
+                                        n_jobs=n_jobs, p_max=0.03)
+        filename = os.path.join(c.get('data', 'folder'), 'multivar_summary_{}.csv'.format(sensortype))
+        summary.to_csv(filename)
+        print("{} models for {} sensors saved in {}".format(summary['rsquared'].count(), sensortype, filename))
+
+
 if __name__ == '__main__':
 
 
@@ -98,7 +137,7 @@ if __name__ == '__main__':
         print("""
         Use of this script: python mreg_sensors.py sensorid from till
 
-        sensorid: (string) sensortoken
+        sensorid: (string) sensortoken, or all for a monthly model of all sensors
         from: (string) starting date for the identification data of the model
         till: (string) end date for the identification data of the model
         """)
@@ -110,6 +149,9 @@ if __name__ == '__main__':
     start_model = pd.Timestamp(sys.argv[2], tz='Europe/Brussels')
     end_model = pd.Timestamp(sys.argv[3], tz='Europe/Brussels') #last day of the data period for the model
 
-    compute(sensorid, start_model, end_model)
+    if sensorid == 'all':
+        compute_all(start_model, end_model)
+    else:
+        compute(sensorid, start_model, end_model)
 
 
@@ -6,6 +6,7 @@ Created on 16/12/2014 by Roel De Coninck
 """
 
 import os
+import time
 from opengrid_dev.library import houseprint
 from opengrid_dev import config
 
@@ -18,4 +19,7 @@ filename = os.path.join(c.get('data', 'folder'), 'hp_anonymous.pkl')
 hp.save(filename)
 
 hp.init_tmpo()
-hp.sync_tmpos()
+start = time.time()
+report = hp.sync_tmpos(n_jobs=8)
+print("Synced {} sensors in {:.0f} s, slowest sensors:".format(len(report), time.time() - start))
+print(report.sort_values('seconds', ascending=False).head())